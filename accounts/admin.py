@@ -1,3 +1,12 @@
 from django.contrib import admin
+from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 
-# Register your models here.
+from core.pagination import EstimatedCountPaginator
+from .models import User
+
+
+@admin.register(User)
+class UserAdmin(BaseUserAdmin):
+    # search_fields (inherited) also serve the order admin's user autocomplete.
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
@@ -2,8 +2,11 @@ from django.views.generic.edit import UpdateView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse_lazy
 from django.contrib.auth import get_user_model
+from orders.models import Order
 from .forms import CustomUserChangeForm
 
+RECENT_ORDERS = 5
+
 class ProfileView(LoginRequiredMixin, UpdateView):
     model = get_user_model()
     form_class = CustomUserChangeForm
@@ -13,6 +16,13 @@ class ProfileView(LoginRequiredMixin, UpdateView):
     def get_object(self):
         return self.request.user
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['recent_orders'] = (
+            Order.objects.filter(user=self.request.user).with_totals().order_by('-created_at', '-id')[:RECENT_ORDERS]
+        )
+        return context
+
     def form_valid(self, form):
         response = super().form_valid(form)
         self.request.user.refresh_from_db()  # Ensure updated user data is reflected
@@ -0,0 +1,17 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import Task
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'priority', 'attempts', 'run_at', 'created_at')
+    list_filter = ('status', 'name')
+    readonly_fields = ('created_at',)
+    actions = ['retry']
+
+    @admin.action(description="Retry selected tasks now")
+    def retry(self, request, queryset):
+        updated = queryset.update(status=Task.QUEUED, attempts=0, run_at=timezone.now())
+        self.message_user(request, f"Queued {updated} task(s).")
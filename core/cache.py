@@ -0,0 +1,244 @@
+"""Shared caching helpers built on Django's cache framework.
+
+``get_or_compute`` adds three things on top of ``cache.get``/``cache.set``:
+
+* Stampede protection. Only one caller (across threads, processes and
+  nodes when a shared backend is configured) recomputes a missing value;
+  the others wait briefly for it instead of all hitting the database.
+* Early probabilistic expiry ("XFetch"). As an entry nears its expiry a
+  caller occasionally refreshes it ahead of time, weighted by how long the
+  value took to compute, so hot keys are rebuilt before they expire rather
+  than after.
+* Tag invalidation. Entries remember the versions of the tags they were
+  stored with; ``invalidate_tags`` bumps those versions from model signals
+  and every dependent entry becomes a miss.
+
+Hit/miss counts are recorded in ``core.metrics`` under ``cache.*``.
+"""
+import asyncio
+import functools
+import math
+import random
+import time
+
+from django.core.cache import cache as default_cache
+
+from . import metrics
+
+KEY_PREFIX = 'cc'
+LOCK_TIMEOUT = 10
+WAIT_INTERVAL = 0.05
+
+
+def _now_ms():
+    return time.time_ns() // 1_000_000
+
+
+def _tag_key(tag):
+    return f'{KEY_PREFIX}:tag:{tag}'
+
+
+def tag_versions(tags, cache=default_cache):
+    """Return ``{tag: version}``, initialising unknown tags.
+
+    Versions are millisecond timestamps of the last invalidation, so a tag
+    that was evicted never comes back with a version an older entry used,
+    and callers can use them as ``Last-Modified`` values.
+    """
+    tags = list(tags)
+    if not tags:
+        return {}
+    keys = {_tag_key(tag): tag for tag in tags}
+    found = cache.get_many(keys.keys())
+    missing = {key: _now_ms() for key in keys if key not in found}
+    if missing:
+        for key, version in missing.items():
+            cache.add(key, version, None)
+        found.update(cache.get_many(missing.keys()))
+        found.update({key: version for key, version in missing.items() if key not in found})
+    return {tag: found[key] for key, tag in keys.items()}
+
+
+def tag_version(tag, cache=default_cache):
+    return tag_versions([tag], cache=cache)[tag]
+
+
+def invalidate_tags(*tags, cache=default_cache):
+    """Make every entry stored under any of ``tags`` stale."""
+    if not tags:
+        return
+    current = tag_versions(tags, cache=cache)
+    now = _now_ms()
+    cache.set_many({_tag_key(tag): max(now, version + 1) for tag, version in current.items()}, None)
+    metrics.incr('cache.invalidations', len(tags))
+
+
+def get_or_compute(key, compute, timeout=300, tags=(), beta=1.0, cache=default_cache):
+    """Return the cached value for ``key``, calling ``compute()`` to fill it.
+
+    ``tags`` name the things the value depends on (``'product:42'``,
+    ``'catalog'``); invalidating any of them invalidates the entry. ``beta``
+    tunes early expiry: larger values refresh sooner, 0 disables it.
+    """
+    tags = tuple(tags)
+    cache_key = f'{KEY_PREFIX}:{key}'
+    versions = tag_versions(tags, cache=cache)
+    entry = _fresh(cache.get(cache_key), versions)
+    if entry is not None:
+        value, delta, expires_at = entry
+        if not _refresh_early(delta, expires_at, beta):
+            metrics.incr('cache.hits')
+            return value
+        # Close to expiry: refresh now if nobody else is, otherwise keep serving.
+        if not _acquire(cache_key, cache):
+            metrics.incr('cache.hits')
+            metrics.incr('cache.stale_hits')
+            return value
+        metrics.incr('cache.early_refreshes')
+        return _recompute(cache_key, compute, timeout, versions, cache)
+
+    metrics.incr('cache.misses')
+    if _acquire(cache_key, cache):
+        return _recompute(cache_key, compute, timeout, versions, cache)
+
+    # Someone else is computing this value; wait for it rather than piling on.
+    metrics.incr('cache.waits')
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        entry = _fresh(cache.get(cache_key), versions)
+        if entry is not None:
+            return entry[0]
+        if _acquire(cache_key, cache):
+            return _recompute(cache_key, compute, timeout, versions, cache)
+    return _recompute(cache_key, compute, timeout, versions, cache, locked=False)
+
+
+async def atag_versions(tags, cache=default_cache):
+    """Async ``tag_versions``."""
+    tags = list(tags)
+    if not tags:
+        return {}
+    keys = {_tag_key(tag): tag for tag in tags}
+    found = await cache.aget_many(keys.keys())
+    missing = {key: _now_ms() for key in keys if key not in found}
+    if missing:
+        for key, version in missing.items():
+            await cache.aadd(key, version, None)
+        found.update(await cache.aget_many(missing.keys()))
+        found.update({key: version for key, version in missing.items() if key not in found})
+    return {tag: found[key] for key, tag in keys.items()}
+
+
+async def atag_version(tag, cache=default_cache):
+    return (await atag_versions([tag], cache=cache))[tag]
+
+
+async def aget_or_compute(key, compute, timeout=300, tags=(), beta=1.0, cache=default_cache):
+    """Async ``get_or_compute``; ``compute`` is a coroutine function. Shares entries with the sync version."""
+    tags = tuple(tags)
+    cache_key = f'{KEY_PREFIX}:{key}'
+    versions = await atag_versions(tags, cache=cache)
+    entry = _fresh(await cache.aget(cache_key), versions)
+    if entry is not None:
+        value, delta, expires_at = entry
+        if not _refresh_early(delta, expires_at, beta):
+            metrics.incr('cache.hits')
+            return value
+        if not await cache.aadd(f'{cache_key}:lock', 1, LOCK_TIMEOUT):
+            metrics.incr('cache.hits')
+            metrics.incr('cache.stale_hits')
+            return value
+        metrics.incr('cache.early_refreshes')
+        return await _arecompute(cache_key, compute, timeout, versions, cache)
+
+    metrics.incr('cache.misses')
+    if await cache.aadd(f'{cache_key}:lock', 1, LOCK_TIMEOUT):
+        return await _arecompute(cache_key, compute, timeout, versions, cache)
+
+    metrics.incr('cache.waits')
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(WAIT_INTERVAL)
+        entry = _fresh(await cache.aget(cache_key), versions)
+        if entry is not None:
+            return entry[0]
+        if await cache.aadd(f'{cache_key}:lock', 1, LOCK_TIMEOUT):
+            return await _arecompute(cache_key, compute, timeout, versions, cache)
+    return await _arecompute(cache_key, compute, timeout, versions, cache, locked=False)
+
+
+def delete(key, cache=default_cache):
+    cache.delete(f'{KEY_PREFIX}:{key}')
+
+
+def cached(key, timeout=300, tags=()):
+    """Decorator form of ``get_or_compute``.
+
+    ``key`` and each of ``tags`` are format strings filled from the wrapped
+    function's keyword arguments, e.g. ``@cached('order:{order_id}:summary',
+    tags=['order:{order_id}'])``.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(**kwargs):
+            return get_or_compute(
+                key.format(**kwargs),
+                lambda: func(**kwargs),
+                timeout=timeout,
+                tags=[tag.format(**kwargs) for tag in tags],
+            )
+        wrapper.uncached = func
+        return wrapper
+    return decorator
+
+
+def stats():
+    """Return this process's cache counters without the ``cache.`` prefix."""
+    return {name.split('.', 1)[1]: value for name, value in metrics.counters('cache.').items()}
+
+
+def _fresh(entry, versions):
+    if entry is None:
+        return None
+    value, delta, expires_at, stored_versions = entry
+    if stored_versions != versions:
+        return None
+    return value, delta, expires_at
+
+
+def _refresh_early(delta, expires_at, beta):
+    """XFetch: true with a probability that rises as expiry nears and with the cost of recomputing."""
+    return time.time() - delta * beta * math.log(random.random() or 1e-12) >= expires_at
+
+
+def _acquire(cache_key, cache):
+    return cache.add(f'{cache_key}:lock', 1, LOCK_TIMEOUT)
+
+
+def _recompute(cache_key, compute, timeout, versions, cache, locked=True):
+    try:
+        started = time.monotonic()
+        value = compute()
+        delta = time.monotonic() - started
+        metrics.incr('cache.recomputes')
+        expires_at = time.time() + timeout if timeout is not None else math.inf
+        cache.set(cache_key, (value, delta, expires_at, versions), timeout)
+        return value
+    finally:
+        if locked:
+            cache.delete(f'{cache_key}:lock')
+
+
+async def _arecompute(cache_key, compute, timeout, versions, cache, locked=True):
+    try:
+        started = time.monotonic()
+        value = await compute()
+        delta = time.monotonic() - started
+        metrics.incr('cache.recomputes')
+        expires_at = time.time() + timeout if timeout is not None else math.inf
+        await cache.aset(cache_key, (value, delta, expires_at, versions), timeout)
+        return value
+    finally:
+        if locked:
+            await cache.adelete(f'{cache_key}:lock')
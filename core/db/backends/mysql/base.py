@@ -0,0 +1,10 @@
+"""MySQL with pooled connections; see ``core.db.pool``."""
+from django.db.backends.mysql import base
+
+from core.db.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    @staticmethod
+    def check_connection(conn):
+        conn.ping()
@@ -0,0 +1,18 @@
+"""SQLite with pooled connections; see ``core.db.pool``.
+
+A stand-in for the MySQL backend in local benchmarks. In-memory databases
+are not pooled, since each connection would see a different database.
+"""
+from django.db.backends.sqlite3 import base
+
+from core.db.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    @staticmethod
+    def check_connection(conn):
+        conn.execute('SELECT 1').fetchone()
+
+    @property
+    def pooled(self):
+        return not self.is_in_memory_db()
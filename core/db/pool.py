@@ -0,0 +1,211 @@
+"""Per-process pools of open database connections.
+
+Django opens a database connection for each request and closes it at the
+end (``CONN_MAX_AGE = 0``), so every request pays for a TCP connect and a
+MySQL handshake; persistent connections (``CONN_MAX_AGE > 0``) avoid that
+but keep one connection per thread, which is unbounded under ASGI. The
+backends in ``core.db.backends`` keep Django's per-request lifecycle and take
+the raw connection from a ``ConnectionPool`` instead: "closing" it puts it
+back for the next request on any thread.
+
+A pool holds at most ``max_size`` connections; a request that finds them all
+in use waits up to ``timeout`` seconds and then fails like a refused
+connection. A connection idle for more than ``HEALTH_CHECK_AFTER`` seconds is
+pinged before it is handed out, and one older than ``max_lifetime`` is
+closed instead of reused, so it never outlives the server's or a proxy's
+idle timeout. Pools are per process: a forked worker starts with empty ones.
+
+Configure a pool with ``OPTIONS['pool']`` in ``DATABASES``, e.g.
+``{'max_size': 10, 'timeout': 5, 'max_lifetime': 1800}``.
+"""
+import contextlib
+import os
+import threading
+import time
+from collections import deque
+
+from core import metrics
+
+DEFAULT_MAX_SIZE = 10
+DEFAULT_TIMEOUT = 5.0
+DEFAULT_MAX_LIFETIME = 1800.0
+# A connection used this recently is assumed to still be alive.
+HEALTH_CHECK_AFTER = 1.0
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, check, max_size=DEFAULT_MAX_SIZE, timeout=DEFAULT_TIMEOUT, max_lifetime=DEFAULT_MAX_LIFETIME):
+        self.check = check
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self._idle = deque()  # (connection, created, last used)
+        self._in_use = {}  # id(connection) -> created
+        self._size = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, connect):
+        """A connection from the pool, or a new one made with ``connect()``. Returns ``(connection, reused)``."""
+        started = time.monotonic()
+        conn = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    # Most recently used first: the warmest connections stay busy and the rest age out.
+                    conn, created, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = started + self.timeout - time.monotonic()
+                if remaining <= 0:
+                    metrics.incr('db.pool.timeouts')
+                    raise PoolTimeout(f"No database connection free within {self.timeout}s ({self.max_size} in use)")
+                self._cond.wait(remaining)
+        now = time.monotonic()
+        metrics.observe('db.pool.wait', (now - started) * 1000)
+
+        if conn is not None:
+            if now - created > self.max_lifetime:
+                metrics.incr('db.pool.recycled')
+                _close(conn)
+                conn = None
+            elif now - last_used > HEALTH_CHECK_AFTER and not self._healthy(conn):
+                metrics.incr('db.pool.broken')
+                _close(conn)
+                conn = None
+        if conn is None:
+            try:
+                conn = connect()
+            except BaseException:
+                self._forget()
+                raise
+            created, reused = now, False
+            metrics.incr('db.pool.connects')
+        else:
+            reused = True
+            metrics.incr('db.pool.reuses')
+        with self._cond:
+            self._in_use[id(conn)] = created
+        return conn, reused
+
+    def release(self, conn, discard=False):
+        """Return ``conn`` to the pool, or close it if ``discard`` or it has lived long enough."""
+        with self._cond:
+            created = self._in_use.pop(id(conn), None)
+            if created is None:
+                keep = False
+            elif discard or time.monotonic() - created > self.max_lifetime:
+                self._size -= 1
+                keep = False
+            else:
+                self._idle.append((conn, created, time.monotonic()))
+                keep = True
+            self._cond.notify()
+        if not keep:
+            _close(conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'max_size': self.max_size,
+                'size': self._size,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+            }
+
+    def _healthy(self, conn):
+        try:
+            self.check(conn)
+        except Exception:
+            return False
+        return True
+
+    def _forget(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+
+def _close(conn):
+    with contextlib.suppress(Exception):
+        conn.close()
+
+
+def pool_for(alias, check, options):
+    """The pool for database ``alias`` in this process."""
+    key = (os.getpid(), alias)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            # Pools inherited from a parent process stay referenced but unused, so their
+            # sockets, shared with the parent, are never closed from here.
+            pool = _pools[key] = ConnectionPool(check, **options)
+    return pool
+
+
+def stats():
+    """Connection counts for each pool in this process, by database alias."""
+    pid = os.getpid()
+    with _pools_lock:
+        pools = {alias: pool for (owner, alias), pool in _pools.items() if owner == pid}
+    return {alias: pool.stats() for alias, pool in pools.items()}
+
+
+class PooledDatabaseWrapperMixin:
+    """Makes a ``DatabaseWrapper`` open and close connections through a ``ConnectionPool``."""
+
+    _pool_reused = False
+
+    @staticmethod
+    def check_connection(conn):
+        """Raise if ``conn`` can no longer be used."""
+        raise NotImplementedError
+
+    @property
+    def pooled(self):
+        return True
+
+    @property
+    def pool(self):
+        options = self.settings_dict['OPTIONS'].get('pool') or {}
+        return pool_for(self.alias, self.check_connection, options if isinstance(options, dict) else {})
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pool', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        if not self.pooled:
+            return super().get_new_connection(conn_params)
+        connect = super().get_new_connection
+        try:
+            conn, self._pool_reused = self.pool.acquire(lambda: connect(conn_params))
+        except PoolTimeout as e:
+            raise self.Database.OperationalError(str(e)) from e
+        return conn
+
+    def init_connection_state(self):
+        # A reused connection keeps the session settings it was given when it was opened.
+        if not self._pool_reused:
+            super().init_connection_state()
+
+    def _close(self):
+        if not self.pooled or self.connection is None:
+            return super()._close()
+        # Closed inside atomic(), Django keeps the connection object around: it must not be handed to anyone else.
+        discard = self.in_atomic_block or (self.errors_occurred and not self.is_usable())
+        if not discard and not self.autocommit:
+            try:
+                self.connection.rollback()
+            except self.Database.Error:
+                discard = True
+        self.pool.release(self.connection, discard=discard)
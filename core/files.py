@@ -0,0 +1,165 @@
+"""Serving files from disk: uploaded media and product image derivatives.
+
+``serve`` answers conditional requests (``If-None-Match``,
+``If-Modified-Since`` and friends) from the file's metadata alone, then
+hands the body to the front proxy when ``MEDIA_ACCEL`` is set: nginx reads
+the file itself after an ``X-Accel-Redirect`` to an internal location
+aliased to ``MEDIA_ROOT``, and Apache or lighttpd after ``X-Sendfile``, so
+the Python worker only ever produces headers. Without a proxy the file is
+streamed by Django, with single byte ranges (``206``/``416``, honouring
+``If-Range``). Under WSGI it goes through the server's ``wsgi.file_wrapper``,
+which gunicorn sends with ``sendfile(2)``; under ASGI it is read in a thread
+so the event loop never blocks on the disk.
+"""
+import asyncio
+import mimetypes
+import os
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+ACCEL_HEADERS = {'nginx': 'X-Accel-Redirect', 'sendfile': 'X-Sendfile'}
+BLOCK_SIZE = 256 * 1024
+
+
+def serve(request, path, content_type=None, cache_control=None, etag=None):
+    """Respond with the file at ``path``; ``etag`` defaults to one derived from its size and mtime."""
+    try:
+        st = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404
+    if not stat.S_ISREG(st.st_mode):
+        raise Http404
+    etag = etag or f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+    last_modified = int(st.st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        content_type = content_type or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        response = _offload(path, content_type) or _stream(request, path, st.st_size, etag, last_modified, content_type)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    if cache_control:
+        response['Cache-Control'] = cache_control
+    return response
+
+
+def serve_from(request, root, name, **kwargs):
+    """``serve`` the file ``name`` under the directory ``root``, refusing names that escape it."""
+    try:
+        path = safe_join(root, name)
+    except SuspiciousFileOperation:
+        raise Http404
+    return serve(request, path, **kwargs)
+
+
+def _offload(path, content_type):
+    header = ACCEL_HEADERS.get(settings.MEDIA_ACCEL)
+    if header is None:
+        return None
+    if settings.MEDIA_ACCEL == 'nginx':
+        root = os.path.join(os.path.realpath(settings.MEDIA_ROOT), '')
+        real = os.path.realpath(path)
+        if not real.startswith(root):
+            # Only MEDIA_ROOT is mapped to the internal location.
+            return None
+        # nginx reads the header as a URI, not a file name.
+        target = settings.MEDIA_ACCEL_PREFIX + quote(real[len(root):])
+    else:
+        target = os.path.realpath(path)
+    response = HttpResponse(content_type=content_type)
+    response[header] = target
+    return response
+
+
+def _range(request, size, etag, last_modified):
+    """``(start, end)`` of the single byte range to send, ``None`` for the whole file, or ``False`` if unsatisfiable."""
+    header = request.headers.get('Range', '')
+    if not header.startswith('bytes=') or ',' in header or size == 0:
+        # Several ranges would need a multipart body; sending the whole file is allowed instead.
+        return None
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range != etag and parse_http_date_safe(if_range) != last_modified:
+        return None
+    first, _, last = header[len('bytes='):].strip().partition('-')
+    try:
+        if first:
+            start, end = int(first), int(last) if last else size - 1
+        else:
+            start, end = max(size - int(last), 0), size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        return False
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+class _Slice:
+    """A file object limited to ``length`` bytes from its current position.
+
+    It keeps ``fileno()``, so ``wsgi.file_wrapper`` can still ``sendfile`` it:
+    gunicorn sends Content-Length bytes from the descriptor's offset.
+    """
+
+    def __init__(self, f, length):
+        self.f = f
+        self.remaining = length
+
+    def read(self, size=-1):
+        size = self.remaining if size < 0 else min(size, self.remaining)
+        data = self.f.read(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.f.fileno()
+
+    def close(self):
+        self.f.close()
+
+
+async def _aread(path, start, length):
+    f = await asyncio.to_thread(open, path, 'rb')
+    try:
+        await asyncio.to_thread(f.seek, start)
+        while length > 0:
+            chunk = await asyncio.to_thread(f.read, min(BLOCK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def _stream(request, path, size, etag, last_modified, content_type):
+    byte_range = _range(request, size, etag, last_modified)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    start, end = byte_range or (0, size - 1)
+    length = end - start + 1 if size else 0
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+    elif isinstance(request, ASGIRequest):
+        response = StreamingHttpResponse(_aread(path, start, length), content_type=content_type)
+    else:
+        f = open(path, 'rb')
+        f.seek(start)
+        response = FileResponse(_Slice(f, length), content_type=content_type)
+        response.block_size = BLOCK_SIZE
+    response['Content-Length'] = length
+    response['Accept-Ranges'] = 'bytes'
+    if byte_range:
+        response.status_code = 206
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
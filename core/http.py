@@ -0,0 +1,56 @@
+"""Conditional GET for pages built from tagged cache entries.
+
+A page rendered from data cached under some tags changes only when one of
+those tags is invalidated, so the tag versions (``core.cache.tag_versions``)
+identify it without rendering anything: the ETag hashes them together with
+what else the page depends on (the release, the user, the CSRF cookie its
+forms embed) and Last-Modified is the newest version. Views look the
+versions up, answer 304 through ``not_modified`` when the client is current,
+and otherwise render and add the headers with ``set_validators``.
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+
+def validators(request, versions):
+    """``(etag, last_modified)`` for the page ``request`` gets from data at tag ``versions``."""
+    parts = [
+        settings.RELEASE,
+        str(request.user.pk or ''),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+        *(f'{tag}={version}' for tag, version in sorted(versions.items())),
+    ]
+    digest = hashlib.blake2b('\n'.join(parts).encode(), digest_size=16).hexdigest()
+    return f'"{digest}"', max(versions.values()) // 1000
+
+
+def _has_messages(request):
+    # len() loads pending messages without marking them shown.
+    return bool(len(get_messages(request)))
+
+
+def not_modified(request, etag, last_modified):
+    """A 304 response if the client's copy is current, else ``None``."""
+    if _has_messages(request):
+        return None
+    return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def set_validators(request, response, etag, last_modified, shared=False):
+    """Add ETag, Last-Modified and Cache-Control to a freshly rendered page.
+
+    Browsers revalidate every time (a 304 costs no rendering). ``shared``
+    pages seen by anonymous visitors may also be kept by a reverse proxy or
+    CDN for ``CATALOG_SHARED_MAX_AGE`` seconds; the rest are private.
+    """
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    if shared and not request.user.is_authenticated and not _has_messages(request):
+        patch_cache_control(response, public=True, max_age=0, s_maxage=settings.CATALOG_SHARED_MAX_AGE)
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
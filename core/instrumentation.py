@@ -0,0 +1,165 @@
+"""Per-request performance instrumentation.
+
+``InstrumentationMiddleware`` times every request and, through a database
+execute wrapper and ``metrics.collect``, totals the queries, cache lookups
+and Paystack calls made while serving it. The totals go out in a
+``Server-Timing`` header and into rolling per-view histograms served by
+``core.views.metrics``. Views declare what a request may cost with
+``@budget``; overspending is logged, and tests check it with
+``core.testing.BudgetAssertionsMixin``.
+"""
+import logging
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Budget:
+    """Most queries, milliseconds and repeated queries one request to a view may take; ``None`` means no limit."""
+
+    def __init__(self, queries=None, ms=None, duplicates=0):
+        self.queries = queries
+        self.ms = ms
+        self.duplicates = duplicates
+
+    def violations(self, stats):
+        violations = []
+        if self.queries is not None and stats.query_count > self.queries:
+            violations.append(f"{stats.query_count} queries > {self.queries}")
+        if self.duplicates is not None and stats.duplicate_count > self.duplicates:
+            violations.append(f"{stats.duplicate_count} repeated queries > {self.duplicates}")
+        if self.ms is not None and stats.duration > self.ms:
+            violations.append(f"{stats.duration:.1f}ms > {self.ms}ms")
+        return violations
+
+
+def budget(queries=None, ms=None, duplicates=0):
+    """Declare a view's per-request budget. Works on view functions and class-based views."""
+    def decorator(view):
+        view.performance_budget = Budget(queries, ms, duplicates)
+        return view
+    return decorator
+
+
+class RequestStats(metrics.Scope):
+    def __init__(self):
+        super().__init__()
+        self.started = time.perf_counter()
+        self.duration = None
+        self.queries = []
+        self.view = None
+        self.budget = None
+
+    def stop(self):
+        self.duration = (time.perf_counter() - self.started) * 1000
+
+    @property
+    def query_count(self):
+        return len(self.queries)
+
+    @property
+    def db_time(self):
+        return sum(ms for _, ms in self.queries)
+
+    @property
+    def duplicates(self):
+        """``{sql: times run}`` for statements run more than once, whatever their parameters (N+1s)."""
+        counts = Counter(sql for sql, _ in self.queries)
+        return {sql: n for sql, n in counts.items() if n > 1}
+
+    @property
+    def duplicate_count(self):
+        return sum(n - 1 for n in self.duplicates.values())
+
+    @property
+    def paystack_time(self):
+        return sum(ms for name, ms in self.timings.items() if name.startswith('paystack.'))
+
+    def server_timing(self):
+        entries = [
+            f'app;dur={self.duration:.1f}',
+            f'db;dur={self.db_time:.1f};desc="{self.query_count} queries, {self.duplicate_count} repeated"',
+        ]
+        hits, misses = self.counters['cache.hits'], self.counters['cache.misses']
+        if hits or misses:
+            entries.append(f'cache;desc="{hits} hits, {misses} misses"')
+        if self.counters['paystack.calls']:
+            entries.append(f'paystack;dur={self.paystack_time:.1f};desc="{self.counters["paystack.calls"]} calls"')
+        return ', '.join(entries)
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = metrics.current_scope()
+    if not isinstance(stats, RequestStats):
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries.append((sql, (time.perf_counter() - started) * 1000))
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    # Every thread has its own connections, and async views query from
+    # sync_to_async threads, so each connection gets the wrapper as it opens.
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _view_budget(func):
+    declared = getattr(func, 'performance_budget', None)
+    if declared is None and hasattr(func, 'view_class'):
+        declared = getattr(func.view_class, 'performance_budget', None)
+    return declared
+
+
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with metrics.collect(RequestStats()) as stats:
+            response = self.get_response(request)
+        return self.finish(request, response, stats)
+
+    async def __acall__(self, request):
+        with metrics.collect(RequestStats()) as stats:
+            response = await self.get_response(request)
+        return self.finish(request, response, stats)
+
+    def finish(self, request, response, stats):
+        stats.stop()
+        match = request.resolver_match
+        stats.view = match.view_name if match else 'unresolved'
+        stats.budget = _view_budget(match.func) if match else None
+        response.request_stats = stats
+
+        metrics.incr('requests')
+        metrics.observe(f'view.{stats.view}', stats.duration)
+        metrics.observe(f'view.{stats.view}.db', stats.db_time)
+        metrics.observe(f'view.{stats.view}.queries', stats.query_count)
+        if stats.duplicate_count:
+            metrics.incr(f'view.{stats.view}.repeated_queries', stats.duplicate_count)
+        violations = stats.budget.violations(stats) if stats.budget else []
+        if violations:
+            metrics.incr(f'view.{stats.view}.over_budget')
+            logger.warning(f"{request.method} {request.path} ({stats.view}) over budget: {'; '.join(violations)}")
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = stats.server_timing()
+        return response
@@ -0,0 +1,219 @@
+import hashlib
+import hmac
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from orders.models import Order
+from payments.models import PaystackEvent
+from products.models import ProductCategory
+from .seed import SEED_PREFIX, seeded_products, seeded_users
+
+SCENARIOS = ('product_list', 'cart', 'checkout', 'order_detail', 'webhook')
+WEBHOOK_MARKER = 'bench'
+
+
+def _percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0
+
+
+def compare(baseline, results, tolerance):
+    """Yield ``(scenario, old, new, problems)`` for scenarios in both runs; ``problems`` lists regressions."""
+    for scenario, new in results.items():
+        old = baseline.get(scenario)
+        if old is None:
+            continue
+        problems = []
+        if new['rps'] < old['rps'] * (1 - tolerance):
+            problems.append('throughput')
+        # Ignore a millisecond or two of wobble on very fast paths.
+        if new['p95'] > old['p95'] * (1 + tolerance) and new['p95'] - old['p95'] > 2:
+            problems.append('p95 latency')
+        if new['queries'] > old['queries'] + 0.5:
+            problems.append('queries')
+        yield scenario, old, new, problems
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the product list, cart, checkout, order detail and webhook views through the test client "
+        "against seeded data (run `seed` first) and report throughput, latency and queries per request. "
+        "Save a run with --save-baseline and compare later runs with --baseline. The checkout scenario "
+        "places real orders for a few seeded customers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS), choices=SCENARIOS)
+        parser.add_argument('--requests', type=int, default=200, help="Timed requests per scenario.")
+        parser.add_argument('--concurrency', type=int, default=4, help="Client threads.")
+        parser.add_argument('--warmup', type=int, default=10, help="Untimed requests per scenario.")
+        parser.add_argument('--save-baseline', metavar='PATH', help="Write the results to this JSON file.")
+        parser.add_argument('--baseline', metavar='PATH', help="Compare with results saved by --save-baseline.")
+        parser.add_argument(
+            '--tolerance', type=float, default=0.25,
+            help="Fractional slowdown allowed before a scenario counts as a regression.",
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        if connection.vendor == 'sqlite' and concurrency > 1:
+            self.stderr.write(self.style.WARNING(
+                "SQLite serialises writers; expect checkout errors ('database is locked') above --concurrency 1."
+            ))
+        # Shoppers have a cart and some orders; buyers check out, which empties their cart, so they are
+        # taken from the other end to keep the shoppers' carts intact between runs.
+        shoppers = list(
+            seeded_users().filter(cart__lines__isnull=False, order__isnull=False).distinct().order_by('id')[:concurrency]
+        )
+        buyers = list(seeded_users().filter(cart__lines__isnull=True).distinct().order_by('-id')[:concurrency])
+        if not shoppers or not buyers:
+            raise CommandError("No seeded customers with carts and orders; run `manage.py seed` first.")
+        self.products = list(seeded_products().filter(inventory__gt=0).values_list('id', flat=True)[:500])
+        self.categories = list(
+            ProductCategory.objects.filter(name__startswith=f'{SEED_PREFIX} ').values_list('id', flat=True)
+        )
+        self.orders = {
+            user.pk: list(Order.objects.filter(user=user).values_list('id', flat=True)[:50]) for user in shoppers
+        }
+
+        results = {}
+        try:
+            for scenario in options['scenarios']:
+                users = buyers if scenario == 'checkout' else shoppers
+                results[scenario] = self.run(scenario, users, concurrency, options)
+        finally:
+            PaystackEvent.objects.filter(reference__endswith=f'_{WEBHOOK_MARKER}').delete()
+
+        self.stdout.write(f"backend: {connection.vendor}, concurrency: {concurrency}")
+        self.stdout.write(
+            f"{'scenario':<14} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'errors':>7}"
+        )
+        for scenario, r in results.items():
+            self.stdout.write(
+                f"{scenario:<14} {r['rps']:>8.1f} {r['p50']:>8.1f} {r['p95']:>8.1f} {r['p99']:>8.1f} "
+                f"{r['queries']:>8.1f} {r['errors']:>7}"
+            )
+
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as f:
+                json.dump({'backend': connection.vendor, 'concurrency': concurrency, 'results': results}, f, indent=2)
+            self.stdout.write(f"Saved baseline to {options['save_baseline']}")
+        if options['baseline']:
+            self.diff(options['baseline'], results, concurrency, options['tolerance'])
+
+    def diff(self, path, results, concurrency, tolerance):
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+            baseline = saved['results']
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f"Could not read baseline {path}: {e}")
+        if (saved.get('backend'), saved.get('concurrency')) != (connection.vendor, concurrency):
+            self.stderr.write(self.style.WARNING(
+                f"The baseline ran on {saved.get('backend')} at concurrency {saved.get('concurrency')}; "
+                "the numbers are not comparable."
+            ))
+        self.stdout.write(f"\nChanges against {path}:")
+        regressions = 0
+        for scenario, old, new, problems in compare(baseline, results, tolerance):
+            regressions += bool(problems)
+            style = self.style.ERROR if problems else self.style.SUCCESS
+            self.stdout.write(style(
+                f"{scenario:<14} req/s {self._change(old['rps'], new['rps'])}  "
+                f"p95 {self._change(old['p95'], new['p95'])}  "
+                f"queries {old['queries']:.1f} -> {new['queries']:.1f}  "
+                f"{'REGRESSED: ' + ', '.join(problems) if problems else 'ok'}"
+            ))
+        if regressions:
+            raise CommandError(f"{regressions} scenario(s) regressed")
+
+    @staticmethod
+    def _change(old, new):
+        percent = (new - old) / old * 100 if old else 0.0
+        return f"{old:.1f} -> {new:.1f} ({percent:+.0f}%)"
+
+    def run(self, scenario, users, concurrency, options):
+        prepare = getattr(self, scenario)
+        lock = threading.Lock()
+        latencies, queries, errors = [], [], 0
+        workers = []
+        for w in range(concurrency):
+            user = users[w % len(users)]
+            client = Client(raise_request_exception=False, SERVER_NAME='localhost')
+            client.force_login(user)
+            workers.append((client, user, random.Random(w)))
+        for n in range(options['warmup']):
+            client, user, rng = workers[n % concurrency]
+            method, path, kwargs = prepare(client, user, rng)
+            getattr(client, method)(path, **kwargs)
+
+        def worker(w):
+            nonlocal errors
+            client, user, rng = workers[w]
+            try:
+                for _ in range(w, options['requests'], concurrency):
+                    method, path, kwargs = prepare(client, user, rng)
+                    started = time.perf_counter()
+                    response = getattr(client, method)(path, **kwargs)
+                    elapsed = (time.perf_counter() - started) * 1000
+                    stats = getattr(response, 'request_stats', None)
+                    with lock:
+                        latencies.append(elapsed)
+                        if stats is not None:
+                            queries.append(stats.query_count)
+                        if response.status_code != 200:
+                            errors += 1
+            finally:
+                if concurrency > 1:
+                    connection.close()
+
+        started = time.perf_counter()
+        if concurrency == 1:
+            worker(0)
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(worker, range(concurrency)))
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        return {
+            'requests': len(latencies),
+            'errors': errors,
+            'rps': len(latencies) / elapsed if elapsed else 0.0,
+            'p50': _percentile(latencies, 0.5),
+            'p95': _percentile(latencies, 0.95),
+            'p99': _percentile(latencies, 0.99),
+            'queries': sum(queries) / len(queries) if queries else 0.0,
+        }
+
+    # Each scenario does any untimed setup and returns the request to time.
+
+    def product_list(self, client, user, rng):
+        data = {'category': rng.choice(self.categories)} if rng.random() < 0.5 else {}
+        return 'get', reverse('products:product_list'), {'data': data}
+
+    def cart(self, client, user, rng):
+        return 'get', reverse('orders:cart'), {}
+
+    def checkout(self, client, user, rng):
+        client.post(reverse('orders:add_to_cart', args=[rng.choice(self.products)]))
+        return 'get', reverse('orders:checkout'), {}
+
+    def order_detail(self, client, user, rng):
+        return 'get', reverse('orders:order_detail', args=[rng.choice(self.orders[user.pk])]), {}
+
+    def webhook(self, client, user, rng):
+        order_id = rng.choice(self.orders[user.pk])
+        reference = f'order_{order_id}_{user.pk}_{rng.getrandbits(64):x}_{WEBHOOK_MARKER}'
+        body = json.dumps({'event': 'charge.success', 'data': {'reference': reference, 'amount': 100}}).encode()
+        signature = hmac.new(settings.PAYSTACK_SECRET_KEY.encode(), body, hashlib.sha512).hexdigest()
+        return 'post', reverse('orders:paystack_webhook'), {
+            'data': body, 'content_type': 'application/json', 'HTTP_X_PAYSTACK_SIGNATURE': signature,
+        }
@@ -0,0 +1,205 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from decimal import Decimal
+
+import httpx
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from core.testing import LocalPaystackServer
+from orders.models import Order
+from products.models import Product
+
+BENCH_PREFIX = 'loadtest'
+SCENARIOS = ('catalog', 'product', 'cart', 'checkout-session')
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the site under WSGI (gunicorn, threaded workers) and ASGI (uvicorn) with a simulated "
+        "Paystack, with and without database connection pooling, and compare requests/sec and latency "
+        "per scenario."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servers', nargs='+', default=['wsgi', 'asgi'], choices=['wsgi', 'asgi'])
+        parser.add_argument(
+            '--db-pool', nargs='+', default=['off', 'on'], choices=['off', 'on'],
+            help="Run each server without and/or with the pooled database backend (DB_POOL).",
+        )
+        parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS), choices=SCENARIOS)
+        parser.add_argument('--requests', type=int, default=500, help="Requests per scenario.")
+        parser.add_argument('--concurrency', type=int, default=50, help="Requests in flight at once.")
+        parser.add_argument('--workers', type=int, default=2, help="Server processes for either server.")
+        parser.add_argument('--threads', type=int, default=8, help="Threads per gunicorn worker.")
+        parser.add_argument('--paystack-latency', type=float, default=0.25, help="Seconds each Paystack call takes.")
+
+    def handle(self, *args, **options):
+        paystack = LocalPaystackServer(latency=options['paystack_latency']).start()
+        try:
+            self.setup(options)
+            self.paystack_url = paystack.url
+            results = []
+            for server in options['servers']:
+                for pool in options['db_pool']:
+                    with self.serve(server, pool == 'on', paystack.url, options) as base_url:
+                        for scenario in options['scenarios']:
+                            results.append((server, pool, scenario, self.run(base_url, scenario, options)))
+        finally:
+            paystack.stop()
+            self.teardown()
+
+        self.stdout.write(
+            f"{'server':<6} {'pool':<4} {'scenario':<18} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}"
+        )
+        for server, pool, scenario, result in results:
+            self.stdout.write(
+                f"{server:<6} {pool:<4} {scenario:<18} {result['rps']:>8.1f} {result['p50']:>8.1f} "
+                f"{result['p99']:>8.1f} {result['errors']:>7}"
+            )
+
+    def setup(self, options):
+        self.teardown()
+        User = get_user_model()
+        user = User.objects.create_user(username=BENCH_PREFIX, email=f'{BENCH_PREFIX}@example.com', password=None)
+        self.product = Product.objects.create(
+            name=f'{BENCH_PREFIX} product', description='Load test product', price=Decimal('10.00'), inventory=10**6,
+        )
+        # Paystack refuses a reused reference, so every checkout-session request gets its own order.
+        count = options['requests'] * len(options['servers']) * len(options['db_pool'])
+        Order.objects.bulk_create([
+            Order(user=user, total_price=Decimal('10.00'), tax_amount=Decimal('0.05')) for _ in range(count)
+        ])
+        self.order_ids = list(Order.objects.filter(user=user).order_by('id').values_list('id', flat=True))
+
+        session = SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        self.cookies = {settings.SESSION_COOKIE_NAME: session.session_key}
+
+    def teardown(self):
+        users = get_user_model().objects.filter(username=BENCH_PREFIX)
+        Order.objects.filter(user__in=users).delete()
+        Product.objects.filter(name__startswith=BENCH_PREFIX).delete()
+        users.delete()
+
+    def serve(self, server, pooled, paystack_url, options):
+        port = _free_port()
+        if server == 'wsgi':
+            command = [
+                sys.executable, '-m', 'gunicorn', 'marketplace_template.wsgi:application',
+                '--bind', f'127.0.0.1:{port}', '--workers', str(options['workers']),
+                '--worker-class', 'gthread', '--threads', str(options['threads']), '--log-level', 'warning',
+            ]
+        else:
+            command = [
+                sys.executable, '-m', 'uvicorn', 'marketplace_template.asgi:application',
+                '--host', '127.0.0.1', '--port', str(port), '--workers', str(options['workers']),
+                '--log-level', 'warning', '--no-access-log',
+            ]
+        env = {**os.environ, 'PAYSTACK_API_URL': paystack_url, 'DB_POOL': str(pooled)}
+        return _Server(command, port, env, cwd=settings.BASE_DIR)
+
+    def run(self, base_url, scenario, options):
+        if scenario == 'checkout-session':
+            orders = iter(self.order_ids[:options['requests']])
+            self.order_ids = self.order_ids[options['requests']:]
+
+        def path():
+            if scenario == 'catalog':
+                return reverse('products:product_list')
+            if scenario == 'product':
+                return reverse('products:product_detail', args=[self.product.pk])
+            if scenario == 'cart':
+                return reverse('orders:cart')
+            return reverse('orders:create_checkout_session', args=[next(orders)])
+
+        def succeeded(response):
+            if scenario == 'checkout-session':
+                # Failures redirect back to the order instead of on to Paystack.
+                return response.headers.get('location', '').startswith(self.paystack_url)
+            return response.status_code == 200
+
+        paths = [path() for _ in range(options['requests'])]
+        return asyncio.run(self.load(base_url, paths, succeeded, options['concurrency']))
+
+    async def load(self, base_url, paths, succeeded, concurrency):
+        latencies, errors = [], 0
+        queue = asyncio.Queue()
+        for path in paths:
+            queue.put_nowait(path)
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=base_url, cookies=self.cookies, limits=limits, timeout=60) as client:
+            async def worker():
+                nonlocal errors
+                while not queue.empty():
+                    path = queue.get_nowait()
+                    started = time.perf_counter()
+                    try:
+                        response = await client.get(path)
+                        if not succeeded(response):
+                            errors += 1
+                    except httpx.HTTPError:
+                        errors += 1
+                    latencies.append((time.perf_counter() - started) * 1000)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+        latencies.sort()
+        return {
+            'rps': len(paths) / elapsed,
+            'p50': _percentile(latencies, 0.5),
+            'p99': _percentile(latencies, 0.99),
+            'errors': errors,
+        }
+
+
+class _Server:
+    """Runs a server command for the duration of a ``with`` block and yields its base URL."""
+
+    def __init__(self, command, port, env, cwd):
+        self.command, self.port, self.env, self.cwd = command, port, env, cwd
+
+    def __enter__(self):
+        try:
+            self.process = subprocess.Popen(self.command, env=self.env, cwd=self.cwd)
+        except OSError as e:
+            raise CommandError(f"Could not start {self.command[2]}: {e}")
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise CommandError(f"{self.command[2]} exited with status {self.process.returncode}")
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=0.2).close()
+                return f'http://127.0.0.1:{self.port}'
+            except OSError:
+                time.sleep(0.1)
+        self.__exit__()
+        raise CommandError(f"{self.command[2]} did not start listening on port {self.port}")
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
@@ -0,0 +1,94 @@
+import logging
+import multiprocessing
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections
+
+from core.tasks import BATCH_SIZE, run_pending
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background tasks (see core.tasks). Starts --processes worker processes; "
+        "SIGTERM or Ctrl-C lets each finish its current task and exit."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2, help="Worker processes.")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Tasks claimed at a time.")
+        parser.add_argument('--loop', action='store_true', help="Keep polling instead of exiting when the queue is empty.")
+        parser.add_argument('--interval', type=float, default=1.0, help="Seconds to sleep between polls when idle (with --loop).")
+
+    def handle(self, *args, **options):
+        if options['processes'] <= 1:
+            ran = work(options)
+            self.stdout.write(self.style.SUCCESS(f"Ran {ran} task(s)."))
+            return
+        # Children must not share the parent's database connections.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        workers = [
+            context.Process(target=_child, args=(options, results), daemon=True)
+            for _ in range(options['processes'])
+        ]
+        for worker in workers:
+            worker.start()
+
+        def stop(signum, frame):
+            # terminate() sends SIGTERM, which a worker takes as "finish the current task and exit".
+            for worker in workers:
+                worker.terminate()
+
+        signal.signal(signal.SIGTERM, stop)
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            # The terminal sent SIGINT to the workers too.
+            for worker in workers:
+                worker.join()
+        ran = 0
+        while not results.empty():
+            ran += results.get()
+        self.stdout.write(self.style.SUCCESS(f"Ran {ran} task(s) in {options['processes']} processes."))
+
+
+def _child(options, results):
+    results.put(work(options))
+
+
+def work(options):
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    ran = 0
+    try:
+        while not stopping:
+            try:
+                claimed = run_pending(options['batch_size'])
+            except DatabaseError as e:
+                # Lock timeouts and dropped connections; claimed tasks come back when their lease runs out.
+                logger.warning(f"Task worker hit a database error: {e}")
+                connections.close_all()
+                time.sleep(options['interval'])
+                continue
+            ran += claimed
+            if claimed:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        connections.close_all()
+    return ran
@@ -0,0 +1,226 @@
+import io
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageDraw
+
+from core.cache import invalidate_tags
+from orders.cart import refresh_subtotals
+from orders.models import Cart, CartLine, Order, OrderItem
+from products import images
+from products.models import Product, ProductCategory, summarize
+from recommendations.index import rebuild as rebuild_recommendations
+from search.index import reindex_products
+
+SEED_PREFIX = 'seed'
+PASSWORD = 'seed'
+CATEGORIES = (
+    'Books', 'Electronics', 'Home', 'Garden', 'Toys', 'Sports', 'Beauty', 'Kitchen', 'Music', 'Office',
+    'Outdoors', 'Pets', 'Shoes', 'Tools', 'Games', 'Jewellery', 'Baby', 'Automotive', 'Crafts', 'Health',
+)
+ADJECTIVES = (
+    'Classic', 'Compact', 'Deluxe', 'Handmade', 'Portable', 'Rustic', 'Smart', 'Vintage', 'Wireless', 'Organic',
+    'Premium', 'Lightweight', 'Waterproof', 'Ergonomic', 'Cotton', 'Leather', 'Bamboo', 'Ceramic', 'Steel', 'Wooden',
+)
+NOUNS = (
+    'Lamp', 'Backpack', 'Kettle', 'Notebook', 'Speaker', 'Blender', 'Jacket', 'Sneakers', 'Headphones', 'Mug',
+    'Chair', 'Desk', 'Watch', 'Wallet', 'Charger', 'Blanket', 'Candle', 'Planter', 'Puzzle', 'Football',
+    'Guitar', 'Camera', 'Scarf', 'Toolkit', 'Cookbook', 'Bracelet', 'Pillow', 'Umbrella', 'Bottle', 'Skillet',
+)
+PHRASES = (
+    'built to last', 'perfect for everyday use', 'a customer favourite', 'easy to clean', 'great as a gift',
+    'designed in Lagos', 'made from recycled materials', 'with a two year warranty', 'ships within 24 hours',
+)
+STATUS_WEIGHTS = {
+    Order.PENDING: 5,
+    Order.PROCESSING: 10,
+    Order.SHIPPED: 10,
+    Order.DELIVERED: 70,
+    Order.CANCELLED: 5,
+}
+
+
+def seeded_users():
+    return get_user_model().objects.filter(username__startswith=f'{SEED_PREFIX}-')
+
+
+def seeded_products():
+    return Product.objects.filter(category__name__startswith=f'{SEED_PREFIX} ')
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with realistic volumes of customers, categories, products (with images), carts "
+        "and orders for benchmarking. Previously seeded rows are replaced; other data is left alone."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--categories', type=int, default=len(CATEGORIES), choices=range(1, len(CATEGORIES) + 1))
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--images', type=int, default=50, help="Distinct product images; products share them.")
+        parser.add_argument('--carts', type=int, default=500, help="Customers with something in their cart.")
+        parser.add_argument('--orders', type=int, default=20000)
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows per INSERT.")
+        parser.add_argument('--random-seed', type=int, default=0, help="Same seed, same data.")
+        parser.add_argument('--teardown', action='store_true', help="Delete the seeded rows and exit.")
+
+    def handle(self, *args, **options):
+        self.teardown()
+        if options['teardown']:
+            return
+        self.rng = random.Random(options['random_seed'])
+        self.batch_size = options['batch_size']
+
+        users = self.seed_users(options['users'])
+        products = self.seed_products(options)
+        carts = self.seed_carts(users[:options['carts']], products)
+        orders = self.seed_orders(options['orders'], users, products)
+
+        for start in range(0, len(products), self.batch_size):
+            reindex_products(p.id for p in products[start:start + self.batch_size])
+        invalidate_tags('catalog', 'categories')
+        rebuild_recommendations()
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(users)} customers (password {PASSWORD!r}), {len(products)} products, "
+            f"{carts} carts and {orders} orders"
+        ))
+
+    def seed_users(self, count):
+        User = get_user_model()
+        password = make_password(PASSWORD)
+        User.objects.bulk_create([
+            User(username=f'{SEED_PREFIX}-{n}', email=f'{SEED_PREFIX}-{n}@example.com', password=password)
+            for n in range(count)
+        ], batch_size=self.batch_size)
+        return list(seeded_users().order_by('id'))
+
+    def seed_products(self, options):
+        ProductCategory.objects.bulk_create([
+            ProductCategory(name=f'{SEED_PREFIX} {name}', description=f'{name} from the seed data')
+            for name in CATEGORIES[:options['categories']]
+        ])
+        categories = list(ProductCategory.objects.filter(name__startswith=f'{SEED_PREFIX} ').order_by('id'))
+        pictures = [self.seed_image(n) for n in range(options['images'])]
+        rng = self.rng
+
+        def product(n):
+            name = f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}'
+            image, digest = rng.choice(pictures) if pictures else ('', '')
+            description = f'{name}, {rng.choice(PHRASES)} and {rng.choice(PHRASES)}.'
+            return Product(
+                name=name,
+                description=description,
+                # bulk_create skips the signal that fills this in.
+                summary=summarize(description),
+                # Most prices are modest with a long tail of expensive items.
+                price=Decimal(min(500_000, round(rng.lognormvariate(8.5, 1.0), -1))).quantize(Decimal('0.01')),
+                category=rng.choice(categories),
+                inventory=0 if rng.random() < 0.05 else rng.randint(1, 500),
+                image=image,
+                image_digest=digest,
+            )
+
+        Product.objects.bulk_create([product(n) for n in range(options['products'])], batch_size=self.batch_size)
+        self.stdout.write(f"Seeded {options['products']} products")
+        return list(seeded_products().order_by('id'))
+
+    def seed_image(self, n):
+        """Write a gradient picture to storage and return ``(name, digest)``, with its resized copies made."""
+        hue = self.rng.randrange(256)
+        image = Image.new('RGB', (800, 600))
+        draw = ImageDraw.Draw(image)
+        for y in range(600):
+            draw.line([(0, y), (800, y)], fill=(hue, (y * 255) // 600, 255 - hue))
+        draw.ellipse([250, 150, 550, 450], fill=(255 - hue, hue, 128))
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=85)
+        name = default_storage.save(f'products/{SEED_PREFIX}-{n}.jpg', ContentFile(buffer.getvalue()))
+        digest = images.path_digest(default_storage.path(name))
+        images.generate(default_storage.path(name), digest)
+        return name, digest
+
+    def seed_carts(self, users, products):
+        rng = self.rng
+        in_stock = [p for p in products if p.inventory]
+        Cart.objects.bulk_create([Cart(user=user) for user in users], batch_size=self.batch_size)
+        lines = []
+        carts = list(Cart.objects.filter(user__in=seeded_users()).order_by('id'))
+        for cart in carts:
+            for product in rng.sample(in_stock, min(len(in_stock), rng.randint(1, 5))):
+                lines.append(CartLine(cart=cart, product=product, quantity=rng.randint(1, 3), unit_price=product.price))
+        CartLine.objects.bulk_create(lines, batch_size=self.batch_size)
+        refresh_subtotals(cart.id for cart in carts)
+        return len(carts)
+
+    def seed_orders(self, count, users, products):
+        rng = self.rng
+
+        def customer():
+            # Skewed so a few customers have long histories.
+            if rng.random() < 0.2:
+                return users[min(int(rng.paretovariate(1.2)) - 1, len(users) - 1)]
+            return rng.choice(users)
+
+        statuses, weights = zip(*STATUS_WEIGHTS.items())
+        now = timezone.now()
+        span = timedelta(days=365).total_seconds()
+        # Spread created_at over a year; auto_now_add would stamp every row with now.
+        created_at = Order._meta.get_field('created_at')
+        created_at.auto_now_add = False
+        try:
+            seeded = 0
+            while seeded < count and users and products:
+                size = min(self.batch_size, count - seeded)
+                baskets = [
+                    [(p, rng.randint(1, 3)) for p in rng.sample(products, min(len(products), rng.randint(1, 5)))]
+                    for _ in range(size)
+                ]
+                with transaction.atomic():
+                    orders = []
+                    for basket in baskets:
+                        subtotal = sum(p.price * quantity for p, quantity in basket)
+                        orders.append(Order(
+                            user=customer(),
+                            created_at=now - timedelta(seconds=rng.random() * span),
+                            total_price=subtotal,
+                            tax_amount=(subtotal * Decimal('0.05')).quantize(Decimal('0.01')),
+                            status=rng.choices(statuses, weights)[0],
+                        ))
+                    Order.objects.bulk_create(orders)
+                    if not all(o.pk for o in orders):
+                        orders = list(Order.objects.filter(user__in=seeded_users()).order_by('-id')[:size])[::-1]
+                    OrderItem.objects.bulk_create([
+                        OrderItem(order=order, product=p, quantity=quantity, price=p.price)
+                        for order, basket in zip(orders, baskets)
+                        for p, quantity in basket
+                    ], batch_size=self.batch_size)
+                seeded += size
+                self.stdout.write(f"Seeded {seeded} orders")
+        finally:
+            created_at.auto_now_add = True
+        return seeded
+
+    def teardown(self):
+        users = seeded_users()
+        OrderItem.objects.filter(order__user__in=users).delete()
+        Order.objects.filter(user__in=users).delete()
+        products = seeded_products()
+        OrderItem.objects.filter(product__in=products).delete()
+        CartLine.objects.filter(product__in=products).delete()
+        products.delete()
+        ProductCategory.objects.filter(name__startswith=f'{SEED_PREFIX} ').delete()
+        users.delete()
+        for n in range(10_000):
+            name = f'products/{SEED_PREFIX}-{n}.jpg'
+            if not default_storage.exists(name):
+                break
+            default_storage.delete(name)
@@ -0,0 +1,161 @@
+"""In-process counters and latency histograms shared by the cache, payment and request instrumentation."""
+import bisect
+import contextvars
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# Upper bounds, in milliseconds, of the latency histogram buckets.
+BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float('inf'))
+# Rolling histograms cover the last WINDOW seconds in SLOT-second steps.
+WINDOW = 300
+SLOT = 10
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_histograms = {}
+_rolling = {}
+_scope = contextvars.ContextVar('metrics_scope', default=None)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q):
+        """Estimate the ``q``-th percentile (0-100) as the upper bound of its bucket."""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': self.max,
+        }
+
+
+class RollingHistogram:
+    """A histogram of the last ``window`` seconds, kept as a ring of ``slot``-second histograms."""
+
+    def __init__(self, window=WINDOW, slot=SLOT):
+        self.slot = slot
+        self.slots = deque(maxlen=math.ceil(window / slot))
+
+    def observe(self, value, now=None):
+        index = int((time.monotonic() if now is None else now) // self.slot)
+        if not self.slots or self.slots[-1][0] != index:
+            self.slots.append((index, Histogram()))
+        self.slots[-1][1].observe(value)
+
+    def histogram(self, window, now=None):
+        """Merge the slots that fall within the last ``window`` seconds."""
+        oldest = int((time.monotonic() if now is None else now) // self.slot) - math.ceil(window / self.slot) + 1
+        merged = Histogram()
+        for index, histogram in self.slots:
+            if index >= oldest:
+                merged.merge(histogram)
+        return merged
+
+
+class Scope:
+    """Counters and summed timings recorded in the current context while ``collect`` is active."""
+
+    def __init__(self):
+        self.counters = defaultdict(int)
+        self.timings = defaultdict(float)
+
+
+@contextmanager
+def collect(scope=None):
+    """Also record into ``scope`` everything counted or observed inside the block, e.g. for one request.
+
+    The scope lives in a context variable, so it follows the code into
+    ``sync_to_async`` threads but not into other requests.
+    """
+    scope = Scope() if scope is None else scope
+    token = _scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _scope.reset(token)
+
+
+def current_scope():
+    return _scope.get()
+
+
+def incr(name, value=1):
+    scope = _scope.get()
+    if scope is not None:
+        scope.counters[name] += value
+    with _lock:
+        _counters[name] += value
+
+
+def observe(name, value):
+    """Record ``value`` (milliseconds) in the histogram called ``name``."""
+    scope = _scope.get()
+    if scope is not None:
+        scope.timings[name] += value
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+            _rolling[name] = RollingHistogram()
+        histogram.observe(value)
+        _rolling[name].observe(value)
+
+
+def counters(prefix=''):
+    """Return a snapshot of every counter whose name starts with ``prefix``."""
+    with _lock:
+        return {name: value for name, value in _counters.items() if name.startswith(prefix)}
+
+
+def histograms(prefix='', window=None):
+    """Return summary statistics for every histogram whose name starts with ``prefix``.
+
+    With ``window`` (seconds, at most ``WINDOW``) only the recent observations count.
+    """
+    with _lock:
+        if window is None:
+            return {name: h.snapshot() for name, h in _histograms.items() if name.startswith(prefix)}
+        now = time.monotonic()
+        return {
+            name: h.histogram(window, now).snapshot() for name, h in _rolling.items() if name.startswith(prefix)
+        }
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _rolling.clear()
@@ -0,0 +1,120 @@
+"""Sending catalog and reporting reads to read replicas.
+
+``ReplicaRouter`` reads the catalog (products, categories, the search
+index) and the sales rollups from a random alias in
+``settings.DATABASE_REPLICAS``; everything else, and every write, goes to
+``default``. Replicas lag, so a client that has just written must not read
+its change back from one: ``ReadYourWritesMiddleware`` notes any write made
+while serving a request and sets a cookie that keeps that client's reads on
+the primary for ``READ_YOUR_WRITES_SECONDS``. Reads inside a transaction on
+the primary stay there too. Large reporting scans of tables that are not
+routed (orders, payments) opt in with ``.using(read_alias())``.
+"""
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_MODELS = {
+    'products.product',
+    'products.productcategory',
+    'search.term',
+    'search.document',
+    'search.posting',
+    'orders.dailysales',
+    'orders.productsales',
+}
+# Writes to these don't change anything a client reads back from a replica.
+UNPINNED_MODELS = {'sessions.session'}
+PIN_COOKIE = 'primary_reads'
+
+
+class _RequestState:
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.wrote = False
+
+
+_state = ContextVar('replica_routing', default=None)
+
+
+def replica_alias():
+    replicas = settings.DATABASE_REPLICAS
+    return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+
+def read_alias():
+    """Where a read that can tolerate replication lag should go.
+
+    A replica, unless the current client is pinned to the primary or the
+    primary has a transaction open (whose changes a replica can't see).
+    """
+    state = _state.get()
+    if (state is not None and state.pinned) or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return DEFAULT_DB_ALIAS
+    return replica_alias()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower not in REPLICA_MODELS:
+            return DEFAULT_DB_ALIAS
+        return read_alias()
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and model._meta.label_lower not in UNPINNED_MODELS:
+            state.wrote = state.pinned = True
+        # Explicit, or Django would write an instance back to the replica it was read from.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReadYourWritesMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = _RequestState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(state, response)
+
+    async def __acall__(self, request):
+        state = _RequestState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(state, response)
+
+    def finish(self, state, response):
+        if state.wrote and settings.DATABASE_REPLICAS:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.READ_YOUR_WRITES_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
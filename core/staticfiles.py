@@ -0,0 +1,186 @@
+"""Hashed, precompressed static files served with far-future cache headers.
+
+``collectstatic`` with ``CompressedManifestStaticFilesStorage`` copies each
+file under a name containing a hash of its content (``app.3f2a9c1b.css``),
+records the mapping in ``staticfiles.json`` for ``{% static %}``, and writes
+gzip and, when the ``brotli`` package is installed, Brotli copies next to
+every compressible file. A hashed name never changes content, so
+``StaticFilesMiddleware`` serves it as ``immutable`` for a year, picking the
+smallest encoding the client accepts; other names are cached for
+``STATIC_MAX_AGE`` seconds. Small files are kept in memory after their first
+request, so serving them again does no file I/O (under ASGI the middleware
+runs on the event loop). A reverse proxy in front can serve ``STATIC_ROOT``
+itself the same way (nginx: ``gzip_static``/``brotli_static``, and
+``expires max`` for hashed names).
+"""
+import gzip
+import mimetypes
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.http import FileResponse, HttpResponse, HttpResponseNotAllowed, HttpResponseNotFound
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = {'.css', '.js', '.mjs', '.map', '.json', '.svg', '.txt', '.html', '.xml', '.ico', '.ttf', '.otf', '.eot'}
+# Keep a compressed copy only if it saves at least this fraction of the file.
+MIN_SAVING = 0.05
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Files up to this size are held in memory once requested; larger ones are streamed from disk.
+MAX_CACHED_BYTES = 512 * 1024
+# Best first.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def compress(path):
+    """Write ``path.gz`` and ``path.br`` next to ``path`` where they are worth it."""
+    with open(path, 'rb') as f:
+        content = f.read()
+    variants = [('.gz', lambda: gzip.compress(content, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', lambda: brotli.compress(content)))
+    for suffix, compressor in variants:
+        compressed = compressor()
+        if len(compressed) <= len(content) * (1 - MIN_SAVING):
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        names = {*paths, *self.hashed_files.values()}
+        files = [self.path(name) for name in names if os.path.splitext(name)[1].lower() in COMPRESSIBLE]
+        # zlib and brotli release the GIL, so threads compress in parallel.
+        with ThreadPoolExecutor() as pool:
+            list(pool.map(compress, files))
+
+    def stored_name(self, name):
+        if not self.hashed_files:
+            # collectstatic has not run here (tests, a fresh checkout): there are no hashed names yet.
+            return name
+        return super().stored_name(name)
+
+
+def _accepted(header):
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        if params.replace(' ', '').lower() in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+class _Asset:
+    def __init__(self, path, immutable):
+        self.path = path
+        self.cache_control = IMMUTABLE if immutable else f'public, max-age={settings.STATIC_MAX_AGE}'
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        stat = os.stat(path)
+        self.etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        self.last_modified = http_date(stat.st_mtime)
+        self.variants = {None: (path, stat.st_size)}
+        for encoding, suffix in ENCODINGS:
+            if os.path.isfile(path + suffix):
+                self.variants[encoding] = (path + suffix, os.path.getsize(path + suffix))
+        self.contents = {}
+
+    def variant(self, accept_encoding):
+        accepted = _accepted(accept_encoding) if len(self.variants) > 1 else ()
+        for encoding, _ in ENCODINGS:
+            if encoding in self.variants and encoding in accepted:
+                return encoding
+        return None
+
+    def response(self, request):
+        encoding = self.variant(request.headers.get('Accept-Encoding', ''))
+        etag = self.etag if encoding is None else f'{self.etag[:-1]}-{encoding}"'
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponse(status=304)
+        else:
+            path, size = self.variants[encoding]
+            if request.method == 'HEAD':
+                response = HttpResponse(content_type=self.content_type)
+                response['Content-Length'] = size
+            elif size > MAX_CACHED_BYTES:
+                response = FileResponse(open(path, 'rb'), content_type=self.content_type)
+            else:
+                if encoding not in self.contents:
+                    with open(path, 'rb') as f:
+                        self.contents[encoding] = f.read()
+                response = HttpResponse(self.contents[encoding], content_type=self.content_type)
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        response['Last-Modified'] = self.last_modified
+        response['Cache-Control'] = self.cache_control
+        response['X-Content-Type-Options'] = 'nosniff'
+        if len(self.variants) > 1:
+            response['Vary'] = 'Accept-Encoding'
+        return response
+
+
+class StaticFilesMiddleware:
+    """Serve ``STATIC_ROOT`` at ``STATIC_URL`` without going through URL routing, sessions or the database.
+
+    Not used with ``DEBUG``, where ``runserver`` serves static files from the apps directly.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if settings.DEBUG or not settings.STATIC_ROOT:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.prefix = urlsplit(settings.STATIC_URL).path
+        self.root = str(settings.STATIC_ROOT)
+        self.immutable = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+        self.assets = {}
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if request.path.startswith(self.prefix):
+            return self.serve(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if request.path.startswith(self.prefix):
+            return self.serve(request)
+        return await self.get_response(request)
+
+    def serve(self, request):
+        if request.method not in ('GET', 'HEAD'):
+            return HttpResponseNotAllowed(['GET', 'HEAD'])
+        asset = self.asset(request.path[len(self.prefix):])
+        if asset is None:
+            return HttpResponseNotFound()
+        return asset.response(request)
+
+    def asset(self, name):
+        asset = self.assets.get(name)
+        if asset is not None:
+            return asset
+        try:
+            path = safe_join(self.root, name)
+        except SuspiciousFileOperation:
+            return None
+        if not name or not os.path.isfile(path):
+            return None
+        asset = self.assets[name] = _Asset(path, immutable=name in self.immutable)
+        return asset
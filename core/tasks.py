@@ -0,0 +1,144 @@
+"""A small task queue kept in the database.
+
+Decorate a module-level function with ``@task`` and call ``.enqueue(...)``
+to run it later in a ``run_tasks`` worker instead of in the request::
+
+    @task(priority=10, max_attempts=3)
+    def send_receipt(order_id):
+        ...
+
+    send_receipt.enqueue(order.id, dedup_key=f'receipt:{order.id}')
+
+Tasks are ``Task`` rows, so enqueueing inside a transaction only takes
+effect if it commits. Workers claim the most urgent due tasks with
+``SKIP LOCKED`` and lease them by pushing ``run_at`` forward by the task's
+``timeout`` (the visibility timeout): a task whose worker died becomes due
+again once the lease runs out. A failure is retried with exponential
+backoff until ``max_attempts``. A ``dedup_key`` keeps the same work from
+waiting in the queue twice; the key is released when a worker claims the
+task. Arguments must be JSON-serialisable.
+"""
+import logging
+import random
+import time
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import metrics
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 300
+DEFAULT_RETRY_DELAY = 10
+BATCH_SIZE = 10
+
+
+class TaskFunction:
+    """A function the queue can run; made by ``@task``."""
+
+    def __init__(self, func, priority, max_attempts, timeout, retry_delay):
+        self.func = func
+        self.name = f'{func.__module__}.{func.__qualname__}'
+        self.priority = priority
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self.__doc__ = func.__doc__
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def enqueue(self, *args, dedup_key=None, priority=None, delay=None, **kwargs):
+        """Queue a call; returns the ``Task``, or ``None`` if one with ``dedup_key`` is already waiting."""
+        fields = {
+            'name': self.name,
+            'payload': {'args': list(args), 'kwargs': kwargs},
+            'priority': self.priority if priority is None else priority,
+            'max_attempts': self.max_attempts,
+            'run_at': timezone.now() + timedelta(seconds=delay or 0),
+        }
+        if dedup_key is None:
+            return Task.objects.create(**fields)
+        try:
+            with transaction.atomic():
+                return Task.objects.create(dedup_key=dedup_key, **fields)
+        except IntegrityError:
+            metrics.incr('tasks.deduplicated')
+            return None
+
+    def backoff(self, attempts):
+        # Full jitter, so tasks that failed together don't all retry together.
+        return random.uniform(0, self.retry_delay * 2 ** (attempts - 1))
+
+
+def task(func=None, *, priority=0, max_attempts=5, timeout=DEFAULT_TIMEOUT, retry_delay=DEFAULT_RETRY_DELAY):
+    """Make ``func`` a task. Higher ``priority`` runs first; ``timeout`` is the lease in seconds."""
+    def decorator(func):
+        return TaskFunction(func, priority, max_attempts, timeout, retry_delay)
+    return decorator(func) if func is not None else decorator
+
+
+def claim(batch_size=BATCH_SIZE):
+    """Lease up to ``batch_size`` due tasks to this worker, most urgent first."""
+    now = timezone.now()
+    with transaction.atomic():
+        tasks = list(
+            Task.objects.select_for_update(skip_locked=True)
+            .filter(status=Task.QUEUED, run_at__lte=now)
+            .order_by('-priority', 'run_at')[:batch_size]
+        )
+        for t in tasks:
+            function = _function(t)
+            t.attempts += 1
+            t.run_at = now + timedelta(seconds=function.timeout if function else DEFAULT_TIMEOUT)
+            # Work queued from now on may have been missed by this run, so it must be queued afresh.
+            t.dedup_key = None
+        if tasks:
+            Task.objects.bulk_update(tasks, ['attempts', 'run_at', 'dedup_key'])
+    return tasks
+
+
+def _function(t):
+    try:
+        function = import_string(t.name)
+    except ImportError:
+        return None
+    return function if isinstance(function, TaskFunction) else None
+
+
+def run(t):
+    """Run a claimed task and record the outcome. Returns whether it succeeded."""
+    function = _function(t)
+    try:
+        if function is None:
+            raise LookupError(f"No task named {t.name}")
+        if t.attempts > t.max_attempts:
+            raise RuntimeError(f"Lease expired {t.attempts - 1} times; the worker may be crashing")
+        started = time.perf_counter()
+        function(*t.payload.get('args', []), **t.payload.get('kwargs', {}))
+        metrics.observe(f'tasks.{t.name}', (time.perf_counter() - started) * 1000)
+    except Exception as e:
+        metrics.incr('tasks.failures')
+        if function is None or t.attempts >= t.max_attempts:
+            logger.error(f"Task {t.name} ({t.id}) failed for good after {t.attempts} attempt(s): {e}")
+            Task.objects.filter(id=t.id).update(status=Task.FAILED, last_error=str(e))
+        else:
+            logger.warning(f"Task {t.name} ({t.id}) failed, will retry: {e}")
+            retry_at = timezone.now() + timedelta(seconds=function.backoff(t.attempts))
+            Task.objects.filter(id=t.id).update(run_at=retry_at, last_error=str(e))
+        return False
+    Task.objects.filter(id=t.id).delete()
+    metrics.incr('tasks.done')
+    return True
+
+
+def run_pending(batch_size=BATCH_SIZE):
+    """Claim and run one batch. Returns the number of tasks claimed."""
+    tasks = claim(batch_size)
+    for t in tasks:
+        run(t)
+    return len(tasks)
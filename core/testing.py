@@ -0,0 +1,413 @@
+"""Local stand-ins for external services, used by the test suite and benchmarks, and test assertions."""
+import fnmatch
+import json
+import socketserver
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from .instrumentation import Budget
+
+
+class LocalRedisServer:
+    """A small in-memory server speaking the Redis protocol (RESP2).
+
+    It implements the commands Django's ``RedisCache`` backend and the
+    ``redis`` client issue (strings, counters, expiry, MULTI/EXEC), which is
+    enough to run the shared cache configuration in tests without a Redis
+    installation. Use it as a context manager; ``url`` is a ``redis://`` URL.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.data = {}
+        self.expires = {}
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                session = {'queue': None}
+                while True:
+                    try:
+                        command = server._read_command(self.rfile)
+                    except (ConnectionError, ValueError):
+                        return
+                    if command is None:
+                        return
+                    self.wfile.write(server._dispatch(command, session))
+
+        self._server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f'redis://{host}:{port}/0'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    # Protocol
+
+    def _read_command(self, rfile):
+        line = rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            return line.split()
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(rfile.readline()[1:])
+            args.append(rfile.read(length + 2)[:-2])
+        return args
+
+    def _encode(self, value):
+        if value is None:
+            return b'$-1\r\n'
+        if isinstance(value, bool):
+            value = int(value)
+        if isinstance(value, int):
+            return b':%d\r\n' % value
+        if isinstance(value, Status):
+            return b'+%s\r\n' % value.encode()
+        if isinstance(value, Error):
+            return b'-%s\r\n' % value.encode()
+        if isinstance(value, list):
+            return b'*%d\r\n' % len(value) + b''.join(self._encode(item) for item in value)
+        if isinstance(value, str):
+            value = value.encode()
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+
+    def _dispatch(self, command, session):
+        name = command[0].decode().upper()
+        args = command[1:]
+        if name == 'MULTI':
+            session['queue'] = []
+            return self._encode(Status('OK'))
+        if name == 'EXEC':
+            queued, session['queue'] = session['queue'] or [], None
+            with self.lock:
+                return self._encode([self._execute(cmd, cmd_args) for cmd, cmd_args in queued])
+        if name == 'DISCARD':
+            session['queue'] = None
+            return self._encode(Status('OK'))
+        if session['queue'] is not None:
+            session['queue'].append((name, args))
+            return self._encode(Status('QUEUED'))
+        with self.lock:
+            return self._encode(self._execute(name, args))
+
+    def _execute(self, name, args):
+        handler = getattr(self, f'_cmd_{name.lower()}', None)
+        if handler is None:
+            return Error(f"ERR unknown command '{name}'")
+        try:
+            return handler(*args)
+        except (TypeError, ValueError):
+            return Error(f"ERR wrong arguments for '{name}' command")
+
+    # Storage
+
+    def _alive(self, key):
+        expires_at = self.expires.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    def _get(self, key):
+        return self.data[key] if self._alive(key) else None
+
+    # Commands
+
+    def _cmd_ping(self, *args):
+        return args[0] if args else Status('PONG')
+
+    def _cmd_select(self, db):
+        return Status('OK')
+
+    def _cmd_client(self, *args):
+        return Status('OK')
+
+    def _cmd_get(self, key):
+        return self._get(key)
+
+    def _cmd_mget(self, *keys):
+        return [self._get(key) for key in keys]
+
+    def _cmd_set(self, key, value, *options):
+        options = [option.decode().upper() if isinstance(option, bytes) else option for option in options]
+        ttl = None
+        nx = 'NX' in options
+        xx = 'XX' in options
+        for unit, scale in (('EX', 1), ('PX', 0.001)):
+            if unit in options:
+                ttl = int(options[options.index(unit) + 1]) * scale
+        exists = self._alive(key)
+        if (nx and exists) or (xx and not exists):
+            return None
+        self.data[key] = value
+        self.expires.pop(key, None)
+        if ttl is not None:
+            self.expires[key] = time.monotonic() + ttl
+        return Status('OK')
+
+    def _cmd_mset(self, *pairs):
+        for key, value in zip(pairs[::2], pairs[1::2]):
+            self.data[key] = value
+            self.expires.pop(key, None)
+        return Status('OK')
+
+    def _cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            if self._alive(key):
+                del self.data[key]
+                self.expires.pop(key, None)
+                removed += 1
+        return removed
+
+    _cmd_unlink = _cmd_del
+
+    def _cmd_exists(self, *keys):
+        return sum(1 for key in keys if self._alive(key))
+
+    def _cmd_expire(self, key, seconds):
+        if not self._alive(key):
+            return 0
+        self.expires[key] = time.monotonic() + int(seconds)
+        return 1
+
+    def _cmd_pexpire(self, key, milliseconds):
+        if not self._alive(key):
+            return 0
+        self.expires[key] = time.monotonic() + int(milliseconds) / 1000
+        return 1
+
+    def _cmd_persist(self, key):
+        if not self._alive(key) or key not in self.expires:
+            return 0
+        del self.expires[key]
+        return 1
+
+    def _cmd_ttl(self, key):
+        if not self._alive(key):
+            return -2
+        if key not in self.expires:
+            return -1
+        return max(0, round(self.expires[key] - time.monotonic()))
+
+    def _cmd_incrby(self, key, delta):
+        value = int(self._get(key) or 0) + int(delta)
+        self.data[key] = str(value).encode()
+        return value
+
+    def _cmd_incr(self, key):
+        return self._cmd_incrby(key, 1)
+
+    def _cmd_decrby(self, key, delta):
+        return self._cmd_incrby(key, -int(delta))
+
+    def _cmd_decr(self, key):
+        return self._cmd_incrby(key, -1)
+
+    def _cmd_keys(self, pattern):
+        pattern = pattern.decode()
+        return [key for key in list(self.data) if self._alive(key) and fnmatch.fnmatchcase(key.decode(), pattern)]
+
+    def _cmd_dbsize(self):
+        return sum(1 for key in list(self.data) if self._alive(key))
+
+    def _cmd_flushdb(self, *args):
+        self.data.clear()
+        self.expires.clear()
+        return Status('OK')
+
+    _cmd_flushall = _cmd_flushdb
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    # Room for many clients connecting at once, as under a load test.
+    request_queue_size = 256
+    daemon_threads = True
+
+
+class LocalPaystackServer:
+    """An in-process HTTP server imitating the parts of the Paystack API we call.
+
+    Seed ``transactions`` with ``add_transaction``. Every request is appended
+    to ``requests`` as ``(method, path)`` and the client ports seen are kept in
+    ``connections``. ``latency`` delays every response and ``fail_next``
+    makes the next few requests fail, to exercise timeouts and retries.
+    Point ``PAYSTACK_API_URL`` at ``url``.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0):
+        self.transactions = {}
+        self.requests = []
+        self.connections = set()
+        self.latency = latency
+        self.failures = []
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                server._handle(self, 'GET')
+
+            def do_POST(self):
+                server._handle(self, 'POST')
+
+        self._server = _HTTPServer((host, port), Handler)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}'
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def add_transaction(self, reference, amount, status='success', **fields):
+        with self.lock:
+            transaction = {
+                'id': len(self.transactions) + 1,
+                'reference': reference,
+                'amount': amount,
+                'status': status,
+                'currency': 'NGN',
+                'createdAt': datetime.now(timezone.utc).isoformat(),
+                **fields,
+            }
+            self.transactions[reference] = transaction
+            return transaction
+
+    def fail_next(self, count=1, status=503, after=0):
+        """Fail the ``count`` requests that follow the next ``after``."""
+        with self.lock:
+            self.failures.extend([None] * after + [status] * count)
+
+    def _handle(self, handler, method):
+        url = urlsplit(handler.path)
+        length = int(handler.headers.get('Content-Length') or 0)
+        body = json.loads(handler.rfile.read(length) or b'{}') if length else {}
+        with self.lock:
+            self.requests.append((method, url.path))
+            self.connections.add(handler.client_address[1])
+            failure = self.failures.pop(0) if self.failures else None
+        if self.latency:
+            time.sleep(self.latency)
+        if failure is not None:
+            status, payload = failure, {'status': False, 'message': 'Injected failure'}
+        else:
+            status, payload = self.respond(method, url.path, parse_qs(url.query), body)
+        data = json.dumps(payload).encode()
+        try:
+            handler.send_response(status)
+            handler.send_header('Content-Type', 'application/json')
+            handler.send_header('Content-Length', str(len(data)))
+            handler.end_headers()
+            handler.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client gave up, e.g. after a read timeout.
+
+    def respond(self, method, path, query, body):
+        """Return ``(status code, JSON body)`` for a request."""
+        if method == 'GET' and path.startswith('/transaction/verify/'):
+            reference = unquote(path.rsplit('/', 1)[1])
+            with self.lock:
+                transaction = self.transactions.get(reference)
+            if transaction is None:
+                return 404, {'status': False, 'message': 'Transaction reference not found'}
+            return 200, {'status': True, 'message': 'Verification successful', 'data': transaction}
+        if method == 'GET' and path == '/transaction':
+            return 200, self._list(query)
+        if method == 'POST' and path == '/transaction/initialize':
+            reference = body.get('reference')
+            with self.lock:
+                if reference in self.transactions:
+                    return 400, {'status': False, 'message': 'Duplicate Transaction Reference'}
+            transaction = self.add_transaction(reference, body.get('amount'), status='abandoned', email=body.get('email'))
+            access_code = f"ac_{transaction['id']}"
+            return 200, {'status': True, 'message': 'Authorization URL created', 'data': {
+                'authorization_url': f'{self.url}/checkout/{access_code}',
+                'access_code': access_code,
+                'reference': reference,
+            }}
+        return 404, {'status': False, 'message': f'No stand-in for {method} {path}'}
+
+    def _list(self, query):
+        """``GET /transaction``: newest first, filtered by ``status`` and a ``from``/``to`` range on ``createdAt``."""
+        def param(name, default=None):
+            return query.get(name, [default])[0]
+
+        per_page, page = int(param('perPage', 50)), int(param('page', 1))
+        start, end = param('from'), param('to')
+        with self.lock:
+            matches = [
+                t for t in sorted(self.transactions.values(), key=lambda t: t['id'], reverse=True)
+                if (param('status') is None or t['status'] == param('status'))
+                and (start is None or datetime.fromisoformat(t['createdAt']) >= datetime.fromisoformat(start))
+                and (end is None or datetime.fromisoformat(t['createdAt']) <= datetime.fromisoformat(end))
+            ]
+        return {
+            'status': True,
+            'message': 'Transactions retrieved',
+            'data': matches[(page - 1) * per_page:page * per_page],
+            'meta': {'total': len(matches), 'perPage': per_page, 'page': page,
+                     'pageCount': -(-len(matches) // per_page)},
+        }
+
+
+class Status(str):
+    pass
+
+
+class Error(str):
+    pass
+
+
+class BudgetAssertionsMixin:
+    """``TestCase`` mixin checking a response against its view's ``@budget`` (see ``core.instrumentation``)."""
+
+    def assertWithinBudget(self, response, **limits):
+        """Fail if the request went over the view's declared budget, or over ``limits`` if given."""
+        stats = response.request_stats
+        budget = Budget(**limits) if limits else stats.budget
+        if budget is None:
+            self.fail(f"{stats.view} declares no budget")
+        violations = budget.violations(stats)
+        if violations:
+            queries = '\n'.join(f'  {ms:.1f}ms {sql}' for sql, ms in stats.queries)
+            self.fail(f"{stats.view} over budget: {'; '.join(violations)}\n{queries}")
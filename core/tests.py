@@ -0,0 +1,567 @@
+import asyncio
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.templatetags.static import static
+from django.http import HttpResponse
+from django.contrib.sessions.models import Session
+from django.db import connections
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, reverse
+from django.utils import timezone
+
+from orders.models import Order
+from products.models import Product, ProductCategory
+from . import metrics
+from .cache import aget_or_compute, cached, get_or_compute, invalidate_tags, stats, tag_version
+from .db.pool import ConnectionPool, PoolTimeout
+from .instrumentation import budget
+from .models import Task
+from .routers import PIN_COOKIE, ReadYourWritesMiddleware, ReplicaRouter
+from .tasks import claim, run_pending, task
+from .testing import BudgetAssertionsMixin, LocalRedisServer
+
+
+class Counter:
+    def __init__(self, delay=0):
+        self.calls = 0
+        self.delay = delay
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return 'value'
+
+
+ran = []
+
+
+@task
+def record(value):
+    ran.append(value)
+
+
+@task(max_attempts=2, retry_delay=60)
+def flaky(value):
+    raise RuntimeError(f"flaky {value}")
+
+
+class CacheTestMixin:
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+
+    def test_hit_after_miss(self):
+        compute = Counter()
+        self.assertEqual(get_or_compute('k', compute), 'value')
+        self.assertEqual(get_or_compute('k', compute), 'value')
+        self.assertEqual(compute.calls, 1)
+        self.assertEqual(stats()['misses'], 1)
+        self.assertEqual(stats()['hits'], 1)
+
+    def test_tag_invalidation(self):
+        compute = Counter()
+        get_or_compute('k', compute, tags=['product:1'])
+        get_or_compute('other', compute, tags=['product:2'])
+        before = tag_version('product:1')
+        invalidate_tags('product:1')
+        self.assertGreater(tag_version('product:1'), before)
+        get_or_compute('k', compute, tags=['product:1'])
+        get_or_compute('other', compute, tags=['product:2'])
+        self.assertEqual(compute.calls, 3)
+
+    def test_single_flight(self):
+        compute = Counter(delay=0.2)
+        threads = [threading.Thread(target=get_or_compute, args=('slow', compute)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(compute.calls, 1)
+
+    def test_early_expiry(self):
+        compute = Counter(delay=0.01)
+        get_or_compute('k', compute, timeout=60, beta=1e6)
+        get_or_compute('k', compute, timeout=60, beta=1e6)
+        self.assertEqual(compute.calls, 2)
+        self.assertEqual(stats()['early_refreshes'], 1)
+
+    def test_cached_decorator(self):
+        compute = Counter()
+
+        @cached('order:{order_id}:summary', tags=['order:{order_id}'])
+        def summary(order_id):
+            return compute()
+
+        summary(order_id=1)
+        summary(order_id=1)
+        invalidate_tags('order:1')
+        summary(order_id=1)
+        self.assertEqual(compute.calls, 2)
+
+
+    async def test_async_single_flight_shares_entries(self):
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.1)
+            return 'value'
+
+        values = await asyncio.gather(*(aget_or_compute('async', compute, tags=['t']) for _ in range(5)))
+        self.assertEqual(values, ['value'] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(get_or_compute('async', Counter(), tags=['t']), 'value')
+
+
+class LocalCacheTests(CacheTestMixin, SimpleTestCase):
+    pass
+
+
+class SharedCacheTests(CacheTestMixin, SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalRedisServer().start()
+        cls.enterClassContext(override_settings(CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                'LOCATION': cls.server.url,
+            }
+        }))
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.server.stop()
+
+
+@budget(queries=1)
+def one_query_per_user(request):
+    User = get_user_model()
+    for pk in User.objects.values_list('pk', flat=True):
+        User.objects.get(pk=pk)
+    return HttpResponse('ok')
+
+
+@budget(queries=1)
+async def cached_user_count(request):
+    count = await aget_or_compute('test:user_count', get_user_model().objects.acount)
+    return HttpResponse(str(count))
+
+
+def category_count(request):
+    return HttpResponse(str(ProductCategory.objects.count()))
+
+
+def add_category(request):
+    ProductCategory.objects.create(name=request.POST['name'])
+    return HttpResponse('ok')
+
+
+urlpatterns = [
+    path('n-plus-one/', one_query_per_user, name='n_plus_one'),
+    path('categories/count/', category_count, name='category_count'),
+    path('categories/add/', add_category, name='add_category'),
+    path('count/', cached_user_count, name='count'),
+    path('metrics/', include('core.urls')),
+]
+
+
+class RollingHistogramTests(SimpleTestCase):
+    def test_window_drops_old_observations(self):
+        histogram = metrics.RollingHistogram(window=300, slot=10)
+        histogram.observe(5, now=0)
+        histogram.observe(50, now=100)
+        self.assertEqual(histogram.histogram(60, now=100).count, 1)
+        self.assertEqual(histogram.histogram(300, now=100).snapshot()['max'], 50)
+        self.assertEqual(histogram.histogram(300, now=400).count, 0)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'], READ_YOUR_WRITES_SECONDS=5)
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.reads = []
+
+    def serve(self, write=None, cookies=None):
+        def view(request):
+            if write is not None:
+                self.router.db_for_write(write)
+            self.reads.append(self.router.db_for_read(Product))
+            return HttpResponse('ok')
+
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies or {})
+        return ReadYourWritesMiddleware(view)(request)
+
+    def test_catalog_reads_use_replicas_and_writes_the_primary(self):
+        self.assertIn(self.router.db_for_read(Product), {'replica1', 'replica2'})
+        self.assertEqual(self.router.db_for_read(Order), 'default')
+        self.assertEqual(self.router.db_for_write(Product), 'default')
+
+    def test_a_write_pins_the_client_to_the_primary(self):
+        response = self.serve(write=Order)
+        self.assertEqual(self.reads, ['default'])
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 5)
+
+        self.serve(cookies={PIN_COOKIE: '1'})
+        self.serve()
+        self.assertEqual(self.reads[1], 'default')
+        self.assertIn(self.reads[2], {'replica1', 'replica2'})
+
+    def test_session_writes_do_not_pin(self):
+        response = self.serve(write=Session)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        self.assertIn(self.reads[0], {'replica1', 'replica2'})
+
+
+@skipUnless(
+    'replica1' in settings.DATABASES,
+    "needs a replica1 alias: run with DB_REPLICA_HOSTS set to the primary's host (it mirrors default in tests)",
+)
+@override_settings(ROOT_URLCONF='core.tests', DATABASE_REPLICAS=['replica1'], READ_YOUR_WRITES_SECONDS=5)
+class ReplicaDatabaseTests(TransactionTestCase):
+    """Routing through real connections. Not a TestCase: reads inside its transaction would stay on the primary."""
+    # The runner sets up every class's databases, skipped or not.
+    databases = {'default', 'replica1'} if 'replica1' in settings.DATABASES else {'default'}
+
+    def count(self):
+        with CaptureQueriesContext(connections['default']) as primary:
+            with CaptureQueriesContext(connections['replica1']) as replica:
+                response = self.client.get(reverse('category_count'))
+        return response, len(primary), len(replica)
+
+    def test_catalog_reads_use_the_replica_until_the_client_writes(self):
+        response, on_primary, on_replica = self.count()
+        self.assertEqual((on_primary, on_replica), (0, 1))
+        self.assertEqual(response.content, b'0')
+
+        with CaptureQueriesContext(connections['replica1']) as replica:
+            response = self.client.post(reverse('add_category'), {'name': 'Lamps'})
+        self.assertEqual(len(replica), 0)
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        response, on_primary, on_replica = self.count()
+        self.assertEqual((on_primary, on_replica), (1, 0))
+        self.assertEqual(response.content, b'1')
+
+
+@override_settings(ROOT_URLCONF='core.tests', SERVER_TIMING=True, METRICS_TOKEN='secret')
+class InstrumentationTests(BudgetAssertionsMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        for n in range(3):
+            User.objects.create_user(username=f'user{n}', email=f'user{n}@example.com', password='pw')
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+
+    async def test_async_view_reports_queries_and_cache(self):
+        response = await self.async_client.get(reverse('count'))
+        self.assertWithinBudget(response)
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('1 queries, 0 repeated', response['Server-Timing'])
+        self.assertIn('cache;desc="0 hits, 1 misses"', response['Server-Timing'])
+
+        response = await self.async_client.get(reverse('count'))
+        self.assertWithinBudget(response, queries=0)
+        self.assertIn('cache;desc="1 hits, 0 misses"', response['Server-Timing'])
+
+    def test_repeated_queries_go_over_budget(self):
+        with self.assertLogs('core.instrumentation', 'WARNING') as logs:
+            response = self.client.get(reverse('n_plus_one'))
+        self.assertIn('2 repeated queries > 0', logs.output[0])
+        self.assertEqual(response.request_stats.duplicate_count, 2)
+        with self.assertRaises(AssertionError):
+            self.assertWithinBudget(response)
+        self.assertEqual(metrics.counters('view.n_plus_one.')['view.n_plus_one.over_budget'], 1)
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('count'))
+        self.assertEqual(self.client.get(reverse('core:metrics')).status_code, 403)
+
+        response = self.client.get(reverse('core:metrics'), {'window': 60}, HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.json()['window'], 60)
+        self.assertEqual(response.json()['histograms']['view.count']['count'], 1)
+
+        staff = get_user_model().objects.create_user(username='staff', password='pw', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('core:metrics'), {'prefix': 'cache.'})
+        self.assertEqual(response.json()['counters']['cache.misses'], 1)
+
+
+class SeedAndBenchTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        self.enterContext(override_settings(MEDIA_ROOT=media, PRODUCT_IMAGE_CACHE_DIR=f'{media}/derivatives'))
+        self.baseline = f'{media}/baseline.json'
+        cache.clear()
+
+    def bench(self, **options):
+        call_command('bench', requests=6, concurrency=1, warmup=1, stdout=StringIO(), stderr=StringIO(), **options)
+
+    def test_bench_diffs_against_a_saved_baseline(self):
+        call_command('seed', users=6, products=30, images=1, carts=4, orders=40, stdout=StringIO())
+        self.assertEqual(get_user_model().objects.filter(username__startswith='seed-').count(), 6)
+
+        self.bench(save_baseline=self.baseline)
+        with open(self.baseline) as f:
+            saved = json.load(f)
+        for scenario, result in saved['results'].items():
+            self.assertEqual(result['errors'], 0, scenario)
+            self.assertGreater(result['queries'], 0, scenario)
+
+        # Against a baseline that needed fewer queries the cart now looks like a regression.
+        saved['results']['cart']['queries'] -= 1
+        with open(self.baseline, 'w') as f:
+            json.dump(saved, f)
+        with self.assertRaisesMessage(CommandError, '1 scenario(s) regressed'):
+            self.bench(scenarios=['cart'], baseline=self.baseline)
+
+
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        ran.clear()
+
+    def test_runs_most_urgent_first_and_deletes_done_tasks(self):
+        record.enqueue('low', priority=-1)
+        record.enqueue('normal')
+        record.enqueue('high', priority=5)
+        record.enqueue('later', delay=3600)
+        self.assertEqual(run_pending(), 3)
+        self.assertEqual(ran, ['high', 'normal', 'low'])
+        self.assertEqual(list(Task.objects.values_list('payload', flat=True)), [{'args': ['later'], 'kwargs': {}}])
+
+    def test_dedup_key_allows_one_waiting_task(self):
+        self.assertIsNotNone(record.enqueue(1, dedup_key='k'))
+        self.assertIsNone(record.enqueue(2, dedup_key='k'))
+        claim()
+        # Claimed work may already have read its inputs, so the key is free again.
+        self.assertIsNotNone(record.enqueue(3, dedup_key='k'))
+
+    def test_failures_back_off_then_fail_for_good(self):
+        t = flaky.enqueue('x')
+        run_pending()
+        t.refresh_from_db()
+        self.assertEqual((t.status, t.attempts, t.last_error), (Task.QUEUED, 1, 'flaky x'))
+        self.assertGreater(t.run_at, timezone.now() - timedelta(seconds=1))
+        Task.objects.update(run_at=timezone.now())
+        run_pending()
+        t.refresh_from_db()
+        self.assertEqual((t.status, t.attempts), (Task.FAILED, 2))
+        self.assertEqual(run_pending(), 0)
+
+    def test_claimed_task_is_leased_until_its_timeout(self):
+        record.enqueue('once')
+        self.assertEqual(len(claim()), 1)
+        self.assertEqual(claim(), [])
+        # The worker died: once the lease runs out another worker picks the task up.
+        Task.objects.update(run_at=timezone.now())
+        self.assertEqual(run_pending(), 1)
+        self.assertEqual(ran, ['once'])
+
+    def test_unknown_task_fails(self):
+        Task.objects.create(name='core.tests.missing')
+        run_pending()
+        self.assertEqual(Task.objects.get().status, Task.FAILED)
+
+    def test_worker_command(self):
+        for i in range(3):
+            record.enqueue(i)
+        out = StringIO()
+        call_command('run_tasks', processes=1, stdout=out)
+        self.assertIn('Ran 3 task(s)', out.getvalue())
+        self.assertEqual(sorted(ran), [0, 1, 2])
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.alive = True
+
+    def close(self):
+        self.closed = True
+
+
+def check(conn):
+    if not conn.alive:
+        raise OSError("gone")
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def test_reuses_released_connections(self):
+        pool = ConnectionPool(check, max_size=2)
+        conn, reused = pool.acquire(FakeConnection)
+        self.assertFalse(reused)
+        pool.release(conn)
+        self.assertEqual(pool.acquire(FakeConnection), (conn, True))
+        self.assertEqual(pool.stats(), {'max_size': 2, 'size': 1, 'in_use': 1, 'idle': 0})
+
+    def test_waits_for_a_free_connection_then_times_out(self):
+        pool = ConnectionPool(check, max_size=1, timeout=0.05)
+        conn, _ = pool.acquire(FakeConnection)
+        with self.assertRaises(PoolTimeout):
+            pool.acquire(FakeConnection)
+        threading.Timer(0.01, pool.release, [conn]).start()
+        pool.timeout = 5
+        self.assertEqual(pool.acquire(FakeConnection), (conn, True))
+
+    def test_replaces_old_and_broken_connections(self):
+        pool = ConnectionPool(check, max_size=1, max_lifetime=60)
+        conn, _ = pool.acquire(FakeConnection)
+        pool.release(conn)
+        pool._idle[0] = (conn, time.monotonic() - 61, time.monotonic())
+        fresh, reused = pool.acquire(FakeConnection)
+        self.assertTrue(conn.closed)
+        self.assertFalse(reused)
+
+        fresh.alive = False
+        pool.release(fresh)
+        pool._idle[0] = (fresh, time.monotonic(), time.monotonic() - 10)
+        self.assertIsNot(pool.acquire(FakeConnection)[0], fresh)
+        self.assertTrue(fresh.closed)
+        self.assertEqual(pool.stats()['size'], 1)
+
+    def test_discarded_and_failed_connections_free_their_slot(self):
+        pool = ConnectionPool(check, max_size=1, timeout=0)
+        conn, _ = pool.acquire(FakeConnection)
+        pool.release(conn, discard=True)
+        self.assertTrue(conn.closed)
+
+        def refused():
+            raise OSError("refused")
+
+        with self.assertRaises(OSError):
+            pool.acquire(refused)
+        self.assertEqual(pool.stats(), {'max_size': 1, 'size': 0, 'in_use': 0, 'idle': 0})
+        pool.acquire(FakeConnection)
+
+
+class StaticFilesTests(SimpleTestCase):
+    css = 'body { color: #111; }\n' * 200
+
+    def setUp(self):
+        source, self.root = tempfile.mkdtemp(), tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, source)
+        self.addCleanup(shutil.rmtree, self.root)
+        os.makedirs(os.path.join(source, 'css'))
+        with open(os.path.join(source, 'css', 'app.css'), 'w') as f:
+            f.write(self.css)
+        overrides = self.settings(STATICFILES_DIRS=[source], STATIC_ROOT=self.root, DEBUG=False)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        self.url = static('css/app.css')
+
+    def test_collectstatic_stores_hashed_compressed_copies(self):
+        self.assertRegex(self.url, r'^/static/css/app\.[0-9a-f]{12}\.css$')
+        hashed = os.path.join(self.root, self.url[len('/static/'):])
+        with open(hashed + '.gz', 'rb') as f:
+            self.assertEqual(gzip.decompress(f.read()).decode(), self.css)
+        self.assertTrue(os.path.exists(hashed + '.br'))
+
+    def test_hashed_files_are_immutable_and_negotiate_encoding(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['Content-Type'], 'text/css')
+
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+        self.assertEqual(gzip.decompress(response.content).decode(), self.css)
+
+        response = self.client.get(self.url)
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response.content.decode(), self.css)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_unhashed_and_missing_files(self):
+        response = self.client.get('/static/css/app.css')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+        self.assertEqual(self.client.get('/static/css/missing.css').status_code, 404)
+        self.assertEqual(self.client.get('/static/../settings.py').status_code, 404)
+
+
+class MediaServingTests(SimpleTestCase):
+    body = bytes(range(256)) * 40
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        os.makedirs(os.path.join(self.root, 'products'))
+        with open(os.path.join(self.root, 'products', 'poster.png'), 'wb') as f:
+            f.write(self.body)
+        overrides = self.settings(MEDIA_ROOT=self.root, MEDIA_ACCEL='')
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.url = '/media/products/poster.png'
+
+    def test_serves_with_validators_and_conditional_get(self):
+        response = self.client.get(self.url)
+        self.assertEqual(b''.join(response.streaming_content), self.body)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['Content-Length'], str(len(self.body)))
+        self.assertEqual(response['Cache-Control'], 'public, max-age=86400')
+        self.assertFalse(response['ETag'].startswith('W/'))
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+    def test_byte_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.body)}')
+        self.assertEqual(b''.join(response.streaming_content), self.body[100:200])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), self.body[-10:])
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.body)}-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, f'bytes */{len(self.body)}'))
+        # A range of a different version of the file gets the whole of this one.
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    async def test_streams_without_blocking_under_asgi(self):
+        response = await self.async_client.get(self.url, headers={'Range': 'bytes=10-'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), self.body[10:])
+
+    def test_offloads_body_to_the_proxy(self):
+        with self.settings(MEDIA_ACCEL='nginx'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/_media/products/poster.png')
+        self.assertEqual(response.content, b'')
+        self.assertIn('ETag', response)
+        with self.settings(MEDIA_ACCEL='sendfile'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Sendfile'], os.path.realpath(os.path.join(self.root, 'products', 'poster.png')))
+
+    def test_offloaded_names_are_quoted(self):
+        with open(os.path.join(self.root, 'products', 'sale 50% #1?.png'), 'wb') as f:
+            f.write(self.body)
+        with self.settings(MEDIA_ACCEL='nginx'):
+            response = self.client.get('/media/products/sale%2050%25%20%231%3F.png')
+        self.assertEqual(response['X-Accel-Redirect'], '/_media/products/sale%2050%25%20%231%3F.png')
+
+    def test_missing_and_escaping_paths(self):
+        self.assertEqual(self.client.get('/media/products/missing.png').status_code, 404)
+        self.assertEqual(self.client.get('/media/products').status_code, 404)
+        self.assertEqual(self.client.get('/media/..%2Fsecret').status_code, 404)
@@ -0,0 +1,43 @@
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponseForbidden, JsonResponse
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_safe
+
+from . import files, metrics
+from .db import pool
+
+
+def _authorized(request):
+    token = settings.METRICS_TOKEN
+    header = request.headers.get('Authorization', '')
+    if token and hmac.compare_digest(header.encode(), f'Bearer {token}'.encode()):
+        return True
+    return request.user.is_authenticated and request.user.is_staff
+
+
+@never_cache
+def metrics_view(request):
+    """Counters, latency histograms and database pool usage of this process; ``?window=60`` limits histograms to recent seconds."""
+    if not _authorized(request):
+        return HttpResponseForbidden()
+    try:
+        window = min(max(int(request.GET.get('window', metrics.WINDOW)), metrics.SLOT), metrics.WINDOW)
+    except ValueError:
+        window = metrics.WINDOW
+    prefix = request.GET.get('prefix', '')
+    return JsonResponse({
+        'window': window,
+        'counters': metrics.counters(prefix),
+        'histograms': metrics.histograms(prefix, window=window),
+        'db_pools': pool.stats(),
+    })
+
+
+@require_safe
+def media(request, path):
+    """Uploaded files from ``MEDIA_ROOT``, offloaded to the front proxy when ``MEDIA_ACCEL`` is set."""
+    return files.serve_from(
+        request, settings.MEDIA_ROOT, path, cache_control=f'public, max-age={settings.MEDIA_MAX_AGE}',
+    )
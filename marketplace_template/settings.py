@@ -1,6 +1,6 @@
 from pathlib import Path
 import os
-from decouple import config
+from decouple import Csv, config
 from decimal import Decimal
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -11,6 +11,18 @@ ALLOWED_HOSTS = ['localhost', '127.0.0.1']
 
 TAX_RATE = Decimal('0.05')
 
+# Minutes checkout holds stock for an unpaid order before the release_expired_holds sweeper frees it.
+STOCK_HOLD_MINUTES = config('STOCK_HOLD_MINUTES', default=15, cast=int)
+
+# Seconds a rendered catalog page stays cached; product/category changes invalidate it sooner.
+CATALOG_CACHE_TIMEOUT = config('CATALOG_CACHE_TIMEOUT', default=600, cast=int)
+# Seconds a rendered product card stays cached; cards are keyed by product version, so this only bounds memory.
+PRODUCT_CARD_CACHE_TIMEOUT = config('PRODUCT_CARD_CACHE_TIMEOUT', default=86400, cast=int)
+# Seconds a reverse proxy or CDN may serve an anonymous catalog page before revalidating it.
+CATALOG_SHARED_MAX_AGE = config('CATALOG_SHARED_MAX_AGE', default=60, cast=int)
+# Identifies the deployed code (e.g. a git sha); part of page ETags so a deploy invalidates cached pages.
+RELEASE = config('RELEASE', default='')
+
 INSTALLED_APPS = [
     'django.contrib.admin',
     'django.contrib.auth',
@@ -18,11 +30,13 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    # 'core.apps.CoreConfig',
+    'core.apps.CoreConfig',
     'accounts.apps.AccountsConfig',
     'products.apps.ProductsConfig',
     'orders.apps.OrdersConfig',
     'payments.apps.PaymentsConfig',
+    'search.apps.SearchConfig',
+    'recommendations.apps.RecommendationsConfig',
     'allauth',
     'allauth.account',
     'allauth.socialaccount',
@@ -53,6 +67,10 @@ SOCIALACCOUNT_PROVIDERS = {
 
 
 MIDDLEWARE = [
+    # First, so static files skip the request metrics, sessions and the database.
+    'core.staticfiles.StaticFilesMiddleware',
+    'core.instrumentation.InstrumentationMiddleware',
+    'core.routers.ReadYourWritesMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -65,12 +83,24 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'marketplace_template.urls'
 
+# Send per-request timings (app, db, cache, paystack) to browsers in a Server-Timing header.
+SERVER_TIMING = config('SERVER_TIMING', default=DEBUG, cast=bool)
+# Bearer token that lets a metrics scraper read /metrics/; staff can always read it.
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],  # For shared templates
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Compile each template once per process. Without DEBUG, Django reloads nothing, so a
+            # deploy must restart the workers; with DEBUG, the autoreloader resets the cache on edits.
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -83,17 +113,63 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'marketplace_template.wsgi.application'
 
+# Reuse connections from a bounded per-process pool instead of connecting for every request (see core.db.pool).
+DB_POOL = config('DB_POOL', default=True, cast=bool)
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        'ENGINE': 'core.db.backends.mysql' if DB_POOL else 'django.db.backends.mysql',
         'NAME': config('DB_NAME'),
         'USER': config('DB_USER'),
         'PASSWORD': config('DB_PASSWORD'),
         'HOST': config('DB_HOST'),
         'PORT': config('DB_PORT'),
+        # Connections go back to the pool at the end of each request.
+        'CONN_MAX_AGE': 0,
+        'OPTIONS': {
+            'pool': {
+                # Keep max_size x processes (plus replicas' pools) under MySQL's max_connections.
+                'max_size': config('DB_POOL_SIZE', default=10, cast=int),
+                'timeout': config('DB_POOL_TIMEOUT', default=5.0, cast=float),
+                # Seconds before a connection is replaced; keep it under wait_timeout and any proxy's idle timeout.
+                'max_lifetime': config('DB_POOL_MAX_LIFETIME', default=1800.0, cast=float),
+            },
+        } if DB_POOL else {},
     }
 }
 
+# Hosts of read replicas of the default database (comma-separated). Catalog and reporting reads go to them.
+for n, host in enumerate(config('DB_REPLICA_HOSTS', default='', cast=Csv()), 1):
+    DATABASES[f'replica{n}'] = {**DATABASES['default'], 'HOST': host, 'TEST': {'MIRROR': 'default'}}
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+# Seconds a client's reads stay on the primary after it writes, to cover replication lag.
+READ_YOUR_WRITES_SECONDS = config('READ_YOUR_WRITES_SECONDS', default=10, cast=int)
+
+# Leave CACHE_URL empty for a per-process LRU cache (LocMemCache evicts the
+# least recently used keys once MAX_ENTRIES is reached). Point it at a Redis
+# server, e.g. redis://127.0.0.1:6379/0, to share the cache between workers.
+# CACHE_URL is required with more than one worker process: invalidation only
+# reaches the cache of the process that made the change, so other workers
+# would keep serving stale catalog pages and cart summaries.
+CACHE_URL = config('CACHE_URL', default='')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+            'KEY_PREFIX': 'marketplace',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'marketplace',
+            'OPTIONS': {'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=10000, cast=int)},
+        }
+    }
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -109,12 +185,40 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
+# collectstatic stores hashed, gzip- and brotli-compressed copies (see core.staticfiles).
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'core.staticfiles.CompressedManifestStaticFilesStorage'},
+}
+# Seconds browsers may cache static files whose names carry no content hash; hashed ones are immutable.
+STATIC_MAX_AGE = config('STATIC_MAX_AGE', default=60, cast=int)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Seconds browsers and proxies may cache uploaded media.
+MEDIA_MAX_AGE = config('MEDIA_MAX_AGE', default=86400, cast=int)
+# Let the front proxy send media file bodies (see core.files): 'nginx' (X-Accel-Redirect) or 'sendfile'
+# (X-Sendfile, for Apache or lighttpd). Empty streams them from Django.
+MEDIA_ACCEL = config('MEDIA_ACCEL', default='')
+# The nginx `internal` location aliased to MEDIA_ROOT, for MEDIA_ACCEL = 'nginx'.
+MEDIA_ACCEL_PREFIX = config('MEDIA_ACCEL_PREFIX', default='/_media/')
+# Resized product images, named by content hash (see products.images).
+PRODUCT_IMAGE_CACHE_DIR = config('PRODUCT_IMAGE_CACHE_DIR', default=str(MEDIA_ROOT / 'derivatives'))
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Order confirmations and receipts are sent by the run_tasks worker; the console backend just prints them.
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='orders@localhost')
+
 # Stripe settings
 PAYSTACK_PUBLIC_KEY = config('PAYSTACK_PUBLIC_KEY')
 PAYSTACK_SECRET_KEY = config('PAYSTACK_SECRET_KEY')
-PAYSTACK_WEBHOOK_SECRET = config('PAYSTACK_WEBHOOK_SECRET')
\ No newline at end of file
+PAYSTACK_WEBHOOK_SECRET = config('PAYSTACK_WEBHOOK_SECRET')
+PAYSTACK_API_URL = config('PAYSTACK_API_URL', default='https://api.paystack.co')
+PAYSTACK_CONNECT_TIMEOUT = config('PAYSTACK_CONNECT_TIMEOUT', default=3.05, cast=float)
+PAYSTACK_READ_TIMEOUT = config('PAYSTACK_READ_TIMEOUT', default=10.0, cast=float)
+PAYSTACK_MAX_RETRIES = config('PAYSTACK_MAX_RETRIES', default=2, cast=int)
+PAYSTACK_POOL_SIZE = config('PAYSTACK_POOL_SIZE', default=10, cast=int)
+# Consecutive failures before Paystack calls fail fast, and seconds before trying again.
+PAYSTACK_BREAKER_THRESHOLD = config('PAYSTACK_BREAKER_THRESHOLD', default=5, cast=int)
+PAYSTACK_BREAKER_RESET = config('PAYSTACK_BREAKER_RESET', default=30.0, cast=float)
\ No newline at end of file
@@ -1,3 +1,34 @@
 from django.contrib import admin
 
-# Register your models here.
+from core.pagination import EstimatedCountPaginator
+from .models import Order, OrderItem
+
+
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    raw_id_fields = ('product',)
+    extra = 0
+
+
+@admin.register(Order)
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'status', 'total_price', 'created_at')
+    list_filter = ('status',)
+    list_select_related = ('user',)
+    search_fields = ('=id',)
+    ordering = ('-created_at',)
+    autocomplete_fields = ('user',)
+    inlines = (OrderItemInline,)
+    paginator = EstimatedCountPaginator
+    # The "N total" link would count the whole table on every filtered page.
+    show_full_result_count = False
+    actions = ('mark_shipped',)
+
+    def get_queryset(self, request):
+        # Order.__str__ shows the user's email (headings, delete pages, the admin log).
+        return super().get_queryset(request).select_related('user')
+
+    @admin.action(description="Mark selected processing orders as shipped")
+    def mark_shipped(self, request, queryset):
+        shipped = queryset.filter(status=Order.PROCESSING).update(status=Order.SHIPPED)
+        self.message_user(request, f"Marked {shipped} order(s) as shipped; orders that were not processing were left alone.")
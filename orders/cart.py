@@ -0,0 +1,244 @@
+"""Server-side carts.
+
+The session only stores the cart's id. Adding or removing a product is a
+single-row upsert on ``CartLine`` plus an ``F()`` adjustment of
+``Cart.subtotal``; nothing rewrites the whole cart. ``summary()`` is cached
+per cart and invalidated whenever the cart changes or one of its products is
+repriced, so viewing a cart costs one query at most.
+"""
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from core.cache import aget_or_compute, get_or_compute, invalidate_tags
+from products.models import Product
+from .models import Cart, CartLine
+
+SESSION_KEY = 'cart_id'
+SUMMARY_TIMEOUT = 300
+
+
+@dataclass
+class CartSummary:
+    lines: list = field(default_factory=list)
+    subtotal: Decimal = Decimal('0.00')
+
+    @property
+    def tax_amount(self):
+        return self.subtotal * settings.TAX_RATE
+
+    @property
+    def total(self):
+        return self.subtotal + self.tax_amount
+
+    @property
+    def count(self):
+        return sum(line.quantity for line in self.lines)
+
+    def as_mapping(self):
+        """``{product_id: quantity}``, the shape ``orders.services.place_order`` takes."""
+        return {line.product_id: line.quantity for line in self.lines}
+
+    def __bool__(self):
+        return bool(self.lines)
+
+
+def _tag(cart_id):
+    return f'cart:{cart_id}'
+
+
+def _line_totals():
+    return ExpressionWrapper(F('unit_price') * F('quantity'), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+def refresh_subtotals(cart_ids):
+    """Recompute ``subtotal`` from the lines of ``cart_ids`` in one UPDATE and drop their cached summaries."""
+    cart_ids = set(cart_ids)
+    if not cart_ids:
+        return
+    line_sum = (
+        CartLine.objects.filter(cart=OuterRef('pk'))
+        .values('cart')
+        .annotate(total=Sum(_line_totals()))
+        .values('total')
+    )
+    Cart.objects.filter(id__in=cart_ids).update(
+        subtotal=Coalesce(Subquery(line_sum), Value(Decimal('0.00')), output_field=DecimalField(max_digits=12, decimal_places=2)),
+    )
+    invalidate_tags(*(_tag(cart_id) for cart_id in cart_ids))
+
+
+def reprice_product(product):
+    """Bring every cart line for ``product`` up to its current price."""
+    stale = CartLine.objects.filter(product=product).exclude(unit_price=product.price)
+    cart_ids = list(stale.values_list('cart_id', flat=True))
+    if cart_ids:
+        stale.update(unit_price=product.price)
+        refresh_subtotals(cart_ids)
+
+
+def reprice_products(product_ids):
+    """``reprice_product`` for many products: one UPDATE of the stale lines, one of their carts' subtotals."""
+    stale = CartLine.objects.filter(product_id__in=product_ids).exclude(unit_price=F('product__price'))
+    cart_ids = list(stale.values_list('cart_id', flat=True))
+    if cart_ids:
+        price = Product.objects.filter(pk=OuterRef('product_id')).values('price')[:1]
+        CartLine.objects.filter(product_id__in=product_ids, cart_id__in=cart_ids).update(unit_price=Subquery(price))
+        refresh_subtotals(cart_ids)
+
+
+class CartStore:
+    """The current request's cart."""
+
+    def __init__(self, request):
+        self.request = request
+        self.session = request.session
+
+    @property
+    def cart_id(self):
+        cart_id = self.session.get(SESSION_KEY)
+        if cart_id is None and self.request.user.is_authenticated:
+            cart_id = Cart.objects.filter(user=self.request.user).values_list('id', flat=True).first()
+            if cart_id is not None:
+                self.session[SESSION_KEY] = cart_id
+        return cart_id
+
+    def _ensure_cart_id(self):
+        cart_id = self.cart_id
+        if cart_id is None:
+            if self.request.user.is_authenticated:
+                cart, _ = Cart.objects.get_or_create(user=self.request.user)
+            else:
+                cart = Cart.objects.create()
+            cart_id = self.session[SESSION_KEY] = cart.id
+        return cart_id
+
+    def add(self, product, quantity=1):
+        cart_id = self._ensure_cart_id()
+        with transaction.atomic():
+            updated = CartLine.objects.filter(cart_id=cart_id, product=product).update(quantity=F('quantity') + quantity)
+            if not updated:
+                try:
+                    with transaction.atomic():
+                        CartLine.objects.create(cart_id=cart_id, product=product, quantity=quantity, unit_price=product.price)
+                except IntegrityError:
+                    # A concurrent request created the line first.
+                    CartLine.objects.filter(cart_id=cart_id, product=product).update(quantity=F('quantity') + quantity)
+            Cart.objects.filter(id=cart_id).update(subtotal=F('subtotal') + product.price * quantity)
+        invalidate_tags(_tag(cart_id))
+
+    def remove(self, product_id):
+        """Drop the line for ``product_id``; returns the removed line or ``None``."""
+        cart_id = self.cart_id
+        if cart_id is None:
+            return None
+        with transaction.atomic():
+            line = (
+                CartLine.objects.select_for_update(of=('self',))
+                .select_related('product')
+                .filter(cart_id=cart_id, product_id=product_id)
+                .first()
+            )
+            if line is None:
+                return None
+            line.delete()
+            Cart.objects.filter(id=cart_id).update(subtotal=F('subtotal') - line.total)
+        invalidate_tags(_tag(cart_id))
+        return line
+
+    def clear(self):
+        cart_id = self.cart_id
+        if cart_id is None:
+            return
+        with transaction.atomic():
+            CartLine.objects.filter(cart_id=cart_id).delete()
+            Cart.objects.filter(id=cart_id).update(subtotal=Decimal('0.00'))
+        invalidate_tags(_tag(cart_id))
+
+    def summary(self, fresh=False):
+        """The cart's lines and subtotal; ``fresh`` reads them from the database, bypassing the cache.
+
+        Checkout must use ``fresh``: with a per-process cache, another worker's
+        change to the cart does not invalidate this worker's copy.
+        """
+        cart_id = self.cart_id
+        if cart_id is None:
+            return CartSummary()
+        if fresh:
+            return self._load(cart_id)
+        return get_or_compute(
+            f'cart:{cart_id}:summary',
+            lambda: self._load(cart_id),
+            timeout=SUMMARY_TIMEOUT,
+            tags=[_tag(cart_id)],
+        )
+
+    async def acart_id(self):
+        cart_id = await self.session.aget(SESSION_KEY)
+        if cart_id is None:
+            user = await self.request.auser()
+            if user.is_authenticated:
+                cart_id = await Cart.objects.filter(user=user).values_list('id', flat=True).afirst()
+                if cart_id is not None:
+                    await self.session.aset(SESSION_KEY, cart_id)
+        return cart_id
+
+    async def asummary(self):
+        """Async ``summary()``; shares its cache entries."""
+        cart_id = await self.acart_id()
+        if cart_id is None:
+            return CartSummary()
+        return await aget_or_compute(
+            f'cart:{cart_id}:summary',
+            lambda: self._aload(cart_id),
+            timeout=SUMMARY_TIMEOUT,
+            tags=[_tag(cart_id)],
+        )
+
+    def _lines(self, cart_id):
+        return CartLine.objects.filter(cart_id=cart_id).select_related('product', 'cart').order_by('id')
+
+    def _load(self, cart_id):
+        return self._summarize(list(self._lines(cart_id)))
+
+    async def _aload(self, cart_id):
+        return self._summarize([line async for line in self._lines(cart_id)])
+
+    @staticmethod
+    def _summarize(lines):
+        return CartSummary(lines=lines, subtotal=lines[0].cart.subtotal if lines else Decimal('0.00'))
+
+    def merge_into(self, user):
+        """Fold the session's anonymous cart into ``user``'s cart after login."""
+        anonymous_id = self.session.get(SESSION_KEY)
+        user_cart_id = Cart.objects.filter(user=user).values_list('id', flat=True).first()
+        if anonymous_id is None or anonymous_id == user_cart_id:
+            if user_cart_id is not None:
+                self.session[SESSION_KEY] = user_cart_id
+            return
+        if not Cart.objects.filter(id=anonymous_id, user__isnull=True).exists():
+            # Stale id, or another user's cart: never merge it.
+            self.session.pop(SESSION_KEY, None)
+            if user_cart_id is not None:
+                self.session[SESSION_KEY] = user_cart_id
+            return
+        if user_cart_id is None:
+            Cart.objects.filter(id=anonymous_id).update(user=user)
+            return
+
+        with transaction.atomic():
+            incoming = CartLine.objects.filter(cart_id=anonymous_id)
+            existing = dict(
+                CartLine.objects.filter(cart_id=user_cart_id, product_id__in=incoming.values('product_id'))
+                .values_list('product_id', 'id')
+            )
+            for line in incoming.filter(product_id__in=existing.keys()):
+                CartLine.objects.filter(id=existing[line.product_id]).update(quantity=F('quantity') + line.quantity)
+            incoming.exclude(product_id__in=existing.keys()).update(cart_id=user_cart_id)
+            Cart.objects.filter(id=anonymous_id).delete()
+            refresh_subtotals([user_cart_id])
+        self.session[SESSION_KEY] = user_cart_id
@@ -0,0 +1,128 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Sum
+
+from orders.models import Order, OrderItem, StockReservation
+from orders.services import OutOfStock, place_order
+from products.models import Product
+
+BENCH_PREFIX = 'bench-checkout'
+
+
+class Command(BaseCommand):
+    help = "Run parallel checkouts against a small set of hot products and report throughput and overbooked holds."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help="Number of concurrent checkout threads.")
+        parser.add_argument('--checkouts', type=int, default=400, help="Total number of checkout attempts.")
+        parser.add_argument('--products', type=int, default=5, help="Number of hot products shared by all carts.")
+        parser.add_argument('--stock', type=int, default=100, help="Initial inventory of each hot product.")
+        parser.add_argument('--lines', type=int, default=3, help="Maximum number of lines per cart.")
+        parser.add_argument('--keep', action='store_true', help="Keep the benchmark rows instead of deleting them.")
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            self.stderr.write(self.style.WARNING(
+                "SQLite serialises writers; expect 'database is locked' errors and run this against MySQL."
+            ))
+        users, products = self.setup(options)
+        initial_stock = {p.id: p.inventory for p in products}
+        product_ids = list(initial_stock)
+
+        lock = threading.Lock()
+        outcome = {'ok': 0, 'out_of_stock': 0, 'errors': 0}
+        latencies = []
+
+        def run(n):
+            rng = random.Random(n)
+            lines = rng.randint(1, min(options['lines'], len(product_ids)))
+            cart = {pid: rng.randint(1, 3) for pid in rng.sample(product_ids, lines)}
+            started = time.perf_counter()
+            try:
+                place_order(users[n % len(users)], cart)
+                key = 'ok'
+            except OutOfStock:
+                key = 'out_of_stock'
+            except Exception as e:
+                self.stderr.write(f"checkout {n} failed: {e}")
+                key = 'errors'
+            with lock:
+                outcome[key] += 1
+                latencies.append(time.perf_counter() - started)
+
+        def worker(indexes):
+            try:
+                for n in indexes:
+                    run(n)
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            chunks = [range(w, options['checkouts'], options['workers']) for w in range(options['workers'])]
+            list(pool.map(worker, chunks))
+        elapsed = time.perf_counter() - started
+
+        sold = dict(
+            OrderItem.objects.filter(product_id__in=product_ids)
+            .values_list('product_id')
+            .annotate(total=Sum('quantity'))
+        )
+        held = dict(
+            StockReservation.objects.filter(product_id__in=product_ids, status=StockReservation.HELD)
+            .values_list('product_id')
+            .annotate(total=Sum('quantity'))
+        )
+        oversold = sum(max(0, held.get(pid, 0) - stock) for pid, stock in initial_stock.items())
+        # Every unit ordered should be covered by exactly one hold.
+        drift = sum(abs(sold.get(pid, 0) - held.get(pid, 0)) for pid in product_ids)
+
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] if latencies else 0
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0
+        self.stdout.write(f"backend:        {connection.vendor}")
+        self.stdout.write(f"workers:        {options['workers']}")
+        self.stdout.write(f"attempts:       {options['checkouts']} in {elapsed:.2f}s ({options['checkouts'] / elapsed:.1f}/s)")
+        self.stdout.write(f"orders placed:  {outcome['ok']}")
+        self.stdout.write(f"out of stock:   {outcome['out_of_stock']}")
+        self.stdout.write(f"errors:         {outcome['errors']}")
+        self.stdout.write(f"latency p50:    {p50 * 1000:.1f}ms  p99: {p99 * 1000:.1f}ms")
+        self.stdout.write(f"units held:     {sum(held.values())} of {sum(initial_stock.values())}")
+        style = self.style.SUCCESS if oversold == drift == 0 else self.style.ERROR
+        self.stdout.write(style(f"oversold units: {oversold}"))
+        self.stdout.write(style(f"unheld units:   {drift}"))
+
+        if not options['keep']:
+            self.teardown()
+
+    def setup(self, options):
+        self.teardown()
+        User = get_user_model()
+        users = [
+            User.objects.create(username=f'{BENCH_PREFIX}-{n}', email=f'{BENCH_PREFIX}-{n}@example.com')
+            for n in range(options['workers'])
+        ]
+        products = Product.objects.bulk_create([
+            Product(
+                name=f'{BENCH_PREFIX} product {n}',
+                description='Benchmark product',
+                price=Decimal('10.00') + n,
+                inventory=options['stock'],
+            )
+            for n in range(options['products'])
+        ])
+        if not all(p.pk for p in products):
+            products = list(Product.objects.filter(name__startswith=BENCH_PREFIX).order_by('id'))
+        return users, products
+
+    def teardown(self):
+        Order.objects.filter(user__username__startswith=BENCH_PREFIX).delete()
+        Product.objects.filter(name__startswith=BENCH_PREFIX).delete()
+        get_user_model().objects.filter(username__startswith=BENCH_PREFIX).delete()
@@ -0,0 +1,165 @@
+import random
+import re
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from orders.models import Order, OrderItem
+from products.models import Product
+
+BENCH_PREFIX = 'bench-orders'
+STATUS_WEIGHTS = {
+    Order.PENDING: 5,
+    Order.PROCESSING: 10,
+    Order.SHIPPED: 10,
+    Order.DELIVERED: 70,
+    Order.CANCELLED: 5,
+}
+
+
+def unindexed_steps(plan, table):
+    """Return the lines of an ``EXPLAIN`` plan that scan all of ``table`` or sort outside an index."""
+    steps = []
+    for line in plan.splitlines():
+        if connection.vendor == 'mysql':
+            columns = line.split('\t')
+            if (table in columns and 'ALL' in columns) or 'Using filesort' in line:
+                steps.append(line)
+        elif connection.vendor == 'postgresql':
+            if f'Seq Scan on {table}' in line or 'Sort Key' in line:
+                steps.append(line)
+        elif re.search(rf'\bSCAN {table}\b(?! USING)', line) or 'TEMP B-TREE FOR ORDER BY' in line:
+            steps.append(line)
+    return steps
+
+
+class Command(BaseCommand):
+    help = "Seed a large order table and check that order history and admin queries stay on indexes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1_000_000, help="Number of orders to seed.")
+        parser.add_argument('--users', type=int, default=10_000, help="Number of customers the orders are spread over.")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows per INSERT while seeding.")
+        parser.add_argument('--repeat', type=int, default=20, help="Timed runs per query.")
+        parser.add_argument('--teardown', action='store_true', help="Delete the benchmark rows and exit.")
+
+    def handle(self, *args, **options):
+        if options['teardown']:
+            self.teardown()
+            return
+        users = self.seed(options)
+        # The customer with the longest history is the worst case for the history page.
+        heaviest = (
+            Order.objects.filter(user__username__startswith=BENCH_PREFIX)
+            .values('user').annotate(n=Count('id')).order_by('-n').first()['user']
+        )
+        customer = next(u for u in users if u.pk == heaviest)
+        rare_status = min(STATUS_WEIGHTS, key=STATUS_WEIGHTS.get)
+        queries = [
+            ('history page', Order.objects.filter(user=customer).with_totals().order_by('-created_at', '-id')[:20]),
+            ('history count', Order.objects.filter(user=customer)),
+            ('admin list', Order.objects.select_related('user').order_by('-created_at')[:100]),
+            ('admin status filter', Order.objects.filter(status=rare_status).select_related('user').order_by('-created_at')[:100]),
+            ('admin status count', Order.objects.filter(status=rare_status)),
+            ('webhook lookup', Order.objects.filter(id=Order.objects.latest('id').id)),
+        ]
+
+        table = Order._meta.db_table
+        unindexed = 0
+        self.stdout.write(f"backend: {connection.vendor}, orders: {Order.objects.count()}")
+        for name, queryset in queries:
+            count_only = name.endswith('count')
+            plan = queryset.explain()
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                queryset.count() if count_only else list(queryset.all())
+                timings.append((time.perf_counter() - started) * 1000)
+            steps = unindexed_steps(plan, table)
+            unindexed += bool(steps)
+            style = self.style.ERROR if steps else self.style.SUCCESS
+            self.stdout.write(style(
+                f"{name:<20} median {statistics.median(timings):7.2f}ms  max {max(timings):7.2f}ms  "
+                f"{'NOT INDEXED' if steps else 'index'}"
+            ))
+            if options['verbosity'] > 1 or steps:
+                self.stdout.write(plan)
+        style = self.style.ERROR if unindexed else self.style.SUCCESS
+        self.stdout.write(style(f"queries off index: {unindexed}"))
+
+    def seed(self, options):
+        User = get_user_model()
+        users = list(User.objects.filter(username__startswith=BENCH_PREFIX).order_by('id'))
+        existing = Order.objects.filter(user__username__startswith=BENCH_PREFIX).count()
+        if existing >= options['orders'] and len(users) >= min(options['users'], options['orders']):
+            self.stdout.write(f"Reusing {existing} seeded orders")
+            return users
+        self.teardown()
+
+        User.objects.bulk_create([
+            User(username=f'{BENCH_PREFIX}-{n}', email=f'{BENCH_PREFIX}-{n}@example.com')
+            for n in range(min(options['users'], options['orders']))
+        ], batch_size=options['batch_size'])
+        users = list(User.objects.filter(username__startswith=BENCH_PREFIX).order_by('id'))
+        product = Product.objects.create(name=f'{BENCH_PREFIX} product', description='Benchmark product', price=Decimal('10.00'))
+
+        rng = random.Random(0)
+
+        def customer():
+            # Skewed so a few customers have long histories.
+            if rng.random() < 0.2:
+                return users[min(int(rng.paretovariate(1.2)) - 1, len(users) - 1)]
+            return rng.choice(users)
+
+        statuses, weights = zip(*STATUS_WEIGHTS.items())
+        now = timezone.now()
+        span = timedelta(days=730).total_seconds()
+        # Spread created_at over two years; auto_now_add would stamp every row with now.
+        created_at = Order._meta.get_field('created_at')
+        created_at.auto_now_add = False
+        try:
+            seeded = 0
+            while seeded < options['orders']:
+                size = min(options['batch_size'], options['orders'] - seeded)
+                with transaction.atomic():
+                    orders = Order.objects.bulk_create([
+                        Order(
+                            user=customer(),
+                            created_at=now - timedelta(seconds=rng.random() * span),
+                            total_price=Decimal('10.00'),
+                            tax_amount=Decimal('0.05'),
+                            status=rng.choices(statuses, weights)[0],
+                        )
+                        for _ in range(size)
+                    ])
+                    if not all(o.pk for o in orders):
+                        orders = Order.objects.filter(user__username__startswith=BENCH_PREFIX).order_by('-id')[:size]
+                    OrderItem.objects.bulk_create(
+                        [OrderItem(order=o, product=product, quantity=1, price=product.price) for o in orders],
+                        batch_size=options['batch_size'],
+                    )
+                seeded += size
+                self.stdout.write(f"Seeded {seeded} orders")
+        finally:
+            created_at.auto_now_add = True
+        # Fresh statistics, so the planner sees the table as it now is.
+        with connection.cursor() as cursor:
+            if connection.vendor == 'mysql':
+                cursor.execute(f'ANALYZE TABLE {Order._meta.db_table}')
+            else:
+                cursor.execute('ANALYZE')
+        return users
+
+    def teardown(self):
+        users = get_user_model().objects.filter(username__startswith=BENCH_PREFIX)
+        OrderItem.objects.filter(order__user__in=users).delete()
+        Order.objects.filter(user__in=users).delete()
+        Product.objects.filter(name__startswith=BENCH_PREFIX).delete()
+        users.delete()
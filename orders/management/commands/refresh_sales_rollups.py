@@ -0,0 +1,46 @@
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from orders.models import Order
+from orders.reports import refresh_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the daily sales rollups behind the sales report. By default refreshes the last two days; "
+        "use --since after importing or editing older orders, or --all on first deploy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=2, help="Refresh this many days up to today.")
+        parser.add_argument('--since', help="Refresh every day from this ISO date to today.")
+        parser.add_argument('--all', action='store_true', help="Refresh every day since the first order.")
+        parser.add_argument('--loop', action='store_true', help="Keep refreshing instead of exiting.")
+        parser.add_argument('--interval', type=float, default=300.0, help="Seconds between refreshes (with --loop).")
+
+    def handle(self, *args, **options):
+        while True:
+            end = timezone.localdate()
+            start = self.start(options, end)
+            if start is not None:
+                days = refresh_rollups(start, end)
+                self.stdout.write(self.style.SUCCESS(f"Refreshed sales from {start} to {end}: {days} day(s) with sales."))
+            if not options['loop']:
+                break
+            # Later passes only need to keep the recent days current.
+            options['since'] = options['all'] = None
+            time.sleep(options['interval'])
+
+    def start(self, options, end):
+        if options['all']:
+            first = Order.objects.order_by('created_at').values_list('created_at', flat=True).first()
+            return timezone.localdate(first) if first else None
+        if options['since']:
+            try:
+                return date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError(f"--since must be an ISO date, not {options['since']!r}")
+        return end - timedelta(days=max(1, options['days']) - 1)
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders.reservations import SWEEP_BATCH_SIZE, release_expired
+
+
+class Command(BaseCommand):
+    help = "Expire lapsed stock holds in batches and cancel the unpaid orders they belonged to."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=SWEEP_BATCH_SIZE, help="Holds expired per transaction.")
+        parser.add_argument('--loop', action='store_true', help="Keep sweeping instead of exiting once nothing has lapsed.")
+        parser.add_argument('--interval', type=float, default=30.0, help="Seconds to sleep between sweeps when idle (with --loop).")
+
+    def handle(self, *args, **options):
+        expired = 0
+        while True:
+            swept = release_expired(options['batch_size'])
+            expired += swept
+            if swept:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f"Expired {expired} hold(s)."))
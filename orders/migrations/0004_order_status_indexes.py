@@ -0,0 +1,66 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+STATUSES = {'PENDING', 'PROCESSING', 'SHIPPED', 'DELIVERED', 'CANCELLED'}
+ALIASES = {
+    'PAID': 'PROCESSING',
+    'SUCCESS': 'PROCESSING',
+    'SUCCEEDED': 'PROCESSING',
+    'COMPLETE': 'DELIVERED',
+    'COMPLETED': 'DELIVERED',
+    'CANCELED': 'CANCELLED',
+}
+
+
+def normalize_statuses(apps, schema_editor):
+    """Map the free-text statuses written so far onto the new choices.
+
+    Runs one UPDATE per distinct stored value, so it does not scale with the
+    number of orders. Values it cannot map are left untouched.
+    """
+    Order = apps.get_model('orders', 'Order')
+    stored = Order.objects.exclude(status__in=STATUSES).values_list('status', flat=True).distinct()
+    for value in list(stored):
+        cleaned = (value or '').strip().upper()
+        status = ALIASES.get(cleaned, cleaned) if cleaned else 'PENDING'
+        if status in STATUSES:
+            Order.objects.filter(status=value).update(status=status)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_cart_cartline'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_statuses, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('PROCESSING', 'Processing'), ('SHIPPED', 'Shipped'), ('DELIVERED', 'Delivered'), ('CANCELLED', 'Cancelled')], default='PENDING', max_length=20),
+        ),
+        # Add the composite index first: MySQL needs an index leading with
+        # user_id to back the foreign key before the single-column one goes.
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'created_at'], name='order_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at'], name='order_created_idx'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -1,24 +1,79 @@
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
-from products.models import Product
+from products.models import Product, ProductCategory
 from decimal import Decimal
 from django.conf import settings
 
+class OrderQuerySet(models.QuerySet):
+    def with_totals(self):
+        """Annotate ``grand_total`` (subtotal + tax) and ``item_count`` in the database.
+
+        ``item_count`` is a correlated subquery rather than a join and GROUP BY,
+        so a sliced, index-ordered listing only counts items for the rows it returns.
+        """
+        quantities = (
+            OrderItem.objects.filter(order=models.OuterRef('pk'))
+            .values('order')
+            .annotate(total=models.Sum('quantity'))
+            .values('total')
+        )
+        return self.annotate(
+            grand_total=models.F('total_price') + models.F('tax_amount'),
+            item_count=Coalesce(models.Subquery(quantities), 0),
+        )
+
+    def with_items(self):
+        """Prefetch line items with their products and a DB-computed ``line_total``."""
+        items = (
+            OrderItem.objects.select_related('product')
+            .annotate(line_total=models.ExpressionWrapper(
+                models.F('price') * models.F('quantity'),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            ))
+            .order_by('id')
+        )
+        return self.prefetch_related(models.Prefetch('items', queryset=items))
+
 class Order(models.Model):
-    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
+    PENDING = 'PENDING'
+    PROCESSING = 'PROCESSING'
+    SHIPPED = 'SHIPPED'
+    DELIVERED = 'DELIVERED'
+    CANCELLED = 'CANCELLED'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (PROCESSING, 'Processing'),
+        (SHIPPED, 'Shipped'),
+        (DELIVERED, 'Delivered'),
+        (CANCELLED, 'Cancelled'),
+    ]
+
+    # Indexed through the (user, created_at) index below, which also serves the history page.
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, db_index=False)
     created_at = models.DateTimeField(auto_now_add=True)
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
-    status = models.CharField(max_length=20, default='PENDING')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
     stripe_payment_id = models.CharField(max_length=100, blank=True, null=True)
     tax_amount = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
 
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='order_user_created_idx'),
+            models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+            # Unfiltered admin and reporting listings, newest first.
+            models.Index(fields=['created_at'], name='order_created_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.tax_amount:
             self.tax_amount = self.total_price * settings.TAX_RATE
         super().save(*args, **kwargs)
 
     def __str__(self):
-        return f"Order {self.id} by {self.user.email}"
+        return f"Order {self.id} by user {self.user_id}"
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
@@ -27,4 +82,105 @@ class OrderItem(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
 
     def __str__(self):
-        return f"{self.quantity} x {self.product.name} in Order {self.order.id}"
\ No newline at end of file
+        return f"{self.quantity} x product {self.product_id} in Order {self.order_id}"
+
+class Cart(models.Model):
+    """A shopping cart. Anonymous carts are found through the session, user carts through ``user``.
+
+    ``subtotal`` is kept up to date incrementally as lines change (see
+    ``orders.cart``) so showing the cart never has to re-add every line.
+    """
+    user = models.OneToOneField(get_user_model(), on_delete=models.CASCADE, null=True, blank=True)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def tax_amount(self):
+        return self.subtotal * settings.TAX_RATE
+
+    def __str__(self):
+        return f"Cart {self.id}"
+
+class CartLine(models.Model):
+    cart = models.ForeignKey(Cart, related_name='lines', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=1)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_product'),
+        ]
+
+    @property
+    def total(self):
+        return self.unit_price * self.quantity
+
+    def __str__(self):
+        return f"{self.quantity} x product {self.product_id} in cart {self.cart_id}"
+
+class StockReservation(models.Model):
+    """Units of a product held for an order until payment confirms them or the hold expires.
+
+    See ``orders.reservations``.
+    """
+    HELD = 'held'
+    CONFIRMED = 'confirmed'
+    EXPIRED = 'expired'
+    STATUS_CHOICES = [
+        (HELD, 'Held'),
+        (CONFIRMED, 'Confirmed'),
+        (EXPIRED, 'Expired'),
+    ]
+
+    order = models.ForeignKey(Order, related_name='reservations', on_delete=models.CASCADE)
+    # Indexed through the (product, status, expires_at) index below.
+    product = models.ForeignKey(Product, related_name='reservations', on_delete=models.CASCADE, db_index=False)
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=HELD)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Summing a product's live holds reads one index range.
+            models.Index(fields=['product', 'status', 'expires_at'], name='reservation_product_idx'),
+            # The sweeper's scan for lapsed holds.
+            models.Index(fields=['status', 'expires_at'], name='reservation_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x product {self.product_id} for order {self.order_id} ({self.status})"
+
+class DailySales(models.Model):
+    """One day of paid orders, rolled up by ``orders.reports.refresh_rollups``."""
+    day = models.DateField(unique=True)
+    orders = models.PositiveIntegerField()
+    revenue = models.DecimalField(max_digits=14, decimal_places=2)
+    tax = models.DecimalField(max_digits=14, decimal_places=2)
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Sales on {self.day}"
+
+class ProductSales(models.Model):
+    """Units and revenue of one product on one day, rolled up with ``DailySales``.
+
+    ``category`` is copied from the product when the day is rolled up, so
+    category totals need no join.
+    """
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, db_index=False)
+    category = models.ForeignKey(ProductCategory, on_delete=models.SET_NULL, null=True, db_index=False)
+    quantity = models.PositiveIntegerField()
+    revenue = models.DecimalField(max_digits=14, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            # Also the index that date-range reports scan.
+            models.UniqueConstraint(fields=['day', 'product'], name='unique_product_sales_day'),
+        ]
+
+    def __str__(self):
+        return f"Product {self.product_id} sales on {self.day}"
@@ -0,0 +1,106 @@
+"""Sales reports from rollup tables.
+
+Aggregating a year of orders and line items on every page view is too slow,
+so ``refresh_rollups`` materialises paid sales per day (``DailySales``) and
+per product per day (``ProductSales``) with GROUP BY queries, replacing the
+days it covers. Reports sum those few rows instead and are cached under the
+``sales`` tag, which every refresh invalidates. The
+``refresh_sales_rollups`` command keeps recent days current.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from core.cache import get_or_compute, invalidate_tags
+from core.routers import read_alias
+from .models import DailySales, Order, OrderItem, ProductSales
+
+# Orders that have been paid for; pending and cancelled orders are not sales.
+PAID = (Order.PROCESSING, Order.SHIPPED, Order.DELIVERED)
+REFRESH_BATCH_DAYS = 31
+TOP_PRODUCTS = 50
+REPORT_CACHE_SECONDS = 600
+
+
+def day_bounds(start, end):
+    """The aware datetimes delimiting the days ``start`` to ``end`` inclusive."""
+    tz = timezone.get_current_timezone()
+    return datetime.combine(start, time.min, tz), datetime.combine(end + timedelta(days=1), time.min, tz)
+
+
+def refresh_rollups(start, end, batch_days=REFRESH_BATCH_DAYS):
+    """Recompute the rollups for the days ``start`` to ``end`` inclusive; returns the days with sales."""
+    days = 0
+    while start <= end:
+        last = min(end, start + timedelta(days=batch_days - 1))
+        days += _refresh(start, last)
+        start = last + timedelta(days=1)
+    return days
+
+
+def _refresh(start, end):
+    lo, hi = day_bounds(start, end)
+    # The GROUP BYs run on a replica when there is one; only the rollup rows are written to the primary.
+    paid = Order.objects.using(read_alias()).filter(status__in=PAID, created_at__gte=lo, created_at__lt=hi).order_by()
+    daily = (
+        paid.annotate(day=TruncDate('created_at'))
+        .values('day')
+        .annotate(orders=Count('id'), revenue=Sum('total_price'), tax=Sum('tax_amount'))
+    )
+    products = (
+        OrderItem.objects.using(paid.db).filter(order__in=paid)
+        .annotate(day=TruncDate('order__created_at'))
+        .values('day', 'product_id', 'product__category_id')
+        .annotate(
+            units=Sum('quantity'),
+            revenue=Sum(F('price') * F('quantity'), output_field=DecimalField(max_digits=14, decimal_places=2)),
+        )
+        .order_by()
+    )
+    daily, products = list(daily), list(products)
+    with transaction.atomic():
+        DailySales.objects.filter(day__range=(start, end)).delete()
+        ProductSales.objects.filter(day__range=(start, end)).delete()
+        rows = DailySales.objects.bulk_create([DailySales(**row) for row in daily])
+        ProductSales.objects.bulk_create([
+            ProductSales(
+                day=row['day'],
+                product_id=row['product_id'],
+                category_id=row['product__category_id'],
+                quantity=row['units'],
+                revenue=row['revenue'],
+            )
+            for row in products
+        ], batch_size=1000)
+        transaction.on_commit(lambda: invalidate_tags('sales'))
+    return len(rows)
+
+
+def sales_report(start, end):
+    """Revenue and tax by day, and revenue and units by category and top product, for ``start`` to ``end``."""
+    return get_or_compute(
+        f'sales-report:{start}:{end}', lambda: _report(start, end), timeout=REPORT_CACHE_SECONDS, tags=('sales',),
+    )
+
+
+def _report(start, end):
+    days = DailySales.objects.filter(day__range=(start, end))
+    products = ProductSales.objects.filter(day__range=(start, end)).order_by()
+    totals = days.aggregate(orders=Sum('orders'), revenue=Sum('revenue'), tax=Sum('tax'), refreshed_at=Max('refreshed_at'))
+    return {
+        'days': list(days.order_by('day').values('day', 'orders', 'revenue', 'tax')),
+        'totals': totals,
+        'categories': list(
+            products.values('category_id', 'category__name')
+            .annotate(units=Sum('quantity'), revenue=Sum('revenue'))
+            .order_by('-revenue')
+        ),
+        'products': list(
+            products.values('product_id', 'product__name')
+            .annotate(units=Sum('quantity'), revenue=Sum('revenue'))
+            .order_by('-revenue')[:TOP_PRODUCTS]
+        ),
+    }
@@ -0,0 +1,165 @@
+"""Stock reservations.
+
+Checkout does not take stock off ``Product.inventory``. It places holds
+(``StockReservation`` rows) that last ``STOCK_HOLD_MINUTES``, and available
+stock is inventory minus the unexpired holds, summed over the
+``(product, status, expires_at)`` index. A successful payment confirms the
+holds and only then decrements inventory. ``release_expired`` (run by the
+``release_expired_holds`` command) marks lapsed holds expired in batches and
+cancels the orders left with nothing held. A hold stops counting the moment
+it lapses, so stock comes back even when the sweeper is behind.
+"""
+import logging
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, PositiveIntegerField, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.cache import invalidate_tags
+from products.models import Product
+from .models import Order, StockReservation
+
+logger = logging.getLogger(__name__)
+
+SWEEP_BATCH_SIZE = 1000
+
+
+def _invalidate_products(product_ids):
+    # Product pages show available stock.
+    tags = [f'product:{product_id}' for product_id in set(product_ids)]
+    transaction.on_commit(lambda: invalidate_tags(*tags))
+
+
+def live_holds(now=None):
+    return StockReservation.objects.filter(status=StockReservation.HELD, expires_at__gt=now or timezone.now())
+
+
+def available_stock(products, now=None):
+    """``{product id: units neither sold nor held}`` for ``products``, using their loaded ``inventory``."""
+    held = dict(
+        live_holds(now).filter(product_id__in=[p.id for p in products])
+        .values('product_id')
+        .annotate(units=Sum('quantity'))
+        .values_list('product_id', 'units')
+    )
+    return {p.id: max(0, p.inventory - held.get(p.id, 0)) for p in products}
+
+
+def with_available(queryset):
+    """Annotate a ``Product`` queryset with ``available`` stock."""
+    held = (
+        live_holds().filter(product=OuterRef('pk'))
+        .values('product')
+        .annotate(units=Sum('quantity'))
+        .values('units')
+    )
+    return queryset.annotate(held=Coalesce(Subquery(held), 0)).annotate(available=Case(
+        When(inventory__gt=F('held'), then=F('inventory') - F('held')),
+        default=Value(0),
+        output_field=PositiveIntegerField(),
+    ))
+
+
+def hold(order, products, quantities, now=None):
+    """Reserve ``quantities`` (``{product_id: units}``) of the locked ``products`` for ``order``.
+
+    Call inside the transaction that locked the product rows. Returns the
+    names of products without enough available stock, creating no holds
+    if there are any.
+    """
+    available = available_stock(products, now)
+    short = [p.name for p in products if available[p.id] < quantities[p.id]]
+    if short:
+        return short
+    expires_at = (now or timezone.now()) + timedelta(minutes=settings.STOCK_HOLD_MINUTES)
+    StockReservation.objects.bulk_create([
+        StockReservation(order=order, product=p, quantity=quantities[p.id], expires_at=expires_at)
+        for p in products
+    ])
+    _invalidate_products(quantities)
+    return []
+
+
+def confirm(order, now=None):
+    """Turn ``order``'s holds into sales by taking their units off inventory.
+
+    Holds that already lapsed are honoured only while the stock is still
+    available, and no hold is confirmed for more than the product's
+    inventory. Returns the names of products that could not be covered;
+    their holds are left unconfirmed.
+    """
+    with transaction.atomic():
+        holds = list(
+            order.reservations.select_for_update()
+            .filter(status__in=(StockReservation.HELD, StockReservation.EXPIRED))
+            .order_by('product_id')
+        )
+        if not holds:
+            return []
+        products = list(
+            Product.objects.select_for_update().filter(id__in=[h.product_id for h in holds]).order_by('id')
+        )
+        now = now or timezone.now()
+        # Live holds were counted against stock when they were made; lapsed ones are not counted
+        # any more and must fit into what is left.
+        available = available_stock(products, now)
+        names = {p.id: p.name for p in products}
+        covered = [h for h in holds if (h.status == StockReservation.HELD and h.expires_at > now)
+                   or available.get(h.product_id, 0) >= h.quantity]
+        # Even a live hold can outgrow inventory that was lowered after it was placed (an admin edit).
+        wanted = {}
+        for h in covered:
+            wanted[h.product_id] = wanted.get(h.product_id, 0) + h.quantity
+        in_stock = {p.id for p in products if p.inventory >= wanted.get(p.id, 0)}
+        covered = [h for h in covered if h.product_id in in_stock]
+        short = [names[h.product_id] for h in holds if h not in covered]
+        if covered:
+            decrement = {h.product_id for h in covered}
+            guard = reduce(or_, (Q(id=product_id, inventory__gte=wanted[product_id]) for product_id in decrement))
+            updated = Product.objects.filter(guard).update(inventory=Case(
+                *(When(id=product_id, then=F('inventory') - wanted[product_id]) for product_id in decrement),
+                default=F('inventory'),
+                output_field=PositiveIntegerField(),
+            ))
+            if updated != len(decrement):
+                # The rows are locked, so this means the check above is wrong; confirm nothing.
+                raise RuntimeError(f"Order {order.id}: decremented {updated} of {len(decrement)} products")
+            StockReservation.objects.filter(id__in=[h.id for h in covered]).update(status=StockReservation.CONFIRMED)
+            _invalidate_products(decrement)
+    if short:
+        logger.error(f"Order {order.id} was paid but its holds no longer cover: {', '.join(short)}")
+    return short
+
+
+def release_expired(batch_size=SWEEP_BATCH_SIZE, now=None):
+    """Expire up to ``batch_size`` lapsed holds and cancel pending orders left with none.
+
+    Returns the number of holds expired. Concurrent sweepers skip each
+    other's rows where the database supports it.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        lapsed = list(
+            StockReservation.objects.select_for_update(skip_locked=True)
+            .filter(status=StockReservation.HELD, expires_at__lte=now)
+            .order_by('expires_at')
+            .values_list('id', 'order_id', 'product_id')[:batch_size]
+        )
+        if not lapsed:
+            return 0
+        StockReservation.objects.filter(id__in=[pk for pk, _, _ in lapsed]).update(status=StockReservation.EXPIRED)
+        order_ids = {order_id for _, order_id, _ in lapsed}
+        still_held = StockReservation.objects.filter(order_id__in=order_ids, status=StockReservation.HELD)
+        cancelled = (
+            Order.objects.filter(id__in=order_ids, status=Order.PENDING)
+            .exclude(id__in=still_held.values('order_id'))
+            .update(status=Order.CANCELLED)
+        )
+        _invalidate_products(product_id for _, _, product_id in lapsed)
+    logger.info(f"Expired {len(lapsed)} stock hold(s), cancelled {cancelled} order(s)")
+    return len(lapsed)
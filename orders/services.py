@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.db import transaction
+
+from products.models import Product
+from . import reservations
+from .models import Order, OrderItem
+
+
+class CheckoutError(Exception):
+    """Raised when a cart cannot be turned into an order."""
+
+
+class OutOfStock(CheckoutError):
+    pass
+
+
+def normalize_cart(cart):
+    """Return ``cart`` as ``{product_id: quantity}`` with int keys and positive quantities."""
+    quantities = {}
+    for product_id, quantity in cart.items():
+        quantity = int(quantity)
+        if quantity > 0:
+            quantities[int(product_id)] = quantity
+    return quantities
+
+
+def place_order(user, cart):
+    """Create an order for ``user`` from ``cart`` in a single transaction.
+
+    The cart's products are locked in primary key order so that concurrent
+    checkouts touching the same products always acquire row locks in the same
+    sequence and cannot deadlock. Stock is not decremented here: the order
+    gets expiring holds on it (see ``orders.reservations``) that payment
+    confirms. Items and holds are each written with one ``bulk_create``, so
+    the number of queries does not grow with the size of the cart.
+
+    Returns ``(order, items)``. Raises ``CheckoutError`` (or ``OutOfStock``)
+    without writing anything if the cart cannot be fulfilled.
+    """
+    quantities = normalize_cart(cart)
+    if not quantities:
+        raise CheckoutError("Your cart is empty.")
+
+    with transaction.atomic():
+        products = list(
+            Product.objects.select_for_update()
+            .filter(id__in=quantities.keys())
+            .order_by('id')
+        )
+        if not products:
+            raise CheckoutError("No valid products in cart.")
+
+        total_price = sum(p.price * quantities[p.id] for p in products)
+        order = Order.objects.create(
+            user=user,
+            total_price=total_price,
+            tax_amount=total_price * settings.TAX_RATE,
+        )
+        short = reservations.hold(order, products, quantities)
+        if short:
+            raise OutOfStock(f"Not enough stock for: {', '.join(short)}.")
+        items = OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=p, quantity=quantities[p.id], price=p.price)
+            for p in products
+        ])
+
+    return order, items
@@ -0,0 +1,29 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+from products.bulk import products_changed
+from products.models import Product
+from .cart import CartStore, refresh_subtotals, reprice_product, reprice_products
+from .models import CartLine
+
+@receiver(post_save, sender=Product)
+def reprice_carts(sender, instance, **kwargs):
+    reprice_product(instance)
+
+@receiver(products_changed, sender=Product)
+def reprice_carts_in_bulk(sender, product_ids, fields, **kwargs):
+    if 'price' in fields:
+        reprice_products(product_ids)
+
+@receiver(pre_delete, sender=Product)
+def remove_from_carts(sender, instance, **kwargs):
+    lines = CartLine.objects.filter(product=instance)
+    cart_ids = list(lines.values_list('cart_id', flat=True))
+    if cart_ids:
+        lines.delete()
+        refresh_subtotals(cart_ids)
+
+@receiver(user_logged_in)
+def merge_anonymous_cart(sender, request, user, **kwargs):
+    if request is not None and hasattr(request, 'session'):
+        CartStore(request).merge_into(user)
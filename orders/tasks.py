@@ -0,0 +1,52 @@
+"""Work that follows checkout and payment, run by the ``run_tasks`` worker."""
+import logging
+from datetime import date
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.template.loader import render_to_string
+
+from core.tasks import task
+from .models import Order
+from .reports import refresh_rollups
+
+logger = logging.getLogger(__name__)
+
+# Enough for a burst of payments on the same day to share one refresh.
+ROLLUP_REFRESH_DELAY = 60
+
+
+def _email(order, template, subject):
+    context = {'order': order, 'items': order.items.all(), 'grand_total': order.total_price + order.tax_amount}
+    send_mail(
+        subject,
+        render_to_string(template, context),
+        settings.DEFAULT_FROM_EMAIL,
+        [order.user.email],
+    )
+
+
+@task(priority=10, max_attempts=3)
+def send_order_confirmation(order_id):
+    order = Order.objects.select_related('user').with_items().get(id=order_id)
+    _email(order, 'orders/email/order_confirmation.txt', f"Order {order.id} received")
+    logger.info(f"Sent confirmation for order {order.id}")
+
+
+@task(priority=10, max_attempts=3)
+def send_payment_receipt(order_id):
+    order = Order.objects.select_related('user').with_items().get(id=order_id)
+    _email(order, 'orders/email/payment_receipt.txt', f"Receipt for order {order.id}")
+    logger.info(f"Sent receipt for order {order.id}")
+
+
+@task(priority=-10)
+def refresh_sales_day(day):
+    """Bring one day's sales rollups up to date; ``day`` is an ISO date."""
+    day = date.fromisoformat(day)
+    refresh_rollups(day, day)
+
+
+def queue_sales_refresh(day):
+    day = day.isoformat()
+    return refresh_sales_day.enqueue(day, dedup_key=f'sales-rollup:{day}', delay=ROLLUP_REFRESH_DELAY)
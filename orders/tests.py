@@ -1,3 +1,415 @@
+import csv
+import json
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from core.tasks import run_pending
+from core.testing import BudgetAssertionsMixin
+from products.bulk import reprice
+from products.models import Product, ProductCategory
+from . import exports
+from .models import Cart, CartLine, DailySales, Order, OrderItem, StockReservation
+from .reports import refresh_rollups
+from .reservations import available_stock, confirm, release_expired
+from .services import CheckoutError, OutOfStock, place_order
+
+
+class PlaceOrderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='buyer', email='buyer@example.com', password='pw')
+        cls.products = [
+            Product.objects.create(name=f'Product {n}', description='', price=Decimal('10.00'), inventory=5)
+            for n in range(3)
+        ]
+
+    def test_creates_order_items_and_holds_stock(self):
+        cart = {str(self.products[0].id): 2, str(self.products[1].id): 1}
+        order, items = place_order(self.user, cart)
+
+        self.assertEqual(order.total_price, Decimal('30.00'))
+        self.assertEqual(len(items), 2)
+        self.assertEqual(OrderItem.objects.filter(order=order).count(), 2)
+        self.assertEqual(order.reservations.filter(status=StockReservation.HELD).count(), 2)
+        products = Product.objects.filter(id__in=[p.id for p in self.products[:2]])
+        # Inventory only drops once payment confirms the holds.
+        self.assertEqual([p.inventory for p in products], [5, 5])
+        self.assertEqual(available_stock(products), {self.products[0].id: 3, self.products[1].id: 4})
+
+    def test_out_of_stock_rolls_back(self):
+        cart = {self.products[0].id: 1, self.products[1].id: 6}
+        with self.assertRaises(OutOfStock):
+            place_order(self.user, cart)
+
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_empty_cart(self):
+        with self.assertRaises(CheckoutError):
+            place_order(self.user, {})
+
+    def test_query_count_is_independent_of_cart_size(self):
+        # savepoint, SELECT ... FOR UPDATE, INSERT order, SUM live holds, INSERT holds, INSERT items, release
+        with self.assertNumQueries(7):
+            place_order(self.user, {self.products[0].id: 1})
+        with self.assertNumQueries(7):
+            place_order(self.user, {p.id: 1 for p in self.products})
+
+
+class ReservationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='holder', email='holder@example.com', password='pw')
+        cls.product = Product.objects.create(name='Sneakers', description='', price=Decimal('50.00'), inventory=5)
+
+    def lapse(self, order):
+        order.reservations.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+    def test_holds_keep_stock_from_other_checkouts_until_they_lapse(self):
+        first, _ = place_order(self.user, {self.product.id: 4})
+        with self.assertRaises(OutOfStock):
+            place_order(self.user, {self.product.id: 2})
+
+        self.lapse(first)
+        second, _ = place_order(self.user, {self.product.id: 2})
+        self.assertEqual(available_stock([self.product]), {self.product.id: 3})
+
+    def test_sweeper_expires_holds_and_cancels_orders_in_batches(self):
+        orders = [place_order(self.user, {self.product.id: 1})[0] for _ in range(3)]
+        for order in orders[:2]:
+            self.lapse(order)
+
+        self.assertEqual(release_expired(batch_size=1), 1)
+        call_command('release_expired_holds', stdout=StringIO())
+        self.assertEqual(
+            [o.status for o in Order.objects.order_by('id')],
+            [Order.CANCELLED, Order.CANCELLED, Order.PENDING],
+        )
+        self.assertEqual(StockReservation.objects.filter(status=StockReservation.EXPIRED).count(), 2)
+
+    def test_confirming_takes_stock_off_inventory(self):
+        order, _ = place_order(self.user, {self.product.id: 2})
+        self.assertEqual(confirm(order), [])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.inventory, 3)
+        self.assertEqual(available_stock([self.product]), {self.product.id: 3})
+        # Confirming twice changes nothing.
+        confirm(order)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.inventory, 3)
+
+    def test_late_payment_is_honoured_only_while_stock_lasts(self):
+        late, _ = place_order(self.user, {self.product.id: 3})
+        self.lapse(late)
+        release_expired()
+        place_order(self.user, {self.product.id: 4})
+
+        with self.assertLogs('orders.reservations', 'ERROR'):
+            self.assertEqual(confirm(late), ['Sneakers'])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.inventory, 5)
+
+
+    def test_holds_are_not_confirmed_past_lowered_inventory(self):
+        order, _ = place_order(self.user, {self.product.id: 4})
+        Product.objects.filter(id=self.product.id).update(inventory=2)
+
+        with self.assertLogs('orders.reservations', 'ERROR'):
+            self.assertEqual(confirm(order), ['Sneakers'])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.inventory, 2)
+        self.assertFalse(order.reservations.filter(status=StockReservation.CONFIRMED).exists())
+
+class CartTests(BudgetAssertionsMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='shopper', email='shopper@example.com', password='pw')
+        cls.pen = Product.objects.create(name='Pen', description='', price=Decimal('2.50'), inventory=10)
+        cls.ink = Product.objects.create(name='Ink', description='', price=Decimal('4.00'), inventory=10)
+
+    def setUp(self):
+        cache.clear()
+
+    def add(self, product):
+        return self.client.post(reverse('orders:add_to_cart', args=[product.id]))
+
+    def cart(self):
+        return Cart.objects.get(id=self.client.session['cart_id'])
+
+    def test_add_upserts_lines_and_maintains_subtotal(self):
+        self.add(self.pen)
+        self.add(self.pen)
+        self.add(self.ink)
+        cart = self.cart()
+        self.assertEqual(cart.lines.get(product=self.pen).quantity, 2)
+        self.assertEqual(cart.subtotal, Decimal('9.00'))
+
+        self.client.post(reverse('orders:remove_from_cart', args=[self.pen.id]))
+        self.assertEqual(self.cart().subtotal, Decimal('4.00'))
+
+    def test_viewing_the_cart_costs_at_most_one_query(self):
+        self.add(self.pen)
+        self.add(self.ink)
+        # One query loads the session, one loads the lines.
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('orders:cart'))
+        self.assertContains(response, 'Total: ₦6.50')
+        self.assertWithinBudget(response)
+        with self.assertNumQueries(1):
+            self.client.get(reverse('orders:cart'))
+
+    def test_price_change_reprices_cached_cart(self):
+        self.add(self.pen)
+        self.client.get(reverse('orders:cart'))
+        self.pen.price = Decimal('3.00')
+        self.pen.save()
+        response = self.client.get(reverse('orders:cart'))
+        self.assertContains(response, 'Total: ₦3.00')
+        self.assertEqual(self.cart().subtotal, Decimal('3.00'))
+
+    def test_bulk_price_change_reprices_cached_carts(self):
+        self.add(self.pen)
+        self.add(self.ink)
+        self.client.get(reverse('orders:cart'))
+        reprice(Product.objects.filter(id__in=[self.pen.id, self.ink.id]), 10)
+        response = self.client.get(reverse('orders:cart'))
+        self.assertContains(response, 'Total: ₦7.15')
+        self.assertEqual(self.cart().subtotal, Decimal('7.15'))
+
+    def test_deleting_a_product_drops_it_from_carts(self):
+        self.add(self.pen)
+        self.add(self.ink)
+        self.ink.delete()
+        self.assertEqual(self.cart().subtotal, Decimal('2.50'))
+
+    def test_anonymous_cart_merges_on_login(self):
+        user_cart = Cart.objects.create(user=self.user, subtotal=Decimal('2.50'))
+        CartLine.objects.create(cart=user_cart, product=self.pen, quantity=1, unit_price=self.pen.price)
+
+        self.add(self.pen)
+        self.add(self.ink)
+        anonymous_id = self.client.session['cart_id']
+        self.client.login(username='shopper', password='pw')
+
+        self.assertEqual(self.client.session['cart_id'], user_cart.id)
+        self.assertFalse(Cart.objects.filter(id=anonymous_id).exists())
+        user_cart.refresh_from_db()
+        self.assertEqual(user_cart.lines.get(product=self.pen).quantity, 2)
+        self.assertEqual(user_cart.subtotal, Decimal('9.00'))
+
+    def test_checkout_empties_the_cart(self):
+        self.client.force_login(self.user)
+        self.add(self.pen)
+        response = self.client.get(reverse('orders:checkout'))
+        self.assertContains(response, 'Order Summary')
+        self.assertContains(response, 'Total: ₦2.63')
+        self.assertFalse(self.cart().lines.exists())
+        self.assertEqual(Order.objects.get().items.get().product, self.pen)
+
+    def test_checkout_orders_the_lines_in_the_database_not_a_cached_summary(self):
+        self.client.force_login(self.user)
+        self.add(self.pen)
+        self.client.get(reverse('orders:cart'))
+        # Added by another worker, whose invalidation this process's cache never saw.
+        CartLine.objects.create(cart=self.cart(), product=self.ink, quantity=1, unit_price=self.ink.price)
+        self.client.get(reverse('orders:checkout'))
+        self.assertEqual(
+            sorted(Order.objects.get().items.values_list('product__name', flat=True)), ['Ink', 'Pen'],
+        )
+
+    def test_checkout_queues_the_confirmation_email(self):
+        self.client.force_login(self.user)
+        self.add(self.pen)
+        self.client.get(reverse('orders:checkout'))
+        self.assertEqual(mail.outbox, [])
+        run_pending()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn(self.pen.name, mail.outbox[0].body)
+
+
+class OrderViewsTests(BudgetAssertionsMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='history', email='history@example.com', password='pw')
+        cls.products = [
+            Product.objects.create(name=f'Item {n}', description='', price=Decimal('3.00'), inventory=100)
+            for n in range(10)
+        ]
+        cls.small, _ = place_order(cls.user, {cls.products[0].id: 2})
+        cls.large, _ = place_order(cls.user, {p.id: 1 for p in cls.products})
+        for _ in range(25):
+            place_order(cls.user, {cls.products[1].id: 1})
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_detail_query_count_does_not_grow_with_items(self):
+        # session, user, order, prefetched items with products
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('orders:order_detail', args=[self.small.id]))
+        self.assertContains(response, '₦6.00')
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('orders:order_detail', args=[self.large.id]))
+        self.assertContains(response, 'Item 9')
+        self.assertWithinBudget(response)
+
+    def test_totals_keep_the_kobo(self):
+        order = Order.objects.create(user=self.user, total_price=Decimal('30.00'), tax_amount=Decimal('1.50'))
+        response = self.client.get(reverse('orders:order_detail', args=[order.id]))
+        self.assertContains(response, '<strong>Total:</strong> ₦31.50', html=False)
+
+    def test_rows_print_without_queries(self):
+        orders = list(Order.objects.filter(user=self.user))
+        items = list(OrderItem.objects.filter(order=self.large))
+        with self.assertNumQueries(0):
+            [str(row) for row in orders + items]
+
+    def test_history_is_paginated_with_constant_queries(self):
+        # session, user, count, page of orders with totals
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('orders:order_history'))
+        self.assertEqual(len(response.context['orders']), 20)
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('orders:order_history'), {'page': 2})
+        self.assertEqual(len(response.context['orders']), 7)
+        self.assertWithinBudget(response)
+        large = next(o for o in response.context['orders'] if o.id == self.large.id)
+        self.assertEqual(large.item_count, 10)
+        self.assertEqual(large.grand_total, self.large.total_price + self.large.tax_amount)
+
+    def test_other_users_orders_are_hidden(self):
+        other = get_user_model().objects.create_user(username='other', email='other@example.com', password='pw')
+        self.client.force_login(other)
+        response = self.client.get(reverse('orders:order_detail', args=[self.small.id]))
+        self.assertEqual(response.status_code, 404)
+
+
+class SalesReportTests(BudgetAssertionsMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = get_user_model().objects.create_user(username='staff', password='pw', is_staff=True)
+        cls.user = get_user_model().objects.create_user(username='buyer', email='buyer@example.com', password='pw')
+        books = ProductCategory.objects.create(name='Books', description='')
+        cls.book = Product.objects.create(name='Novel', description='', price=Decimal('10.00'), inventory=100, category=books)
+        cls.lamp = Product.objects.create(name='Lamp', description='', price=Decimal('25.00'), inventory=100)
+        cls.today = timezone.localdate()
+        cls.yesterday = cls.today - timedelta(days=1)
+        cls.orders = []
+        for products, status, days_ago in (
+            ({cls.book.id: 2}, Order.DELIVERED, 1),
+            ({cls.book.id: 1, cls.lamp.id: 1}, Order.PROCESSING, 0),
+            ({cls.lamp.id: 4}, Order.PENDING, 0),
+        ):
+            order, _ = place_order(cls.user, products)
+            Order.objects.filter(id=order.id).update(status=status, created_at=timezone.now() - timedelta(days=days_ago))
+            cls.orders.append(order)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.staff)
+
+    def report(self):
+        return self.client.get(reverse('orders:sales_report'), {'from': self.yesterday, 'to': self.today})
+
+    def test_report_sums_paid_orders_from_rollups(self):
+        self.assertEqual(refresh_rollups(self.yesterday, self.today), 2)
+        response = self.report()
+        self.assertWithinBudget(response)
+        report = response.context['report']
+        self.assertEqual(report['totals']['orders'], 2)
+        self.assertEqual(report['totals']['revenue'], Decimal('55.00'))
+        self.assertEqual([(d['day'], d['revenue']) for d in report['days']],
+                         [(self.yesterday, Decimal('20.00')), (self.today, Decimal('35.00'))])
+        self.assertEqual([(c['category__name'], c['units'], c['revenue']) for c in report['categories']],
+                         [('Books', 3, Decimal('30.00')), (None, 1, Decimal('25.00'))])
+        with self.assertNumQueries(2):  # session and user; the report is cached
+            self.report()
+
+    def test_refresh_replaces_days_and_invalidates_the_report(self):
+        refresh_rollups(self.yesterday, self.today)
+        self.report()
+        Order.objects.filter(id=self.orders[1].id).update(status=Order.CANCELLED)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('refresh_sales_rollups', days=1, stdout=StringIO())
+        self.assertFalse(DailySales.objects.filter(day=self.today).exists())
+        self.assertEqual(self.report().context['report']['totals']['revenue'], Decimal('20.00'))
+
+    def test_exports_stream_csv_and_jsonl(self):
+        response = self.client.get(reverse('orders:export', args=['orders', 'csv']))
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment', response['Content-Disposition'])
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0][:3], ['id', 'user_id', 'user_email'])
+        self.assertEqual([int(row[0]) for row in rows[1:]], [o.id for o in self.orders])
+
+        response = self.client.get(reverse('orders:export', args=['items', 'jsonl']), {'from': self.today})
+        items = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual({item['order_id'] for item in items}, {self.orders[1].id, self.orders[2].id})
+        self.assertEqual(items[0]['price'], '10.00')
+
+    def test_exports_read_keyset_pages(self):
+        with mock.patch.object(exports, 'CHUNK_SIZE', 2), self.assertNumQueries(2):
+            ids = [row[0] for row in exports.rows('orders')]
+        self.assertEqual(ids, [o.id for o in self.orders])
+
+    def test_staff_only(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.report().status_code, 302)
+        response = self.client.get(reverse('orders:export', args=['payments', 'csv']))
+        self.assertEqual(response.status_code, 302)
+
+
+class OrderAdminTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_superuser(username='admin', email='admin@example.com', password='pw')
+        product = Product.objects.create(name='Pen', description='', price=Decimal('2.50'), inventory=100)
+        for n in range(5):
+            buyer = get_user_model().objects.create_user(username=f'buyer{n}', email=f'buyer{n}@example.com', password='pw')
+            place_order(buyer, {product.id: 1})
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        url = reverse('admin:orders_order_changelist')
+        with self.assertNumQueries(4):  # session, user, count, page of orders joined to their users
+            response = self.client.get(url)
+        self.assertEqual(len(response.context['cl'].result_list), 5)
+
+    def test_mark_shipped_updates_only_processing_orders(self):
+        Order.objects.filter(id__in=Order.objects.order_by('id').values('id')[:3]).update(status=Order.PROCESSING)
+        ids = list(Order.objects.values_list('id', flat=True))
+        self.client.post(reverse('admin:orders_order_changelist'), {'action': 'mark_shipped', '_selected_action': ids})
+        self.assertEqual(Order.objects.filter(status=Order.SHIPPED).count(), 3)
+        self.assertEqual(Order.objects.filter(status=Order.PENDING).count(), 2)
+
+    def test_change_page_renders_items_inline(self):
+        order = Order.objects.first()
+        response = self.client.get(reverse('admin:orders_order_change', args=[order.id]))
+        self.assertContains(response, 'vForeignKeyRawIdAdminField')
+        self.assertContains(response, 'admin-autocomplete')
+
+
+class OrderIndexTests(TestCase):
+    def test_history_and_admin_queries_use_indexes(self):
+        out = StringIO()
+        call_command('bench_order_queries', orders=300, users=10, repeat=1, stdout=out)
+        self.assertIn('queries off index: 0', out.getvalue())
 
-# Create your tests here.
+    def test_status_is_displayed_from_choices(self):
+        user = get_user_model().objects.create_user(username='status', email='status@example.com', password='pw')
+        order = Order.objects.create(user=user, total_price=Decimal('5.00'), status=Order.SHIPPED)
+        self.client.force_login(user)
+        response = self.client.get(reverse('orders:order_detail', args=[order.id]))
+        self.assertContains(response, 'Shipped')
@@ -15,4 +15,7 @@ urlpatterns = [
     path('cancel/', lambda x: render(x, 'orders/cancel.html'), name='cancel'),
     path('cart/remove/<int:product_id>/', views.remove_from_cart, name='remove_from_cart'),
     path('order/<int:order_id>/', views.order_detail, name='order_detail'),
+    path('history/', views.order_history, name='order_history'),
+    path('reports/sales/', views.sales_report_view, name='sales_report'),
+    path('export/<slug:name>.<slug:fmt>', views.export, name='export'),
 ]
\ No newline at end of file
@@ -1,86 +1,82 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
+from django.core.paginator import Paginator
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.conf import settings
 from django.contrib import messages
-import paystack
+from django.contrib.admin.views.decorators import staff_member_required
+from django.utils import timezone
+from core.instrumentation import budget
 from products.models import Product
-from .models import Order, OrderItem
+from . import exports
+from .cart import CartStore
+from .models import Order
+from .reports import day_bounds, sales_report
+from .reservations import available_stock
+from .services import CheckoutError, place_order
+from .tasks import send_order_confirmation
+from payments.inbox import record_event, verify_signature
+from payments.paystack import PaystackError, ainitialize_order_payment
+from payments.tasks import process_paystack_event
 from decimal import Decimal
+from datetime import date, timedelta
 import json
 from django.http import HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
-import hmac
-import hashlib
 import logging
 
 logger = logging.getLogger(__name__)
 
 TAX_RATE = Decimal('0.005')
-
-paystack.api_key = settings.PAYSTACK_SECRET_KEY
+ORDERS_PER_PAGE = 20
+REPORT_DAYS = 30
 
 def add_to_cart(request, product_id):
-    cart = request.session.get('cart', {})
     product = get_object_or_404(Product, id=product_id)
-    if product.inventory > 0:
-        cart[str(product_id)] = cart.get(str(product_id), 0) + 1
-        request.session['cart'] = cart
+    if available_stock([product])[product.id] > 0:
+        CartStore(request).add(product)
         messages.success(request, f"{product.name} added to cart.")
     else:
         messages.error(request, f"{product.name} is out of stock.")
     return redirect('orders:cart')
 
 def remove_from_cart(request, product_id):
-    cart = request.session.get('cart', {})
-    product = get_object_or_404(Product, id=product_id)
-    if str(product_id) in cart:
-        del cart[str(product_id)]
-        request.session['cart'] = cart
-        messages.success(request, f"{product.name} removed from cart.")
+    line = CartStore(request).remove(product_id)
+    if line is not None:
+        messages.success(request, f"{line.product.name} removed from cart.")
     return redirect('orders:cart')
 
-def view_cart(request):
-    cart = request.session.get('cart', {})
-    products = Product.objects.filter(id__in=cart.keys())
-    cart_items = [{'product': p, 'quantity': cart[str(p.id)], 'total': p.price * cart[str(p.id)]} for p in products]
-    total_price = sum(item['total'] for item in cart_items)
-    return render(request, 'orders/cart.html', {'cart_items': cart_items, 'total_price': total_price})
+@budget(queries=3)
+async def view_cart(request):
+    request.user = await request.auser()
+    cart = await CartStore(request).asummary()
+    return render(request, 'orders/cart.html', {'cart_items': cart.lines, 'total_price': cart.subtotal})
 
 @login_required
 def checkout(request):
     try:
-        cart = request.session.get('cart', {})
-        if not cart:
-            messages.error(request, "Your cart is empty.")
-            logger.warning("Checkout attempted with empty cart.")
-            return redirect('orders:cart')
-        products = Product.objects.filter(id__in=cart.keys())
-        if not products:
-            messages.error(request, "No valid products in cart.")
-            logger.warning("No valid products found in cart.")
+        cart = CartStore(request)
+        try:
+            order, items = place_order(request.user, cart.summary(fresh=True).as_mapping())
+        except CheckoutError as e:
+            messages.error(request, str(e))
+            logger.warning(f"Checkout rejected for user {request.user.id}: {e}")
             return redirect('orders:cart')
-        cart_items = [{'product': p, 'quantity': cart[str(p.id)], 'total': p.price * cart[str(p.id)]} for p in products]
-        total_price = sum(p.price * cart[str(p.id)] for p in products)
-        order = Order.objects.create(
-            user=request.user,
-            total_price=total_price,
-            tax_amount=total_price * settings.TAX_RATE
-        )
-        order.save()  # Ensure the order is saved
         logger.info(f"Created order {order.id} for user {request.user.id}")
-        for product_id, quantity in cart.items():
-            product = Product.objects.get(id=product_id)
-            OrderItem.objects.create(order=order, product=product, quantity=quantity, price=product.price)
-            product.inventory -= quantity
-            product.save()
-        request.session['cart'] = {}
-        messages.success(request, "Order created successfully. Proceed to payment.")
+        send_order_confirmation.enqueue(order.id)
+        cart_items = [{'product': item.product, 'quantity': item.quantity, 'total': item.price * item.quantity} for item in items]
+        cart.clear()
+        messages.success(
+            request,
+            f"Order created successfully. Your items are reserved for {settings.STOCK_HOLD_MINUTES} minutes; proceed to payment.",
+        )
         return render(request, 'orders/checkout.html', {
             'cart_items': cart_items,
-            'total_price': total_price,
+            'total_price': order.total_price,
             'tax_amount': order.tax_amount,
+            'grand_total': order.total_price + order.tax_amount,
             'order_id': order.id,
             'order': order,
             'PAYSTACK_PUBLIC_KEY': settings.PAYSTACK_PUBLIC_KEY
@@ -91,72 +87,98 @@ def checkout(request):
         return redirect('orders:cart')
 
 @login_required
-def create_checkout_session(request, order_id):
+async def create_checkout_session(request, order_id):
+    # Async so that waiting on Paystack doesn't hold a worker thread under ASGI.
+    user = await request.auser()
+    order = await Order.objects.filter(id=order_id, user=user).afirst()
+    if order is None:
+        return redirect('orders:cart')
+    if order.status != Order.PENDING:
+        # Cancelled, most likely because its stock hold expired.
+        messages.error(request, "This order can no longer be paid for. Please check out again.")
+        return redirect('orders:order_detail', order_id=order.id)
     try:
-        order = Order.objects.get(id=order_id, user=request.user)
-        amount = int(order.total_price * 100)  # Paystack expects amount in kobo (NGN)
-        from paystackapi.transaction import Transaction
-        response = Transaction.initialize(
-            reference=f'order_{order_id}_{request.user.id}',
-            amount=amount,
-            email=request.user.email,
-            callback_url='http://127.0.0.1:8000/orders/success/'
+        data = await ainitialize_order_payment(
+            order,
+            email=user.email,
+            callback_url=request.build_absolute_uri(reverse('orders:success')),
         )
-        if response['status']:
-            return redirect(response['data']['authorization_url'])
-        else:
-            return redirect('orders:checkout')
-    except Order.DoesNotExist:
-        return redirect('orders:cart')
-    except Exception as e:
-        print(f"Error: {str(e)}")
-        return redirect('orders:checkout')
+    except PaystackError as e:
+        logger.error(f"Could not start payment for order {order.id}: {e}")
+        messages.error(request, "We couldn't reach the payment provider. Please try again shortly.")
+        return redirect('orders:order_detail', order_id=order.id)
+    return redirect(data['authorization_url'])
+
+@budget(queries=4)
+@login_required
+def order_history(request):
+    orders = Order.objects.filter(user=request.user).with_totals().order_by('-created_at', '-id')
+    page = Paginator(orders, ORDERS_PER_PAGE).get_page(request.GET.get('page'))
+    return render(request, 'orders/history.html', {'page': page, 'orders': page.object_list})
 
+@budget(queries=4)
 @login_required
 def order_detail(request, order_id):
-    order = get_object_or_404(Order, id=order_id, user=request.user)
-    items = [{
-        'product': item.product,
-        'quantity': item.quantity,
-        'price': item.price,
-        'total': item.price * item.quantity
-    } for item in order.items.all()]
+    order = get_object_or_404(Order.objects.with_totals().with_items(), id=order_id, user=request.user)
     return render(request, 'orders/order_detail.html', {
         'order': order,
-        'items': items
+        'items': order.items.all()
     })
 
 @csrf_exempt
 @require_POST
 def paystack_webhook(request):
-    payload = request.body
-    sig_header = request.META.get('HTTP_X_PAYSTACK_SIGNATURE')
-    secret = settings.PAYSTACK_SECRET_KEY  # Use the secret key for verification
-
-    # Verify webhook signature
-    computed_hmac = hmac.new(
-        key=secret.encode('utf-8'),
-        msg=payload,
-        digestmod=hashlib.sha512
-    ).hexdigest()
-
-    if sig_header != computed_hmac:
+    # Only authenticate and persist here; a run_tasks worker applies the event (process_paystack_events sweeps up any it missed).
+    if not verify_signature(request.body, request.META.get('HTTP_X_PAYSTACK_SIGNATURE')):
         return JsonResponse({'status': 'invalid signature'}, status=400)
 
     try:
-        event = json.loads(payload)
-        if event['event'] == 'charge.success':
-            reference = event['data']['reference']
-            from paystackapi.transaction import Transaction
-            response = Transaction.verify(reference=reference)
-            if response['status'] and response['data']['status'] == 'success':
-                order_id = reference.split('_')[1]  # Extract order_id from reference
-                order = Order.objects.get(id=order_id)
-                order.status = 'PROCESSING'
-                order.save()
-                return JsonResponse({'status': 'success'})
-    except Exception as e:
-        print(f"Webhook error: {str(e)}")
+        event, created = record_event(json.loads(request.body))
+    except ValueError as e:
+        logger.warning(f"Rejected Paystack webhook: {e}")
         return JsonResponse({'status': 'invalid payload'}, status=400)
 
-    return JsonResponse({'status': 'ignored'}, status=200)
\ No newline at end of file
+    if created:
+        process_paystack_event.enqueue(event.id, dedup_key=f'paystack-event:{event.id}')
+    return JsonResponse({'status': 'received' if created else 'duplicate'})
+
+def _dates(request, default_days=None):
+    """The inclusive ``from``/``to`` dates in the query string; ``to`` defaults to today."""
+    end = date.fromisoformat(request.GET['to']) if request.GET.get('to') else timezone.localdate()
+    if request.GET.get('from'):
+        start = date.fromisoformat(request.GET['from'])
+    else:
+        start = end - timedelta(days=default_days - 1) if default_days else None
+    return start, end
+
+@staff_member_required
+def export(request, name, fmt):
+    if name not in exports.EXPORTS or fmt not in exports.FORMATS:
+        raise Http404
+    try:
+        start, end = _dates(request)
+    except ValueError:
+        return HttpResponseBadRequest("Dates must look like 2025-01-31.")
+    lo, hi = day_bounds(start or end, end)
+    response = StreamingHttpResponse(
+        exports.stream(name, fmt, lo if start else None, hi),
+        content_type=exports.FORMATS[fmt],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{name}-{end}.{fmt}"'
+    return response
+
+# session, user and, when the cached report has been invalidated, four reads of the rollups
+@budget(queries=6)
+@staff_member_required
+def sales_report_view(request):
+    try:
+        start, end = _dates(request, REPORT_DAYS)
+    except ValueError:
+        return HttpResponseBadRequest("Dates must look like 2025-01-31.")
+    return render(request, 'orders/sales_report.html', {
+        'start': start,
+        'end': end,
+        'report': sales_report(start, end),
+        'exports': exports.EXPORTS,
+        'formats': exports.FORMATS,
+    })
@@ -0,0 +1,154 @@
+"""Durable inbox for Paystack webhooks.
+
+The webhook view only checks the signature and calls ``record_event``, then
+queues ``payments.tasks.process_paystack_event`` to apply the new event; the
+``process_paystack_events`` command drains whatever is still pending (missed
+or failed events) in batches, verifies them with Paystack and updates orders
+and payments. Every step is idempotent, so an event that is retried or
+delivered twice has no further effect.
+"""
+import hashlib
+import hmac
+import logging
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from orders import reservations
+from orders.models import Order
+from orders.tasks import queue_sales_refresh, send_payment_receipt
+from recommendations.tasks import count_paid_orders
+from .models import Payment, PaystackEvent
+from .paystack import payment_mismatch, verify_transaction
+
+logger = logging.getLogger(__name__)
+
+VISIBILITY_TIMEOUT = timedelta(minutes=5)
+
+
+def verify_signature(payload, signature):
+    """Check Paystack's ``x-paystack-signature`` (HMAC-SHA512 of the raw body)."""
+    expected = hmac.new(
+        key=settings.PAYSTACK_SECRET_KEY.encode('utf-8'),
+        msg=payload,
+        digestmod=hashlib.sha512,
+    ).hexdigest()
+    return hmac.compare_digest(expected, signature or '')
+
+
+def record_event(event):
+    """Store a decoded webhook body. Returns ``(event, created)``; duplicates are not stored again."""
+    if not isinstance(event, dict):
+        raise ValueError("Webhook payload is not an object")
+    data = event.get('data') or {}
+    name = str(event.get('event', ''))[:50]
+    reference = str(data.get('reference') or data.get('id') or '')[:100]
+    if not name or not reference:
+        raise ValueError("Webhook payload has no event name or reference")
+    return PaystackEvent.objects.get_or_create(
+        key=f'{name}:{reference}',
+        defaults={'event': name, 'reference': reference, 'payload': event},
+    )
+
+
+def order_id_from_reference(reference):
+    """References are built as ``order_<order id>_<user id>``."""
+    prefix, _, rest = reference.partition('_')
+    order_id = rest.split('_', 1)[0]
+    if prefix != 'order' or not order_id.isdigit():
+        raise ValueError(f"Unrecognised reference {reference!r}")
+    return int(order_id)
+
+
+def claim_batch(batch_size):
+    """Lock up to ``batch_size`` pending events for this worker and return them."""
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(
+            PaystackEvent.objects.select_for_update(skip_locked=True)
+            .filter(status=PaystackEvent.PENDING)
+            .filter(Q(locked_until__isnull=True) | Q(locked_until__lte=now))
+            .order_by('id')[:batch_size]
+        )
+        if events:
+            locked_until = now + VISIBILITY_TIMEOUT
+            PaystackEvent.objects.filter(
+                id__in=[e.id for e in events],
+            ).update(locked_until=locked_until)
+            for event in events:
+                event.locked_until = locked_until
+    return events
+
+
+def process_event(event):
+    """Apply one event, recording the outcome on the event row."""
+    try:
+        handler = HANDLERS.get(event.event)
+        status = handler(event) if handler else PaystackEvent.IGNORED
+    except Exception as e:
+        logger.warning(f"Paystack event {event.key} failed: {e}")
+        attempts = event.attempts + 1
+        PaystackEvent.objects.filter(id=event.id).update(
+            attempts=attempts,
+            last_error=str(e),
+            status=PaystackEvent.FAILED if attempts >= PaystackEvent.MAX_ATTEMPTS else PaystackEvent.PENDING,
+            # Back off before the next attempt.
+            locked_until=timezone.now() + timedelta(seconds=30 * 2 ** attempts),
+        )
+        return False
+    PaystackEvent.objects.filter(id=event.id).update(
+        status=status,
+        attempts=event.attempts + 1,
+        last_error='',
+        processed_at=timezone.now(),
+    )
+    return True
+
+
+def process_pending(batch_size=100):
+    """Process one batch. Returns the number of events claimed."""
+    events = claim_batch(batch_size)
+    for event in events:
+        process_event(event)
+    return len(events)
+
+
+def handle_charge_success(event):
+    data = verify_transaction(event.reference)
+    if data.get('status') != 'success':
+        return PaystackEvent.IGNORED
+    order_id = order_id_from_reference(event.reference)
+    with transaction.atomic():
+        order = Order.objects.select_for_update().get(id=order_id)
+        if (mismatch := payment_mismatch(order, data)) is not None:
+            # Underpaid, or in another currency: leave the order for staff to look at.
+            logger.warning(f"Paystack transaction {event.reference} {mismatch}; order {order_id} not marked paid")
+            return PaystackEvent.IGNORED
+        # A cancelled order was most likely paid just after its stock hold expired.
+        if order.status in (Order.PENDING, Order.CANCELLED):
+            reservations.confirm(order)
+            order.status = Order.PROCESSING
+            order.save(update_fields=['status'])
+            # Queued in this transaction, so they run only if the payment is recorded.
+            send_payment_receipt.enqueue(order.id, dedup_key=f'receipt:{order.id}')
+            queue_sales_refresh(timezone.localdate(order.created_at))
+            count_paid_orders.enqueue([order.id], dedup_key=f'co-purchases:{order.id}')
+        Payment.objects.get_or_create(
+            order=order,
+            defaults={
+                'stripe_charge_id': str(data.get('id', event.reference)),
+                'amount': Decimal(data.get('amount', 0)) / 100,
+                'status': 'succeeded',
+            },
+        )
+    logger.info(f"Order {order_id} paid via {event.reference}")
+    return PaystackEvent.PROCESSED
+
+
+HANDLERS = {
+    'charge.success': handle_charge_success,
+}
@@ -0,0 +1,42 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from payments.inbox import process_pending
+
+
+class Command(BaseCommand):
+    help = "Drain the Paystack webhook inbox: verify pending events and update orders and payments."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="Number of worker threads.")
+        parser.add_argument('--batch-size', type=int, default=50, help="Events claimed per batch.")
+        parser.add_argument('--loop', action='store_true', help="Keep polling for new events instead of exiting when the inbox is empty.")
+        parser.add_argument('--interval', type=float, default=2.0, help="Seconds to sleep between polls when idle (with --loop).")
+
+    def handle(self, *args, **options):
+        def drain():
+            processed = 0
+            while True:
+                claimed = process_pending(options['batch_size'])
+                processed += claimed
+                if claimed:
+                    continue
+                if not options['loop']:
+                    return processed
+                time.sleep(options['interval'])
+
+        def worker(n):
+            try:
+                return drain()
+            finally:
+                connection.close()
+
+        if options['workers'] <= 1:
+            processed = drain()
+        else:
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                processed = sum(pool.map(worker, range(options['workers'])))
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} event(s)."))
@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from payments.paystack import PaystackError
+from payments.reconcile import CONCURRENCY, OVERLAP, PER_PAGE, reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        "Match Paystack's successful transactions against orders and fix orders whose webhook was lost. "
+        "Resumes an interrupted run; otherwise covers everything since the last completed run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--per-page', type=int, default=PER_PAGE, help="Transactions per Paystack page.")
+        parser.add_argument('--concurrency', type=int, default=CONCURRENCY, help="Pages fetched at once.")
+        parser.add_argument(
+            '--overlap-hours', type=float, default=OVERLAP.total_seconds() / 3600,
+            help="How far before the previous run's end to start, for transactions that succeeded late.",
+        )
+        parser.add_argument('--since', help="Start of the window (ISO date) when there is no previous run.")
+        parser.add_argument('--restart', action='store_true', help="Abandon an unfinished run and start afresh.")
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = datetime.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError(f"--since must be an ISO date, not {options['since']!r}")
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+        try:
+            checkpoint = reconcile(
+                per_page=options['per_page'],
+                concurrency=max(1, options['concurrency']),
+                overlap=timedelta(hours=options['overlap_hours']),
+                since=since,
+                restart=options['restart'],
+            )
+        except PaystackError as e:
+            raise CommandError(f"Stopped ({e}); run the command again to resume.")
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {checkpoint.transactions_seen} transaction(s) up to {checkpoint.window_end:%Y-%m-%d %H:%M}: "
+            f"{checkpoint.orders_fixed} order(s) fixed, {checkpoint.payments_created} payment(s) recorded, "
+            f"{checkpoint.unmatched} unmatched."
+        ))
@@ -9,4 +9,61 @@ class Payment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"Payment for Order {self.order.id}"
\ No newline at end of file
+        return f"Payment for Order {self.order_id}"
+
+class PaystackEvent(models.Model):
+    """A webhook delivery from Paystack, stored before it is acted on.
+
+    ``key`` identifies the event (``<event>:<reference>``) and is unique, so
+    redelivered webhooks are dropped on insert. Workers claim pending rows by
+    setting ``locked_until`` and retry failures until ``MAX_ATTEMPTS``.
+    """
+    PENDING = 'PENDING'
+    PROCESSED = 'PROCESSED'
+    IGNORED = 'IGNORED'
+    FAILED = 'FAILED'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (PROCESSED, 'Processed'),
+        (IGNORED, 'Ignored'),
+        (FAILED, 'Failed'),
+    ]
+    MAX_ATTEMPTS = 5
+
+    key = models.CharField(max_length=191, unique=True)
+    event = models.CharField(max_length=50)
+    reference = models.CharField(max_length=100, blank=True)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'locked_until'])]
+
+    def __str__(self):
+        return f"{self.event} {self.reference} ({self.status})"
+
+class ReconciliationCheckpoint(models.Model):
+    """Progress of one ``reconcile_payments`` run over Paystack transactions created in ``[window_start, window_end]``.
+
+    ``next_page`` is the first page not yet applied, so an interrupted run
+    resumes where it stopped; ``window_end`` is fixed when the run starts,
+    which keeps the pages stable while it runs.
+    """
+    window_start = models.DateTimeField(null=True, blank=True)
+    window_end = models.DateTimeField()
+    next_page = models.PositiveIntegerField(default=1)
+    transactions_seen = models.PositiveIntegerField(default=0)
+    orders_fixed = models.PositiveIntegerField(default=0)
+    payments_created = models.PositiveIntegerField(default=0)
+    unmatched = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        state = 'completed' if self.completed_at else f'at page {self.next_page}'
+        return f"Reconciliation up to {self.window_end:%Y-%m-%d %H:%M} ({state})"
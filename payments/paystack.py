@@ -0,0 +1,396 @@
+"""The one place the project talks to the Paystack API.
+
+``PaystackGateway`` keeps a pooled keep-alive ``requests.Session``, applies
+connect/read timeouts to every call, retries idempotent calls with jittered
+exponential backoff and stops calling Paystack for a while once it keeps
+failing (``CircuitBreaker``), so an outage fails fast instead of holding every
+worker on a slow socket. Call latencies go to ``core.metrics`` as
+``paystack.<call>`` histograms.
+
+Use ``get_gateway()``; it is built from settings once per process.
+Async code uses ``get_async_gateway()``, the same on ``httpx``.
+"""
+import asyncio
+import logging
+import random
+import weakref
+import threading
+import time
+from urllib.parse import quote
+
+import httpx
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from requests.adapters import HTTPAdapter
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+# Orders are priced, and Paystack charges, in naira.
+CURRENCY = 'NGN'
+
+
+class PaystackError(Exception):
+    pass
+
+
+class PaystackUnavailable(PaystackError):
+    """Paystack could not be reached, timed out, or the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Fail fast after ``failure_threshold`` consecutive failures.
+
+    Once open, calls are refused for ``reset_timeout`` seconds; after that a
+    single trial call is let through (half-open) and its outcome closes or
+    re-opens the circuit.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self):
+        return self.admit()[0]
+
+    def admit(self):
+        """``(allowed, trial)``: whether a call may go ahead, and whether it is the half-open trial."""
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True, False
+            if state == self.HALF_OPEN and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True, True
+            return False, False
+
+    def abandon_trial(self):
+        """The trial ended without an outcome (cancelled, or an unexpected error): re-open for another wait.
+
+        Otherwise the circuit would stay half-open with the trial taken for good.
+        """
+        with self._lock:
+            if self.trial_in_flight:
+                self.trial_in_flight = False
+                self.opened_at = self.clock()
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning("Paystack circuit breaker opened")
+                self.opened_at = self.clock()
+            self.trial_in_flight = False
+
+
+class PaystackGateway:
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, base_url, secret_key, timeout=(3.05, 10), max_retries=2, backoff=0.25,
+                 pool_size=10, breaker=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self._connect({
+            'Authorization': f'Bearer {secret_key}',
+            'Content-Type': 'application/json',
+        }, pool_size)
+
+    def _connect(self, headers, pool_size):
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def close(self):
+        self.session.close()
+
+    def request(self, name, method, path, idempotent, **kwargs):
+        """Call Paystack and return the ``data`` member of its response.
+
+        ``name`` labels the call in metrics. Only ``idempotent`` calls are
+        retried; a failed ``POST`` might have been applied.
+        """
+        attempts = 1 + (self.max_retries if idempotent else 0)
+        for attempt in range(attempts):
+            trial = self._before_attempt(attempt)
+            try:
+                return self._send(name, method, path, **kwargs)
+            except PaystackUnavailable as e:
+                time.sleep(self._after_failure(name, attempt, attempts, e))
+            except BaseException:
+                if trial:
+                    self.breaker.abandon_trial()
+                raise
+
+    def _before_attempt(self, attempt):
+        """Check the breaker before an attempt; returns whether the attempt is its half-open trial."""
+        allowed, trial = self.breaker.admit()
+        if not allowed:
+            metrics.incr('paystack.rejected')
+            raise PaystackUnavailable("Paystack is unavailable (circuit open)")
+        if attempt:
+            metrics.incr('paystack.retries')
+        return trial
+
+    def _after_failure(self, name, attempt, attempts, error):
+        """Record a failed attempt; re-raise on the last one, otherwise return the seconds to back off."""
+        self.breaker.record_failure()
+        if attempt + 1 == attempts:
+            raise error
+        logger.info(f"Paystack {name} attempt {attempt + 1} failed, retrying: {error}")
+        # Full jitter keeps retries from many workers from arriving in waves.
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+    def _send(self, name, method, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, f'{self.base_url}{path}', timeout=self.timeout, **kwargs)
+        except requests.RequestException as e:
+            metrics.incr('paystack.errors')
+            raise PaystackUnavailable(f"Paystack {name} failed: {e}") from e
+        finally:
+            self._record_call(name, started)
+        return self._data(name, response)
+
+    def _record_call(self, name, started):
+        metrics.incr('paystack.calls')
+        metrics.observe(f'paystack.{name}', (time.perf_counter() - started) * 1000)
+
+    def _data(self, name, response):
+        if response.status_code in self.RETRY_STATUSES:
+            metrics.incr('paystack.errors')
+            raise PaystackUnavailable(f"Paystack {name} returned HTTP {response.status_code}")
+        # Anything else is an answer from a healthy API, even if it is a refusal.
+        self.breaker.record_success()
+        try:
+            body = response.json()
+        except ValueError as e:
+            raise PaystackError(f"Paystack {name} returned invalid JSON") from e
+        if not body.get('status'):
+            raise PaystackError(body.get('message') or f"Paystack {name} failed")
+        return body.get('data')
+
+    def initialize_transaction(self, reference, amount, email, callback_url):
+        return self.request(**_initialize_call(reference, amount, email, callback_url))
+
+    def verify_transaction(self, reference):
+        return self.request(**_verify_call(reference))
+
+    def list_transactions(self, page, per_page, **filters):
+        return self.request(**_list_call(page, per_page, filters))
+
+
+class AsyncPaystackGateway(PaystackGateway):
+    """``PaystackGateway`` on an ``httpx.AsyncClient``, for async views.
+
+    Same timeouts, retries, metrics and (when passed the sync gateway's)
+    circuit breaker; the methods are coroutines. A client is bound to the
+    event loop it was first used on, see ``get_async_gateway()``.
+    """
+
+    def _connect(self, headers, pool_size):
+        connect, read = self.timeout
+        self.client = httpx.AsyncClient(
+            headers=headers,
+            timeout=httpx.Timeout(read, connect=connect),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def request(self, name, method, path, idempotent, **kwargs):
+        attempts = 1 + (self.max_retries if idempotent else 0)
+        for attempt in range(attempts):
+            trial = self._before_attempt(attempt)
+            try:
+                return await self._send(name, method, path, **kwargs)
+            except PaystackUnavailable as e:
+                await asyncio.sleep(self._after_failure(name, attempt, attempts, e))
+            except BaseException:
+                # Including cancellation, when an ASGI client disconnects mid-call.
+                if trial:
+                    self.breaker.abandon_trial()
+                raise
+
+    async def _send(self, name, method, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, f'{self.base_url}{path}', **kwargs)
+        except httpx.HTTPError as e:
+            metrics.incr('paystack.errors')
+            raise PaystackUnavailable(f"Paystack {name} failed: {e!r}") from e
+        finally:
+            self._record_call(name, started)
+        return self._data(name, response)
+
+    async def initialize_transaction(self, reference, amount, email, callback_url):
+        return await self.request(**_initialize_call(reference, amount, email, callback_url))
+
+    async def verify_transaction(self, reference):
+        return await self.request(**_verify_call(reference))
+
+    async def list_transactions(self, page, per_page, **filters):
+        return await self.request(**_list_call(page, per_page, filters))
+
+
+def _initialize_call(reference, amount, email, callback_url):
+    return {
+        'name': 'initialize_transaction',
+        'method': 'POST',
+        'path': '/transaction/initialize',
+        'idempotent': False,
+        'json': {'reference': reference, 'amount': amount, 'email': email, 'callback_url': callback_url},
+    }
+
+
+def _verify_call(reference):
+    return {
+        'name': 'verify_transaction',
+        'method': 'GET',
+        'path': f"/transaction/verify/{quote(reference, safe='')}",
+        'idempotent': True,
+    }
+
+
+def _list_call(page, per_page, filters):
+    """``filters`` are Paystack's query parameters, e.g. ``status``, ``from`` and ``to``; ``None`` values are dropped."""
+    return {
+        'name': 'list_transactions',
+        'method': 'GET',
+        'path': '/transaction',
+        'idempotent': True,
+        'params': {'page': page, 'perPage': per_page, **{k: v for k, v in filters.items() if v is not None}},
+    }
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+_async_gateways = weakref.WeakKeyDictionary()
+
+
+def _gateway_options():
+    return {
+        'timeout': (settings.PAYSTACK_CONNECT_TIMEOUT, settings.PAYSTACK_READ_TIMEOUT),
+        'max_retries': settings.PAYSTACK_MAX_RETRIES,
+        'pool_size': settings.PAYSTACK_POOL_SIZE,
+    }
+
+
+def get_gateway():
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = PaystackGateway(
+                    settings.PAYSTACK_API_URL,
+                    settings.PAYSTACK_SECRET_KEY,
+                    breaker=CircuitBreaker(
+                        failure_threshold=settings.PAYSTACK_BREAKER_THRESHOLD,
+                        reset_timeout=settings.PAYSTACK_BREAKER_RESET,
+                    ),
+                    **_gateway_options(),
+                )
+    return _gateway
+
+
+def get_async_gateway():
+    """The ``AsyncPaystackGateway`` for the running event loop.
+
+    Under ASGI that is one per worker process. It shares the sync gateway's
+    circuit breaker, so both notice an outage together.
+    """
+    loop = asyncio.get_running_loop()
+    gateway = _async_gateways.get(loop)
+    if gateway is None:
+        gateway = _async_gateways[loop] = AsyncPaystackGateway(
+            settings.PAYSTACK_API_URL,
+            settings.PAYSTACK_SECRET_KEY,
+            breaker=get_gateway().breaker,
+            **_gateway_options(),
+        )
+    return gateway
+
+
+@receiver(setting_changed)
+def _reset_gateway(setting, **kwargs):
+    global _gateway
+    if setting.startswith('PAYSTACK_'):
+        if _gateway is not None:
+            _gateway.close()
+            _gateway = None
+        _async_gateways.clear()
+
+
+def verify_transaction(reference):
+    return get_gateway().verify_transaction(reference)
+
+
+def list_transactions(page, per_page, **filters):
+    return get_gateway().list_transactions(page, per_page, **filters)
+
+
+async def averify_transaction(reference):
+    return await get_async_gateway().verify_transaction(reference)
+
+
+def order_amount(order):
+    """What Paystack is asked to charge for ``order``, in kobo."""
+    return int((order.total_price + order.tax_amount) * 100)
+
+
+def payment_mismatch(order, transaction):
+    """Why Paystack ``transaction`` does not pay for ``order`` in full, or ``None`` if it does."""
+    if transaction.get('currency') != CURRENCY:
+        return f"was in {transaction.get('currency')}, expected {CURRENCY}"
+    if int(transaction.get('amount') or 0) != order_amount(order):
+        return f"paid {transaction.get('amount')} kobo, expected {order_amount(order)}"
+    return None
+
+
+def _payment(order, email, callback_url):
+    return {
+        'reference': f'order_{order.id}_{order.user_id}',
+        'amount': order_amount(order),
+        'email': email,
+        'callback_url': callback_url,
+    }
+
+
+def initialize_order_payment(order, email, callback_url):
+    """Start a Paystack payment for ``order`` and return Paystack's ``data`` (with ``authorization_url``)."""
+    return get_gateway().initialize_transaction(**_payment(order, email, callback_url))
+
+
+async def ainitialize_order_payment(order, email, callback_url):
+    return await get_async_gateway().initialize_transaction(**_payment(order, email, callback_url))
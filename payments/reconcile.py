@@ -0,0 +1,138 @@
+"""Reconciling orders against Paystack's list of successful transactions.
+
+Webhooks get lost, and verifying orders one at a time does not scale.
+``reconcile`` pages through the successful transactions Paystack has for a
+time window, several pages in flight at once, matches each page's references
+to orders and payments with two queries, and repairs what the webhook would
+have done with bulk writes: paid orders still pending (or cancelled after
+their stock hold lapsed) move to processing and missing ``Payment`` rows are
+created. Each page is applied in one transaction together with the
+``ReconciliationCheckpoint`` that records it, so an interrupted run resumes
+at the first page it had not finished.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from orders import reservations
+from orders.models import Order
+from orders.tasks import queue_sales_refresh, send_payment_receipt
+from recommendations.tasks import count_paid_orders
+from .inbox import order_id_from_reference
+from .models import Payment, ReconciliationCheckpoint
+from .paystack import list_transactions, payment_mismatch
+
+logger = logging.getLogger(__name__)
+
+PER_PAGE = 100
+CONCURRENCY = 4
+# Transactions created shortly before the previous run ended may have succeeded since.
+OVERLAP = timedelta(hours=24)
+UNPAID = (Order.PENDING, Order.CANCELLED)
+
+
+def checkpoint_for_run(overlap=OVERLAP, since=None, restart=False):
+    """Resume the unfinished run, or start one covering everything since the last completed run."""
+    unfinished = ReconciliationCheckpoint.objects.filter(completed_at__isnull=True).order_by('-id').first()
+    if unfinished is not None:
+        if not restart:
+            return unfinished
+        unfinished.delete()
+    if since is None:
+        last = ReconciliationCheckpoint.objects.filter(completed_at__isnull=False).order_by('-window_end').first()
+        since = last.window_end - overlap if last else None
+    return ReconciliationCheckpoint.objects.create(window_start=since, window_end=timezone.now())
+
+
+def reconcile(per_page=PER_PAGE, concurrency=CONCURRENCY, overlap=OVERLAP, since=None, restart=False):
+    """Run (or resume) a reconciliation and return its completed checkpoint.
+
+    Raises ``PaystackError`` if Paystack fails; pages applied before that
+    stay applied and the next run continues after them.
+    """
+    checkpoint = checkpoint_for_run(overlap, since, restart)
+    filters = {
+        'status': 'success',
+        'from': checkpoint.window_start.isoformat() if checkpoint.window_start else None,
+        'to': checkpoint.window_end.isoformat(),
+    }
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while True:
+            pages = range(checkpoint.next_page, checkpoint.next_page + concurrency)
+            fetches = [pool.submit(list_transactions, page, per_page, **filters) for page in pages]
+            for page, fetch in zip(pages, fetches):
+                transactions = fetch.result() or []
+                apply_page(checkpoint, page, transactions)
+                if len(transactions) < per_page:
+                    checkpoint.completed_at = timezone.now()
+                    checkpoint.save(update_fields=['completed_at'])
+                    return checkpoint
+
+
+def apply_page(checkpoint, page, transactions):
+    """Bring the orders paid for by ``transactions`` up to date and move ``checkpoint`` past ``page``."""
+    paid_for, unmatched = {}, 0
+    for t in transactions:
+        try:
+            paid_for[order_id_from_reference(t['reference'])] = t
+        except ValueError:
+            unmatched += 1
+
+    with transaction.atomic():
+        orders = Order.objects.filter(id__in=paid_for).only('id', 'status', 'total_price', 'tax_amount', 'created_at')
+        has_payment = set(Payment.objects.filter(order_id__in=paid_for).values_list('order_id', flat=True))
+        unmatched += len(paid_for) - len(orders)
+        to_fix, payments = [], []
+        for order in orders:
+            t = paid_for[order.id]
+            if (mismatch := payment_mismatch(order, t)) is not None:
+                logger.warning(f"Paystack transaction {t['reference']} {mismatch}")
+                unmatched += 1
+                continue
+            if order.status in UNPAID:
+                to_fix.append(order)
+            if order.id not in has_payment:
+                payments.append(Payment(
+                    order=order,
+                    stripe_charge_id=str(t.get('id', t['reference'])),
+                    amount=Decimal(t['amount']) / 100,
+                    status='succeeded',
+                ))
+        # Locked, so an order the webhook marks paid meanwhile gets its follow-ups from one path only.
+        unpaid = set(
+            Order.objects.select_for_update()
+            .filter(id__in=[o.id for o in to_fix], status__in=UNPAID)
+            .values_list('id', flat=True)
+        )
+        to_fix = [order for order in to_fix if order.id in unpaid]
+        for order in to_fix:
+            reservations.confirm(order)
+        fixed = Order.objects.filter(id__in=unpaid).update(status=Order.PROCESSING)
+        # The same follow-ups as handle_charge_success, queued in this transaction.
+        for order in to_fix:
+            send_payment_receipt.enqueue(order.id, dedup_key=f'receipt:{order.id}')
+        for day in {timezone.localdate(order.created_at) for order in to_fix}:
+            queue_sales_refresh(day)
+        if to_fix:
+            count_paid_orders.enqueue([order.id for order in to_fix])
+        # A webhook processed meanwhile may have created some of these; ignore_conflicts skips those.
+        Payment.objects.bulk_create(payments, ignore_conflicts=True)
+        counts = {
+            'transactions_seen': len(transactions),
+            'orders_fixed': fixed,
+            'payments_created': len(payments),
+            'unmatched': unmatched,
+        }
+        ReconciliationCheckpoint.objects.filter(pk=checkpoint.pk).update(
+            next_page=page + 1, **{name: F(name) + n for name, n in counts.items()},
+        )
+    checkpoint.next_page = page + 1
+    for name, n in counts.items():
+        setattr(checkpoint, name, getattr(checkpoint, name) + n)
+    if fixed:
+        logger.info(f"Reconciliation marked {fixed} order(s) paid from page {page}")
@@ -0,0 +1,21 @@
+"""Apply a Paystack webhook as soon as it is recorded instead of on the next inbox poll."""
+from django.db.models import Q
+from django.utils import timezone
+
+from core.tasks import task
+from .inbox import VISIBILITY_TIMEOUT, process_event
+from .models import PaystackEvent
+
+
+@task(priority=20, max_attempts=1)
+def process_paystack_event(event_id):
+    # Claim the event the way claim_batch does, so a process_paystack_events worker can't apply it too.
+    now = timezone.now()
+    claimed = PaystackEvent.objects.filter(
+        Q(locked_until__isnull=True) | Q(locked_until__lte=now),
+        id=event_id,
+        status=PaystackEvent.PENDING,
+    ).update(locked_until=now + VISIBILITY_TIMEOUT)
+    if claimed:
+        # process_event records failures and backs off; the inbox worker does the retries.
+        process_event(PaystackEvent.objects.get(id=event_id))
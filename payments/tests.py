@@ -1,3 +1,363 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import hmac
+import json
+import time
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from core import metrics
+from core.models import Task
+from core.tasks import run_pending
+from core.testing import LocalPaystackServer
+from orders.models import Order, StockReservation
+from orders.services import place_order
+from products.models import Product
+from .inbox import process_pending
+from .models import Payment, PaystackEvent, ReconciliationCheckpoint
+from .paystack import (
+    AsyncPaystackGateway, CircuitBreaker, PaystackError, PaystackGateway, PaystackUnavailable, order_amount,
+)
+from .reconcile import reconcile
+
+SECRET = 'sk_test_local'
+
+
+def sign(body):
+    return hmac.new(SECRET.encode(), body, hashlib.sha512).hexdigest()
+
+
+@override_settings(PAYSTACK_SECRET_KEY=SECRET)
+class PaystackWebhookTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.paystack = LocalPaystackServer().start()
+        cls.enterClassContext(override_settings(PAYSTACK_API_URL=cls.paystack.url))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.paystack.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.paystack.requests.clear()
+        self.paystack.transactions.clear()
+        self.user = get_user_model().objects.create_user(username='buyer', email='buyer@example.com', password='pw')
+        self.order = Order.objects.create(user=self.user, total_price=Decimal('100.00'))
+        self.reference = f'order_{self.order.id}_{self.user.id}'
+
+    def deliver(self, event='charge.success', signature=None):
+        body = json.dumps({'event': event, 'data': {'reference': self.reference, 'amount': 10000}}).encode()
+        return self.client.post(
+            reverse('orders:paystack_webhook'),
+            body,
+            content_type='application/json',
+            HTTP_X_PAYSTACK_SIGNATURE=signature or sign(body),
+        )
+
+    def test_rejects_bad_signature(self):
+        response = self.deliver(signature='forged')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PaystackEvent.objects.exists())
+
+    def test_records_without_calling_paystack(self):
+        response = self.deliver()
+        self.assertEqual(response.json(), {'status': 'received'})
+        self.assertEqual(self.paystack.requests, [])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'PENDING')
+
+    def test_duplicate_deliveries_are_stored_once(self):
+        self.deliver()
+        response = self.deliver()
+        self.assertEqual(response.json(), {'status': 'duplicate'})
+        self.assertEqual(PaystackEvent.objects.count(), 1)
+
+    def test_worker_marks_order_paid_once(self):
+        self.paystack.add_transaction(self.reference, amount=order_amount(self.order))
+        self.deliver()
+        call_command('process_paystack_events', workers=1, stdout=open('/dev/null', 'w'))
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'PROCESSING')
+        payment = Payment.objects.get(order=self.order)
+        self.assertEqual(payment.amount, Decimal('105.00'))
+        self.assertEqual(PaystackEvent.objects.get().status, PaystackEvent.PROCESSED)
+        self.assertEqual(process_pending(), 0)
+
+    def test_checkout_session_refuses_orders_no_longer_pending(self):
+        self.client.force_login(self.user)
+        for status in (Order.CANCELLED, Order.PROCESSING):
+            Order.objects.filter(id=self.order.id).update(status=status)
+            response = self.client.post(reverse('paystack_checkout_session', args=[self.order.id]))
+            self.assertEqual(response.status_code, 409)
+            self.assertIn('error', response.json())
+        self.assertEqual(self.paystack.requests, [])
+
+    def test_underpaid_or_foreign_currency_transactions_do_not_pay_the_order(self):
+        for fields in ({'amount': 9000}, {'amount': 10500, 'currency': 'USD'}):
+            PaystackEvent.objects.all().delete()
+            self.paystack.add_transaction(self.reference, **fields)
+            self.deliver()
+            with self.assertLogs('payments.inbox', 'WARNING'):
+                process_pending()
+            self.assertEqual(PaystackEvent.objects.get().status, PaystackEvent.IGNORED)
+            self.order.refresh_from_db()
+            self.assertEqual(self.order.status, 'PENDING')
+        self.assertFalse(Payment.objects.exists())
+
+    def test_task_worker_applies_event_and_queues_follow_ups(self):
+        self.paystack.add_transaction(self.reference, amount=order_amount(self.order))
+        self.deliver()
+        self.deliver()
+        self.assertEqual(list(Task.objects.values_list('name', flat=True)), ['payments.tasks.process_paystack_event'])
+        run_pending()
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'PROCESSING')
+        self.assertEqual(PaystackEvent.objects.get().status, PaystackEvent.PROCESSED)
+        # The inbox worker finds nothing left to do.
+        self.assertEqual(process_pending(), 0)
+        self.assertEqual(
+            sorted(Task.objects.values_list('name', flat=True)),
+            [
+                'orders.tasks.refresh_sales_day',
+                'orders.tasks.send_payment_receipt',
+                'recommendations.tasks.count_paid_orders',
+            ],
+        )
+        run_pending()
+        self.assertEqual(mail.outbox[0].subject, f'Receipt for order {self.order.id}')
+        self.assertEqual(mail.outbox[0].to, ['buyer@example.com'])
+
+    def test_payment_confirms_stock_holds(self):
+        product = Product.objects.create(name='Lamp', description='', price=Decimal('100.00'), inventory=3)
+        self.order, _ = place_order(self.user, {product.id: 2})
+        self.reference = f'order_{self.order.id}_{self.user.id}'
+        self.paystack.add_transaction(self.reference, amount=order_amount(self.order))
+        self.deliver()
+        process_pending()
+
+        product.refresh_from_db()
+        self.assertEqual(product.inventory, 1)
+        self.assertEqual(self.order.reservations.get().status, StockReservation.CONFIRMED)
+
+    def test_failed_verification_is_retried_later(self):
+        self.deliver()
+        self.assertEqual(process_pending(), 1)
+        event = PaystackEvent.objects.get()
+        self.assertEqual(event.status, PaystackEvent.PENDING)
+        self.assertEqual(event.attempts, 1)
+        self.assertIn('not found', event.last_error)
+        # Backed off, so not claimable again straight away.
+        self.assertEqual(process_pending(), 0)
+
+    @override_settings(SERVER_TIMING=True)
+    def test_checkout_session_redirects_to_paystack(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('orders:create_checkout_session', args=[self.order.id]))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].startswith(self.paystack.url))
+        self.assertEqual(self.paystack.requests, [('POST', '/transaction/initialize')])
+        self.assertIn('paystack;dur=', response['Server-Timing'])
+
+    def test_unhandled_events_are_ignored(self):
+        self.deliver(event='transfer.success')
+        process_pending()
+        self.assertEqual(PaystackEvent.objects.get().status, PaystackEvent.IGNORED)
+
+
+@override_settings(PAYSTACK_SECRET_KEY=SECRET, PAYSTACK_MAX_RETRIES=0)
+class ReconciliationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.paystack = LocalPaystackServer().start()
+        cls.enterClassContext(override_settings(PAYSTACK_API_URL=cls.paystack.url))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.paystack.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.paystack.requests.clear()
+        self.paystack.transactions.clear()
+        self.user = get_user_model().objects.create_user(username='buyer', email='buyer@example.com', password='pw')
+        self.orders = [Order.objects.create(user=self.user, total_price=Decimal('100.00')) for _ in range(5)]
+        for order in self.orders:
+            self.paystack.add_transaction(f'order_{order.id}_{self.user.id}', amount=10500)
+        self.paystack.add_transaction('order_999999_1', amount=10500)
+        self.paystack.add_transaction('someone-elses', amount=500)
+
+    def test_fixes_orders_whose_webhook_was_lost(self):
+        paid = self.orders[0]
+        paid.status = Order.PROCESSING
+        paid.save()
+        Payment.objects.create(order=paid, stripe_charge_id='1', amount=Decimal('100.00'), status='succeeded')
+
+        checkpoint = reconcile(per_page=2, concurrency=2)
+
+        self.assertEqual(set(Order.objects.values_list('status', flat=True)), {Order.PROCESSING})
+        self.assertEqual(Payment.objects.count(), 5)
+        self.assertEqual(
+            (checkpoint.transactions_seen, checkpoint.orders_fixed, checkpoint.payments_created, checkpoint.unmatched),
+            (7, 4, 4, 2),
+        )
+        self.assertIsNotNone(checkpoint.completed_at)
+        self.assertEqual(
+            sorted(Task.objects.values_list('name', 'dedup_key')),
+            sorted(
+                [('orders.tasks.refresh_sales_day', f'sales-rollup:{paid.created_at.date()}')]
+                + [('orders.tasks.send_payment_receipt', f'receipt:{order.id}') for order in self.orders[1:]]
+                + [('recommendations.tasks.count_paid_orders', None)] * 2
+            ),
+        )
+
+    def test_resumes_after_a_failure_and_reruns_are_no_ops(self):
+        self.paystack.fail_next(after=1)
+        with self.assertRaises(PaystackError):
+            reconcile(per_page=2, concurrency=1)
+        checkpoint = ReconciliationCheckpoint.objects.get()
+        self.assertEqual((checkpoint.next_page, checkpoint.transactions_seen), (2, 2))
+
+        self.paystack.requests.clear()
+        resumed = reconcile(per_page=2, concurrency=1)
+        self.assertEqual(resumed.pk, checkpoint.pk)
+        self.assertEqual(self.paystack.requests, [('GET', '/transaction')] * 3)
+        self.assertEqual(Order.objects.filter(status=Order.PROCESSING).count(), 5)
+
+        again = reconcile(per_page=2, concurrency=1)
+        self.assertNotEqual(again.pk, checkpoint.pk)
+        self.assertEqual((again.transactions_seen, again.orders_fixed, again.payments_created), (7, 0, 0))
+
+    def test_amount_mismatch_is_not_fixed(self):
+        order = self.orders[0]
+        self.paystack.add_transaction(f'order_{order.id}_{self.user.id}', amount=100)
+        with self.assertLogs('payments.reconcile', 'WARNING'):
+            checkpoint = reconcile(per_page=10)
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.PENDING)
+        self.assertEqual(checkpoint.unmatched, 3)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class PaystackGatewayTests(SimpleTestCase):
+    def setUp(self):
+        self.paystack = LocalPaystackServer().start()
+        self.addCleanup(self.paystack.stop)
+        self.clock = FakeClock()
+        self.gateway = PaystackGateway(
+            self.paystack.url, SECRET, timeout=(1, 0.5), max_retries=2, backoff=0,
+            breaker=CircuitBreaker(failure_threshold=3, reset_timeout=10, clock=self.clock),
+        )
+        self.addCleanup(self.gateway.close)
+        self.paystack.add_transaction('ref_1', amount=5000)
+        metrics.reset()
+
+    def test_reuses_one_keep_alive_connection(self):
+        for _ in range(5):
+            self.assertEqual(self.gateway.verify_transaction('ref_1')['amount'], 5000)
+        self.assertEqual(len(self.paystack.connections), 1)
+        self.assertEqual(metrics.histograms('paystack.')['paystack.verify_transaction']['count'], 5)
+
+    def test_retries_idempotent_calls(self):
+        self.paystack.fail_next(2)
+        self.assertEqual(self.gateway.verify_transaction('ref_1')['reference'], 'ref_1')
+        self.assertEqual(len(self.paystack.requests), 3)
+        self.assertEqual(metrics.counters('paystack.')['paystack.retries'], 2)
+
+    def test_does_not_retry_initialize(self):
+        self.paystack.fail_next(1)
+        with self.assertRaises(PaystackUnavailable):
+            self.gateway.initialize_transaction('ref_2', 100, 'a@example.com', 'http://localhost/')
+        self.assertEqual(len(self.paystack.requests), 1)
+
+    def test_business_errors_are_not_retried(self):
+        with self.assertRaises(PaystackError) as raised:
+            self.gateway.verify_transaction('missing')
+        self.assertNotIsInstance(raised.exception, PaystackUnavailable)
+        self.assertEqual(len(self.paystack.requests), 1)
+
+    def test_read_timeout(self):
+        self.paystack.latency = 0.7
+        with self.assertRaises(PaystackUnavailable):
+            self.gateway.initialize_transaction('ref_3', 100, 'a@example.com', 'http://localhost/')
+
+    def test_circuit_breaker_fails_fast_then_recovers(self):
+        self.paystack.fail_next(3)
+        with self.assertRaises(PaystackUnavailable):
+            self.gateway.verify_transaction('ref_1')
+        self.assertEqual(self.gateway.breaker.state, CircuitBreaker.OPEN)
+
+        with self.assertRaises(PaystackUnavailable):
+            self.gateway.verify_transaction('ref_1')
+        self.assertEqual(len(self.paystack.requests), 3)
+
+        self.clock.now += 10
+        self.assertEqual(self.gateway.verify_transaction('ref_1')['reference'], 'ref_1')
+        self.assertEqual(self.gateway.breaker.state, CircuitBreaker.CLOSED)
+
+
+class AsyncPaystackGatewayTests(SimpleTestCase):
+    def setUp(self):
+        self.paystack = LocalPaystackServer().start()
+        self.addCleanup(self.paystack.stop)
+        self.paystack.add_transaction('ref_1', amount=5000)
+        self.breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10)
+
+    async def call_all(self, count, **options):
+        gateway = AsyncPaystackGateway(self.paystack.url, SECRET, timeout=(1, 2), backoff=0, breaker=self.breaker, **options)
+        try:
+            return await asyncio.gather(*(gateway.verify_transaction('ref_1') for _ in range(count)))
+        finally:
+            await gateway.close()
+
+    async def test_concurrent_calls_overlap(self):
+        self.paystack.latency = 0.3
+        started = time.perf_counter()
+        results = await self.call_all(10, pool_size=10)
+        self.assertLess(time.perf_counter() - started, 1.5)
+        self.assertEqual([r['reference'] for r in results], ['ref_1'] * 10)
+        self.assertLessEqual(len(self.paystack.connections), 10)
+
+    async def test_retries_idempotent_calls(self):
+        self.paystack.fail_next(2)
+        await self.call_all(1, max_retries=2)
+        self.assertEqual(len(self.paystack.requests), 3)
+
+    async def test_cancelled_trial_does_not_leave_the_circuit_stuck(self):
+        clock = FakeClock()
+        self.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+        self.breaker.record_failure()
+        clock.now += 10
+        self.paystack.latency = 0.5
+        gateway = AsyncPaystackGateway(self.paystack.url, SECRET, timeout=(1, 2), backoff=0, breaker=self.breaker)
+        try:
+            trial = asyncio.ensure_future(gateway.verify_transaction('ref_1'))
+            await asyncio.sleep(0.1)
+            trial.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await trial
+        finally:
+            await gateway.close()
+        self.assertFalse(self.breaker.trial_in_flight)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+        clock.now += 10
+        self.paystack.latency = 0
+        self.assertEqual((await self.call_all(1))[0]['reference'], 'ref_1')
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
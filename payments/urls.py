@@ -3,4 +3,5 @@ from . import views
 
 urlpatterns = [
     path('webhook/', views.paystack_webhook, name='paystack_webhook'),
-]
\ No newline at end of file
+    path('checkout-session/<int:order_id>/', views.create_checkout_session, name='paystack_checkout_session'),
+]
@@ -1,5 +1,71 @@
+from django import forms
 from django.contrib import admin
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.template.response import TemplateResponse
+
+from core.pagination import EstimatedCountPaginator
+from . import bulk
 from .models import Product, ProductCategory
 
-admin.site.register(Product)
-admin.site.register(ProductCategory)
\ No newline at end of file
+
+class RestockForm(forms.Form):
+    units = forms.IntegerField(min_value=1, help_text="Added to each product's inventory.")
+
+
+class PriceChangeForm(forms.Form):
+    percent = forms.DecimalField(
+        min_value=-99, max_value=1000, decimal_places=2,
+        help_text="Percentage to change each price by; negative for a discount.",
+    )
+
+
+@admin.register(ProductCategory)
+class ProductCategoryAdmin(admin.ModelAdmin):
+    list_display = ('name',)
+    search_fields = ('name',)
+
+
+@admin.register(Product)
+class ProductAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'category', 'price', 'inventory', 'updated_at')
+    list_select_related = ('category',)
+    list_filter = ('category',)
+    search_fields = ('name',)
+    autocomplete_fields = ('category',)
+    ordering = ('-id',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ('restock', 'change_price')
+
+    @admin.action(description="Restock selected products")
+    def restock(self, request, queryset):
+        form = RestockForm(request.POST if 'apply' in request.POST else None)
+        if not form.is_valid():
+            return self.bulk_form(request, queryset, form, 'restock', "Restock products")
+        units = form.cleaned_data['units']
+        updated = bulk.restock(queryset, units)
+        self.message_user(request, f"Added {units} unit(s) to the inventory of {updated} product(s).")
+
+    @admin.action(description="Change price of selected products")
+    def change_price(self, request, queryset):
+        form = PriceChangeForm(request.POST if 'apply' in request.POST else None)
+        if not form.is_valid():
+            return self.bulk_form(request, queryset, form, 'change_price', "Change prices")
+        percent = form.cleaned_data['percent']
+        updated = bulk.reprice(queryset, percent)
+        self.message_user(request, f"Changed the price of {updated} product(s) by {percent:+}%.")
+
+    def bulk_form(self, request, queryset, form, action, title):
+        """Ask for the action's parameters, posting the selection back to the changelist."""
+        select_across = request.POST.get('select_across') == '1'
+        return TemplateResponse(request, 'admin/products/product/bulk_update.html', {
+            **self.admin_site.each_context(request),
+            'title': title,
+            'opts': self.model._meta,
+            'form': form,
+            'action': action,
+            'count': queryset.count(),
+            'select_across': select_across,
+            'selected': [] if select_across else request.POST.getlist(ACTION_CHECKBOX_NAME),
+            'action_checkbox_name': ACTION_CHECKBOX_NAME,
+        })
@@ -0,0 +1,37 @@
+"""Changes to many products at once, each a single UPDATE.
+
+``QuerySet.update`` bypasses ``save()`` and so the ``post_save`` receivers
+that drop cached pages and reprice carts. These functions send
+``products_changed`` with the ids and fields they touched instead, and the
+same apps listen for it.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Now, Round
+from django.dispatch import Signal
+
+# Sent with sender=Product, product_ids and fields (the names of the fields updated).
+products_changed = Signal()
+
+
+def _update(queryset, fields, **values):
+    with transaction.atomic():
+        product_ids = list(queryset.values_list('pk', flat=True))
+        if not product_ids:
+            return 0
+        updated = queryset.model.objects.filter(pk__in=product_ids).update(updated_at=Now(), **values)
+        products_changed.send(sender=queryset.model, product_ids=product_ids, fields=fields)
+    return updated
+
+
+def restock(queryset, units):
+    """Add ``units`` to the inventory of every product in ``queryset``; returns the number updated."""
+    return _update(queryset, {'inventory'}, inventory=F('inventory') + units)
+
+
+def reprice(queryset, percent):
+    """Change the price of every product in ``queryset`` by ``percent`` (negative for a discount), to the kobo."""
+    factor = 1 + Decimal(percent) / 100
+    return _update(queryset, {'price'}, price=Round(F('price') * factor, 2))
@@ -0,0 +1,55 @@
+"""Product cards rendered once per product version.
+
+A card shows only the product's own fields, and every change to those
+(``save``, ``products.bulk``, the image backfill) moves ``updated_at``, so
+``release:pk:updated_at`` names one rendering of it for good: cards never
+need invalidating, and a catalog or search page whose entry expired
+rebuilds only the cards of products that changed. A page's cards are
+fetched with one ``get_many`` and the missing ones stored with one
+``set_many``. Hits and misses are counted in ``core.metrics`` under
+``product_cards.*``.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from core import metrics
+
+TEMPLATE = 'products/card.html'
+
+
+def card_key(product):
+    return f'product-card:{settings.RELEASE}:{product.pk}:{product.updated_at.timestamp():.6f}'
+
+
+def _render(products, keys, found):
+    missing = {}
+    cards = []
+    for key, product in zip(keys, products):
+        card = found.get(key)
+        if card is None:
+            card = missing[key] = render_to_string(TEMPLATE, {'product': product})
+        cards.append(card)
+    metrics.incr('product_cards.hits', len(products) - len(missing))
+    metrics.incr('product_cards.misses', len(missing))
+    return mark_safe(''.join(cards)), missing
+
+
+def render_cards(products):
+    """The cards of ``products``, in order, as one safe string."""
+    products = list(products)
+    keys = [card_key(product) for product in products]
+    html, missing = _render(products, keys, cache.get_many(keys))
+    if missing:
+        cache.set_many(missing, settings.PRODUCT_CARD_CACHE_TIMEOUT)
+    return html
+
+
+async def arender_cards(products):
+    products = list(products)
+    keys = [card_key(product) for product in products]
+    html, missing = _render(products, keys, await cache.aget_many(keys))
+    if missing:
+        await cache.aset_many(missing, settings.PRODUCT_CARD_CACHE_TIMEOUT)
+    return html
@@ -0,0 +1,101 @@
+"""Resized copies of product images.
+
+Each uploaded image gets WebP and JPEG derivatives at a few fixed widths,
+stored under ``PRODUCT_IMAGE_CACHE_DIR/<digest>/<width>.<format>`` where
+``digest`` is a hash of the original file's bytes. A new upload therefore
+gets new URLs, and a derivative never changes once written, so it can be
+cached forever. They are created when the image is uploaded and, failing
+that, on first request (see ``views.product_image``).
+"""
+import hashlib
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+WIDTHS = (320, 640, 960)
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+CONTENT_TYPES = {'webp': 'image/webp', 'jpg': 'image/jpeg'}
+
+
+def _digest(chunks):
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.hexdigest()[:32]
+
+
+def file_digest(field_file):
+    """Hex digest identifying the content of an image field's file (uploaded or already stored)."""
+    if not field_file._committed:
+        # A fresh upload, still to be written to storage: read it and rewind.
+        upload = field_file.file
+        upload.seek(0)
+        digest = _digest(upload.chunks())
+        upload.seek(0)
+        return digest
+    with field_file.open('rb') as f:
+        return _digest(f.chunks())
+
+
+def path_digest(path):
+    with open(path, 'rb') as f:
+        return _digest(iter(lambda: f.read(64 * 1024), b''))
+
+
+def derivative_path(digest, width, fmt):
+    return Path(settings.PRODUCT_IMAGE_CACHE_DIR) / digest / f'{width}.{fmt}'
+
+
+def _save(image, path, fmt):
+    """Write atomically, so a concurrent request never serves a half-written file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pil_format, options = FORMATS[fmt]
+            image.save(f, pil_format, **options)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def generate(source, digest, widths=WIDTHS, formats=tuple(FORMATS)):
+    """Create any missing derivatives of the image file at ``source``; returns the number written."""
+    missing = [(w, f) for w in widths for f in formats if not derivative_path(digest, w, f).exists()]
+    if not missing:
+        return 0
+    with Image.open(source) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ('RGB', 'RGBA'):
+            original = original.convert('RGBA' if 'transparency' in original.info else 'RGB')
+        for width in sorted({w for w, _ in missing}, reverse=True):
+            resized = original
+            if original.width > width:
+                height = round(original.height * width / original.width)
+                resized = original.resize((width, height), Image.Resampling.LANCZOS)
+            for w, fmt in missing:
+                if w != width:
+                    continue
+                image = resized.convert('RGB') if fmt == 'jpg' and resized.mode != 'RGB' else resized
+                _save(image, derivative_path(digest, width, fmt), fmt)
+    return len(missing)
+
+
+def generate_for_product(product):
+    if not product.image or not product.image_digest:
+        return 0
+    try:
+        return generate(product.image.path, product.image_digest)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not create derivatives for product {product.pk}: {e}")
+        return 0
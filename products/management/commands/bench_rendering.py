@@ -0,0 +1,79 @@
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.template import engines
+from django.utils import timezone
+
+from products.cards import card_key, render_cards
+from products.models import Product, summarize
+
+# Out of the way of real products' cards.
+FIRST_PK = 10 ** 9
+DESCRIPTION = (
+    'Hand-finished in small batches from responsibly sourced materials, built to last for years of daily use '
+    'and backed by our no-questions-asked returns policy, with free delivery on orders over fifty thousand naira.'
+)
+# The catalog's card loop before cards were cached, truncating each description as it renders.
+INLINE_LOOP = """{% load product_images %}{% for product in products %}
+<div class="bg-white p-4 rounded-lg shadow-md" role="article">
+    {% product_picture product sizes="(min-width: 768px) 33vw, (min-width: 640px) 50vw, 100vw" css_class="w-full h-48 object-cover rounded mb-4" %}
+    <h2 class="text-xl font-semibold mb-2">{{ product.name }}</h2>
+    <p class="text-gray-600 mb-2">{{ product.description|truncatewords:20 }}</p>
+    <p class="text-lg font-semibold mb-2">₦{{ product.price }}</p>
+    <a href="{% url 'products:product_detail' product.id %}" class="text-blue-600 hover:underline" aria-label="View details for {{ product.name }}">View</a>
+</div>
+{% endfor %}"""
+
+
+class Command(BaseCommand):
+    help = "Time rendering a page of product cards, inline and from the card cache, at several page sizes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cards', type=int, nargs='+', default=[24, 100, 1000], help="Cards per page.")
+        parser.add_argument('--repeat', type=int, default=20, help="Timed renders per page size and mode.")
+
+    def handle(self, *args, **options):
+        engine = engines['django']
+        compiled = engine.from_string(INLINE_LOOP)
+        modes = {
+            # What every render cost without a template cache: parse, then render.
+            'inline, parsed': lambda products: engine.from_string(INLINE_LOOP).render({'products': products}),
+            'inline, compiled': lambda products: compiled.render({'products': products}),
+            'cards, cold cache': lambda products: self.cold(products),
+            'cards, warm cache': render_cards,
+        }
+        self.stdout.write(f"{'cards':>6}  {'mode':<18}  {'ms/page':>9}  {'ms/card':>8}")
+        for count in options['cards']:
+            products = self.products(count)
+            for mode, render in modes.items():
+                render(products)
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    render(products)
+                    timings.append(time.perf_counter() - started)
+                ms = statistics.median(timings) * 1000
+                self.stdout.write(f"{count:>6}  {mode:<18}  {ms:>9.2f}  {ms / count:>8.3f}")
+            cache.delete_many([card_key(product) for product in products])
+
+    def products(self, count):
+        now = timezone.now()
+        return [
+            Product(
+                pk=FIRST_PK + n,
+                name=f'Benchmark product {n}',
+                description=DESCRIPTION,
+                summary=summarize(DESCRIPTION),
+                price=Decimal('1999.00') + n,
+                image_digest=f'{n:016x}',
+                updated_at=now,
+            )
+            for n in range(count)
+        ]
+
+    def cold(self, products):
+        cache.delete_many([card_key(product) for product in products])
+        return render_cards(products)
@@ -0,0 +1,70 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.cache import invalidate_tags
+from products import images
+from products.models import Product
+
+CHUNK_SIZE = 500
+
+
+def process(job):
+    """Runs in a worker process: hash the original if needed and write its derivatives."""
+    pk, path, digest = job
+    try:
+        digest = digest or images.path_digest(path)
+        return pk, digest, images.generate(path, digest), None
+    except (OSError, ValueError) as e:
+        return pk, None, 0, str(e)
+
+
+class Command(BaseCommand):
+    help = "Create resized WebP/JPEG copies of existing product images in a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Worker processes (default: one per CPU).")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        totals = {'products': 0, 'written': 0, 'failed': 0}
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as pool:
+            for jobs in self.jobs():
+                known = {pk: digest for pk, _, digest in jobs}
+                updated = []
+                for pk, digest, written, error in pool.map(process, jobs, chunksize=8):
+                    totals['products'] += 1
+                    totals['written'] += written
+                    if error:
+                        totals['failed'] += 1
+                        self.stderr.write(f"product {pk}: {error}")
+                    elif digest != known[pk] or written:
+                        updated.append(Product(pk=pk, image_digest=digest, updated_at=timezone.now()))
+                if updated:
+                    # bulk_update skips the save signals, which would hash every file again,
+                    # so the cached pages and cards that embed image URLs are invalidated here.
+                    # Products already complete are left alone, keeping their cached cards.
+                    Product.objects.bulk_update(updated, ['image_digest', 'updated_at'])
+                    invalidate_tags('catalog', *(f'product:{p.pk}' for p in updated))
+                self.stdout.write(f"{totals['products']} products, {totals['written']} files written")
+        self.stdout.write(self.style.SUCCESS(
+            f"Done in {time.perf_counter() - started:.1f}s: {totals['written']} files written, "
+            f"{totals['failed']} products failed"
+        ))
+
+    def jobs(self):
+        """Chunks of ``(pk, image path, digest)`` for products with an image, in primary key order."""
+        last_pk = 0
+        while True:
+            rows = list(
+                Product.objects.exclude(image='').filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', 'image', 'image_digest')[:CHUNK_SIZE]
+            )
+            if not rows:
+                return
+            last_pk = rows[-1][0]
+            yield [(pk, Product._meta.get_field('image').storage.path(name), digest) for pk, name, digest in rows]
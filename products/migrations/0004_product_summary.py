@@ -0,0 +1,34 @@
+from django.db import migrations, models
+from django.utils.text import Truncator
+
+BATCH_SIZE = 1000
+
+
+def fill_summaries(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    last_id = 0
+    while True:
+        batch = list(Product.objects.filter(id__gt=last_id).order_by('id').only('id', 'description')[:BATCH_SIZE])
+        if not batch:
+            break
+        for product in batch:
+            # products.models.summarize, frozen as of this migration.
+            product.summary = Truncator(product.description).words(20, truncate=' …')
+        Product.objects.bulk_update(batch, ['summary'])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='summary',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(fill_summaries, migrations.RunPython.noop),
+    ]
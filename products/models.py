@@ -1,8 +1,19 @@
 from django.db import models
+from django.utils.text import Truncator
+
+# Words of the description shown on product cards.
+SUMMARY_WORDS = 20
+
+
+def summarize(description):
+    """The start of ``description`` that product cards show, as ``truncatewords`` would cut it."""
+    return Truncator(description).words(SUMMARY_WORDS, truncate=' …')
+
 
 class ProductCategory(models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -10,10 +21,16 @@ class ProductCategory(models.Model):
 class Product(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField()
+    # summarize(description), kept up to date by a pre_save signal so listings don't truncate on every render.
+    summary = models.TextField(blank=True, editable=False)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     category = models.ForeignKey(ProductCategory, on_delete=models.SET_NULL, null=True)
     inventory = models.PositiveIntegerField(default=0)
     image = models.ImageField(upload_to='products/', blank=True)
+    # Hash of the image's content, naming its resized copies (see products.images).
+    image_digest = models.CharField(max_length=32, blank=True, editable=False)
+    # Set by save(); bulk updates (products.bulk) set it themselves.
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
\ No newline at end of file
@@ -0,0 +1,84 @@
+from django.utils.functional import cached_property
+
+
+class KeysetPage:
+    """A page of ``queryset`` ordered newest first and addressed by primary key cursors.
+
+    ``after`` selects the rows following a given id and ``before`` the rows
+    preceding it. Each page is an indexed range scan on the primary key with a
+    ``LIMIT``, so page 1,000 costs the same as page 1. Rows are only fetched
+    when the page is first iterated, which lets a cached template fragment
+    skip the query entirely.
+    """
+
+    def __init__(self, queryset, per_page, after=None, before=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.after = after
+        self.before = None if after is not None else before
+
+    @cached_property
+    def _rows(self):
+        return self._paginate(list(self._query()))
+
+    async def aload(self):
+        """Fetch the page with the async ORM, for use before rendering from an async view."""
+        if '_rows' not in self.__dict__:
+            self.__dict__['_rows'] = self._paginate([row async for row in self._query()])
+        return self
+
+    def _query(self):
+        limit = self.per_page + 1
+        if self.before is not None:
+            return self.queryset.filter(pk__gt=self.before).order_by('pk')[:limit]
+        queryset = self.queryset
+        if self.after is not None:
+            queryset = queryset.filter(pk__lt=self.after)
+        return queryset.order_by('-pk')[:limit]
+
+    def _paginate(self, rows):
+        if self.before is not None:
+            has_previous, has_next = len(rows) > self.per_page, True
+            rows = rows[:self.per_page][::-1]
+        else:
+            has_previous, has_next = self.after is not None, len(rows) > self.per_page
+            rows = rows[:self.per_page]
+        return rows, has_previous and bool(rows), has_next and bool(rows)
+
+    @property
+    def object_list(self):
+        return self._rows[0]
+
+    @property
+    def has_previous(self):
+        return self._rows[1]
+
+    @property
+    def has_next(self):
+        return self._rows[2]
+
+    @property
+    def previous_cursor(self):
+        return self.object_list[0].pk if self.has_previous else None
+
+    @property
+    def next_cursor(self):
+        return self.object_list[-1].pk if self.has_next else None
+
+    @property
+    def cache_key(self):
+        """A short string identifying this page's position, for use in cache keys."""
+        if self.after is not None:
+            return f'a{self.after}'
+        if self.before is not None:
+            return f'b{self.before}'
+        return 'first'
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
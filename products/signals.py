@@ -0,0 +1,40 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from core.cache import invalidate_tags
+from .bulk import products_changed
+from .images import file_digest, generate_for_product
+from .models import Product, ProductCategory, summarize
+
+@receiver(pre_save, sender=Product)
+def update_image_digest(sender, instance, **kwargs):
+    if not instance.image:
+        instance.image_digest = ''
+    elif not instance.image._committed or not instance.image_digest:
+        try:
+            instance.image_digest = file_digest(instance.image)
+        except OSError:
+            instance.image_digest = ''
+
+@receiver(pre_save, sender=Product)
+def update_summary(sender, instance, **kwargs):
+    instance.summary = summarize(instance.description)
+
+@receiver(post_save, sender=Product)
+def create_image_derivatives(sender, instance, **kwargs):
+    if instance.image_digest:
+        transaction.on_commit(lambda: generate_for_product(instance))
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product(sender, instance, **kwargs):
+    invalidate_tags('catalog', f'product:{instance.pk}')
+
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_delete, sender=ProductCategory)
+def invalidate_category(sender, instance, **kwargs):
+    invalidate_tags('catalog', 'categories', f'category:{instance.pk}')
+
+@receiver(products_changed)
+def invalidate_changed_products(sender, product_ids, **kwargs):
+    invalidate_tags('catalog', *(f'product:{product_id}' for product_id in product_ids))
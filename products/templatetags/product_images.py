@@ -0,0 +1,31 @@
+from django import template
+from django.urls import reverse
+
+from products.images import WIDTHS
+
+register = template.Library()
+
+
+def _url(product, width, fmt):
+    return reverse('products:product_image', args=[product.pk, product.image_digest, width, fmt])
+
+
+@register.simple_tag
+def product_srcset(product, fmt='webp'):
+    """``srcset`` value listing every resized copy of ``product``'s image in ``fmt``."""
+    if not getattr(product, 'image_digest', ''):
+        return ''
+    return ', '.join(f'{_url(product, width, fmt)} {width}w' for width in WIDTHS)
+
+
+@register.inclusion_tag('products/picture.html')
+def product_picture(product, sizes='100vw', css_class='', width=640):
+    """A ``<picture>`` offering WebP with a JPEG fallback, or the placeholder when there is no image."""
+    context = {'product': product, 'sizes': sizes, 'css_class': css_class}
+    if getattr(product, 'image_digest', ''):
+        context.update({
+            'webp_srcset': product_srcset(product, 'webp'),
+            'jpeg_srcset': product_srcset(product, 'jpg'),
+            'src': _url(product, width, 'jpg'),
+        })
+    return context
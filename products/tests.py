@@ -1,3 +1,248 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from decimal import Decimal
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from core.cache import tag_version
+from core.pagination import EstimatedCountPaginator
+from core.testing import BudgetAssertionsMixin
+from . import bulk, images
+from .cards import card_key, render_cards
+from .models import Product, ProductCategory
+from .pagination import KeysetPage
+
+
+class KeysetPageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = [
+            Product.objects.create(name=f'Product {n}', description='', price=Decimal('1.00'))
+            for n in range(7)
+        ]
+
+    def ids(self, page):
+        return [p.id for p in page]
+
+    def test_walks_forward_and_back(self):
+        newest_first = [p.id for p in reversed(self.products)]
+        first = KeysetPage(Product.objects.all(), 3)
+        self.assertEqual(self.ids(first), newest_first[:3])
+        self.assertFalse(first.has_previous)
+        self.assertTrue(first.has_next)
+
+        second = KeysetPage(Product.objects.all(), 3, after=first.next_cursor)
+        self.assertEqual(self.ids(second), newest_first[3:6])
+        last = KeysetPage(Product.objects.all(), 3, after=second.next_cursor)
+        self.assertEqual(self.ids(last), newest_first[6:])
+        self.assertFalse(last.has_next)
+
+        back = KeysetPage(Product.objects.all(), 3, before=last.previous_cursor)
+        self.assertEqual(self.ids(back), newest_first[3:6])
+        self.assertTrue(back.has_previous)
+
+    def test_is_lazy(self):
+        with self.assertNumQueries(0):
+            page = KeysetPage(Product.objects.all(), 3)
+            page.cache_key
+        with self.assertNumQueries(1):
+            list(page)
+            page.has_next
+
+
+class ProductListViewTests(BudgetAssertionsMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = ProductCategory.objects.create(name='Books')
+        cls.games = ProductCategory.objects.create(name='Games')
+        cls.book = Product.objects.create(name='A Book', description='', price=Decimal('5.00'), category=cls.books)
+        cls.game = Product.objects.create(name='A Game', description='', price=Decimal('9.00'), category=cls.games)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_filters_by_category(self):
+        response = self.client.get(reverse('home'), {'category': self.books.id})
+        self.assertContains(response, 'A Book')
+        self.assertNotContains(response, 'A Game')
+        self.assertWithinBudget(response)
+
+    def test_cached_page_is_invalidated_on_save(self):
+        self.client.get(reverse('home'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('home'))
+        self.assertContains(response, 'A Game')
+
+        self.game.name = 'Renamed Game'
+        self.game.save()
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Renamed Game')
+
+    def test_unchanged_catalog_is_not_modified(self):
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response['Cache-Control'], 'public, max-age=0, s-maxage=60')
+        with self.assertNumQueries(0):
+            again = self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+        again = self.client.get(reverse('home'), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(again.status_code, 304)
+
+        self.book.price = Decimal('6.00')
+        self.book.save()
+        changed = self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+
+    def test_product_page_validators_are_per_user(self):
+        url = reverse('products:product_detail', args=[self.book.id])
+        anonymous = self.client.get(url)
+        user = get_user_model().objects.create_user(username='reader', password='pw')
+        self.client.force_login(user)
+        response = self.client.get(url)
+        self.assertNotEqual(response['ETag'], anonymous['ETag'])
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        bulk.restock(Product.objects.filter(id=self.book.id), 3)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+
+class ProductCardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(name='Lamp', description='word ' * 30, price=Decimal('5.00'))
+
+    def test_summary_follows_description(self):
+        self.assertEqual(self.product.summary, 'word ' * 19 + 'word …')
+        self.product.description = 'Short.'
+        self.product.save()
+        self.assertEqual(self.product.summary, 'Short.')
+
+    def test_card_is_reused_until_the_product_changes(self):
+        html = render_cards([self.product])
+        self.assertIn('Lamp', html)
+        cache.set(card_key(self.product), 'cached card')
+        self.assertEqual(render_cards(Product.objects.all()), 'cached card')
+
+        bulk.reprice(Product.objects.filter(id=self.product.id), 40)
+        html = render_cards(Product.objects.all())
+        self.assertIn('₦7.00', html)
+        self.assertIsNotNone(cache.get(card_key(Product.objects.get())))
+
+
+class ProductAdminTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_superuser(username='admin', email='admin@example.com', password='pw')
+        books = ProductCategory.objects.create(name='Books')
+        cls.products = [
+            Product.objects.create(name=f'Book {n}', description='', price=Decimal('10.00'), inventory=1, category=books)
+            for n in range(3)
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        self.url = reverse('admin:products_product_changelist')
+
+    def test_restock_asks_for_units_then_updates_in_one_query(self):
+        selection = {'action': 'restock', '_selected_action': [p.id for p in self.products[:2]]}
+        response = self.client.post(self.url, selection)
+        self.assertContains(response, '2 products will be updated')
+        with self.assertNumQueries(4):  # savepoint, the ids, one UPDATE, release
+            bulk.restock(Product.objects.filter(id__in=selection['_selected_action']), 5)
+        self.client.post(self.url, {**selection, 'apply': 'Apply', 'units': 5})
+        self.assertEqual([p.inventory for p in Product.objects.order_by('id')], [11, 11, 1])
+
+    def test_price_change_applies_to_everything_selected_across_pages(self):
+        cache.clear()
+        self.client.get(reverse('products:product_detail', args=[self.products[0].id]))
+        self.client.post(self.url, {
+            'action': 'change_price', 'select_across': '1', '_selected_action': [self.products[0].id],
+            'apply': 'Apply', 'percent': '-12.5',
+        })
+        self.assertEqual(set(Product.objects.values_list('price', flat=True)), {Decimal('8.75')})
+        response = self.client.get(reverse('products:product_detail', args=[self.products[0].id]))
+        self.assertContains(response, '8.75')
+
+    def test_changelist_uses_estimated_count_paginator(self):
+        response = self.client.get(self.url, {'q': 'Book'})
+        self.assertIsInstance(response.context['cl'].paginator, EstimatedCountPaginator)
+        self.assertEqual(response.context['cl'].result_count, 3)
+
+
+class ProductImageTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        self.enterContext(override_settings(MEDIA_ROOT=media, PRODUCT_IMAGE_CACHE_DIR=f'{media}/derivatives'))
+        cache.clear()
+
+    def upload(self, size=(1600, 1200), color='red'):
+        buffer = BytesIO()
+        Image.new('RGB', size, color).save(buffer, 'PNG')
+        with self.captureOnCommitCallbacks(execute=True):
+            return Product.objects.create(
+                name='Poster', description='', price=Decimal('5.00'),
+                image=SimpleUploadedFile('poster.png', buffer.getvalue(), content_type='image/png'),
+            )
+
+    def test_upload_creates_resized_copies(self):
+        product = self.upload()
+        self.assertEqual(len(product.image_digest), 32)
+        for width in images.WIDTHS:
+            with Image.open(images.derivative_path(product.image_digest, width, 'webp')) as image:
+                self.assertEqual(image.size, (width, width * 3 // 4))
+            self.assertTrue(images.derivative_path(product.image_digest, width, 'jpg').exists())
+
+    def test_same_content_shares_a_digest(self):
+        self.assertEqual(self.upload().image_digest, self.upload().image_digest)
+        self.assertNotEqual(self.upload().image_digest, self.upload(color='blue').image_digest)
+
+    def test_missing_copy_is_created_on_request(self):
+        product = self.upload()
+        shutil.rmtree(images.derivative_path(product.image_digest, 320, 'webp').parent)
+        url = reverse('products:product_image', args=[product.pk, product.image_digest, 320, 'webp'])
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertTrue(images.derivative_path(product.image_digest, 320, 'webp').exists())
+        # Served from disk from now on.
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+    def test_unknown_digest_or_width_is_404(self):
+        product = self.upload()
+        self.assertEqual(self.client.get(reverse('products:product_image', args=[product.pk, 'f' * 32, 320, 'webp'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('products:product_image', args=[product.pk, product.image_digest, 321, 'webp'])).status_code, 404)
+
+    def test_picture_tag(self):
+        product = self.upload()
+        html = Template('{% load product_images %}{% product_picture product sizes="50vw" %}').render(Context({'product': product}))
+        self.assertIn('type="image/webp"', html)
+        self.assertIn(f'/{product.image_digest}/960.webp 960w', html)
+        self.assertIn('sizes="50vw"', html)
+
+    def test_backfill_command(self):
+        product = self.upload()
+        shutil.rmtree(images.derivative_path(product.image_digest, 320, 'webp').parent)
+        Product.objects.filter(pk=product.pk).update(image_digest='')
+        out = StringIO()
+        call_command('generate_product_images', workers=2, stdout=out)
+        product.refresh_from_db()
+        self.assertEqual(len(product.image_digest), 32)
+        self.assertIn(f'{len(images.WIDTHS) * len(images.FORMATS)} files written', out.getvalue())
+
+        # A rerun with nothing to write leaves the product and the catalog caches alone.
+        product.refresh_from_db()
+        catalog = tag_version('catalog')
+        call_command('generate_product_images', workers=2, stdout=StringIO())
+        self.assertEqual(Product.objects.get(pk=product.pk).updated_at, product.updated_at)
+        self.assertEqual(tag_version('catalog'), catalog)
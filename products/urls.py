@@ -1,9 +1,10 @@
 from django.urls import path
-from .views import ProductListView, ProductDetailView
+from .views import ProductListView, ProductDetailView, product_image
 
 app_name = 'products'
 
 urlpatterns = [
     path('', ProductListView.as_view(), name='product_list'),
     path('<int:pk>/', ProductDetailView.as_view(), name='product_detail'),
+    path('<int:pk>/images/<slug:digest>/<int:width>.<slug:fmt>', product_image, name='product_image'),
 ]
\ No newline at end of file
@@ -1,12 +1,116 @@
-from django.views.generic import ListView, DetailView
-from .models import Product
+from django.conf import settings
+from django.http import Http404
+from django.shortcuts import aget_object_or_404, get_object_or_404, render
+from django.template.loader import render_to_string
+from django.views import View
+from django.views.decorators.http import require_safe
+from core import files
+from core.cache import aget_or_compute, atag_versions
+from core.http import not_modified, set_validators, validators
+from core.instrumentation import budget
+from orders.reservations import with_available
+from recommendations import index as recommendations
+from . import images
+from .cards import arender_cards
+from .models import Product, ProductCategory
+from .pagination import KeysetPage
 
-class ProductListView(ListView):
-    model = Product
+
+def _cursor(value):
+    return int(value) if value and value.isdigit() else None
+
+
+@budget(queries=4)
+class ProductListView(View):
+    """The catalog. Pages are rendered once per catalog version and served from the cache.
+
+    The catalog version also validates the page, so clients and proxies with
+    a current copy get a 304 without anything being rendered.
+    """
     template_name = 'products/list.html'
-    context_object_name = 'products'
+    page_size = 24
+
+    async def get(self, request):
+        # Resolve the user without blocking, so base.html can use it.
+        request.user = await request.auser()
+        category_id = _cursor(request.GET.get('category'))
+        etag, last_modified = validators(request, await atag_versions(['catalog']))
+        if (response := not_modified(request, etag, last_modified)) is not None:
+            return response
+        # Cards show the precomputed summary, so the full descriptions needn't be fetched.
+        queryset = Product.objects.defer('description')
+        if category_id is not None:
+            queryset = queryset.filter(category_id=category_id)
+        page = KeysetPage(
+            queryset,
+            self.page_size,
+            after=_cursor(request.GET.get('after')),
+            before=_cursor(request.GET.get('before')),
+        )
+
+        async def render_catalog():
+            await page.aload()
+            return render_to_string('products/catalog.html', {
+                'page': page,
+                'products': page,
+                'cards': await arender_cards(page),
+                'categories': [category async for category in ProductCategory.objects.order_by('name')],
+                'category_id': category_id,
+            })
 
-class ProductDetailView(DetailView):
-    model = Product
+        catalog = await aget_or_compute(
+            f'product_list:{category_id}:{page.cache_key}',
+            render_catalog,
+            timeout=settings.CATALOG_CACHE_TIMEOUT,
+            tags=['catalog'],
+        )
+        response = render(request, self.template_name, {'catalog': catalog, 'category_id': category_id})
+        return set_validators(request, response, etag, last_modified, shared=True)
+
+
+@budget(queries=4)
+class ProductDetailView(View):
+    """A product and what is frequently bought with it, both cached until they change."""
     template_name = 'products/detail.html'
-    context_object_name = 'object'
\ No newline at end of file
+
+    async def get(self, request, pk):
+        request.user = await request.auser()
+        tags = [f'product:{pk}', 'categories', recommendations.tag(pk)]
+        etag, last_modified = validators(request, await atag_versions(tags))
+        if (response := not_modified(request, etag, last_modified)) is not None:
+            return response
+        product = await aget_or_compute(
+            f'product:{pk}',
+            lambda: aget_object_or_404(with_available(Product.objects.select_related('category')), pk=pk),
+            timeout=settings.CATALOG_CACHE_TIMEOUT,
+            tags=tags,
+        )
+        response = render(request, self.template_name, {
+            'object': product,
+            'recommendations': await arender_cards(await recommendations.arecommended(pk)),
+        })
+        # Private: the add-to-cart form carries this client's CSRF token.
+        return set_validators(request, response, etag, last_modified)
+
+
+@require_safe
+def product_image(request, pk, digest, width, fmt):
+    """Serve a resized product image, creating it on first request.
+
+    URLs embed the content digest, so responses never change and may be cached
+    for good. Existing files are served without touching the database.
+    """
+    if width not in images.WIDTHS or fmt not in images.FORMATS:
+        raise Http404
+    path = images.derivative_path(digest, width, fmt)
+    if not path.exists():
+        product = get_object_or_404(Product, pk=pk, image_digest=digest)
+        images.generate_for_product(product)
+        if not path.exists():
+            raise Http404
+    return files.serve(
+        request, path,
+        content_type=images.CONTENT_TYPES[fmt],
+        cache_control='public, max-age=31536000, immutable',
+        etag=f'"{digest}-{width}-{fmt}"',
+    )
@@ -0,0 +1,172 @@
+"""Frequently bought together: a co-purchase matrix and each product's top neighbours.
+
+``CoPurchase`` counts, for every pair of products, the paid orders that
+contained both; only pairs that occurred are stored. ``count_orders`` adds
+orders as they are paid, each exactly once (``CountedOrder`` remembers
+them), and recomputes the ``TOP_K`` strongest neighbours of the products
+involved into ``Recommendation``, so the product page reads its
+recommendations with one indexed join (``arecommended``, cached until they
+change) instead of aggregating order lines. ``rebuild`` recounts the whole
+matrix from ``OrderItem`` in chunks of orders, which also drops orders that
+were cancelled or deleted after payment.
+"""
+import heapq
+import itertools
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from core.cache import aget_or_compute, invalidate_tags
+from core.routers import read_alias
+from orders.models import Order, OrderItem
+from orders.reports import PAID
+from products.models import Product
+from .models import CoPurchase, CountedOrder, Recommendation
+
+TOP_K = 6
+# Orders read per query.
+CHUNK_SIZE = 5000
+BATCH_SIZE = 1000
+
+
+def tag(product_id):
+    """The cache tag of ``product_id``'s recommendations."""
+    return f'recommendations:{product_id}'
+
+
+def _baskets(order_ids, using=None):
+    """``{order_id: {product_id, ...}}`` for ``order_ids``."""
+    baskets = defaultdict(set)
+    items = OrderItem.objects.using(using).filter(order_id__in=order_ids).values_list('order_id', 'product_id')
+    for order_id, product_id in items:
+        baskets[order_id].add(product_id)
+    return baskets
+
+
+def _add(product_ids):
+    CoPurchase.objects.bulk_create(
+        [CoPurchase(product_id=a, other_id=b) for a, b in itertools.permutations(sorted(product_ids), 2)],
+        ignore_conflicts=True,
+    )
+    # Every pair within the basket, in both directions, with one UPDATE.
+    CoPurchase.objects.filter(product_id__in=product_ids, other_id__in=product_ids).update(orders=F('orders') + 1)
+
+
+def count_orders(order_ids):
+    """Add the paid orders among ``order_ids`` that aren't counted yet; returns how many were added."""
+    order_ids = list(order_ids)
+    added, touched = 0, set()
+    for start in range(0, len(order_ids), CHUNK_SIZE):
+        chunk = order_ids[start:start + CHUNK_SIZE]
+        paid = Order.objects.filter(id__in=chunk, status__in=PAID).exclude(
+            id__in=CountedOrder.objects.filter(order_id__in=chunk).values('order_id')
+        )
+        baskets = _baskets(paid.values('id'))
+        for order_id, products in baskets.items():
+            try:
+                with transaction.atomic():
+                    # Taken first: a concurrent worker counting the same order waits here, then skips it.
+                    CountedOrder.objects.create(order_id=order_id)
+                    if len(products) > 1:
+                        _add(products)
+            except IntegrityError:
+                continue
+            added += 1
+            if len(products) > 1:
+                touched.update(products)
+    refresh_top(touched)
+    return added
+
+
+def refresh_top(product_ids, k=TOP_K):
+    """Recompute the ``Recommendation`` rows of ``product_ids`` from the matrix."""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+    rows = []
+    for product_id in product_ids:
+        top = (
+            CoPurchase.objects.filter(product_id=product_id)
+            .order_by('-orders', 'other_id')
+            .values_list('other_id', 'orders')[:k]
+        )
+        rows.extend(
+            Recommendation(product_id=product_id, rank=rank, recommended_id=other_id, orders=orders)
+            for rank, (other_id, orders) in enumerate(top)
+        )
+    with transaction.atomic():
+        Recommendation.objects.filter(product_id__in=product_ids).delete()
+        Recommendation.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+        transaction.on_commit(lambda: invalidate_tags(*map(tag, product_ids)))
+
+
+def _top(pairs, k):
+    neighbours = defaultdict(list)
+    for (a, b), orders in pairs.items():
+        neighbours[a].append((-orders, b))
+        neighbours[b].append((-orders, a))
+    for product_id, candidates in neighbours.items():
+        for rank, (orders, other_id) in enumerate(heapq.nsmallest(k, candidates)):
+            yield Recommendation(product_id=product_id, rank=rank, recommended_id=other_id, orders=-orders)
+
+
+def rebuild(chunk_size=CHUNK_SIZE, k=TOP_K, stdout=None):
+    """Recount the matrix from every paid order and recompute all recommendations; returns the orders counted.
+
+    Orders are read in primary key order (from a replica when there is one)
+    and their pairs tallied in memory, one entry per distinct pair, then the
+    tables are replaced in one transaction. Orders paid while this ran are
+    counted afterwards, on the primary.
+    """
+    using = read_alias()
+    paid = Order.objects.using(using).filter(status__in=PAID)
+    pairs, counted = Counter(), []
+    last_id = 0
+    while True:
+        ids = list(paid.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            break
+        for products in _baskets(ids, using=using).values():
+            pairs.update(itertools.combinations(sorted(products), 2))
+        counted.extend(ids)
+        last_id = ids[-1]
+        if stdout:
+            stdout.write(f"Counted {len(counted)} orders")
+
+    with transaction.atomic():
+        # Products or orders deleted since they were read would violate the foreign keys.
+        products = set(Product.objects.values_list('id', flat=True))
+        pairs = {(a, b): n for (a, b), n in pairs.items() if a in products and b in products}
+        stale = set(Recommendation.objects.values_list('product_id', flat=True).distinct())
+        CountedOrder.objects.all().delete()
+        CoPurchase.objects.all().delete()
+        Recommendation.objects.all().delete()
+        for start in range(0, len(counted), chunk_size):
+            existing = Order.objects.filter(id__in=counted[start:start + chunk_size]).values_list('id', flat=True)
+            CountedOrder.objects.bulk_create([CountedOrder(order_id=i) for i in existing], batch_size=BATCH_SIZE)
+        CoPurchase.objects.bulk_create(
+            (
+                CoPurchase(product_id=product_id, other_id=other_id, orders=n)
+                for (a, b), n in pairs.items()
+                for product_id, other_id in ((a, b), (b, a))
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        rows = Recommendation.objects.bulk_create(_top(pairs, k), batch_size=BATCH_SIZE)
+        changed = stale | {row.product_id for row in rows}
+        transaction.on_commit(lambda: invalidate_tags(*map(tag, changed)))
+
+    missed = Order.objects.filter(status__in=PAID).exclude(id__in=CountedOrder.objects.values('order_id'))
+    return len(counted) + count_orders(missed.values_list('id', flat=True))
+
+
+async def arecommended(product_id):
+    """The products recommended with ``product_id``, strongest first."""
+    async def load():
+        queryset = Product.objects.filter(recommended_for__product_id=product_id).order_by('recommended_for__rank')
+        return [product async for product in queryset.defer('description')]
+    return await aget_or_compute(
+        f'recommendations:{product_id}', load, timeout=settings.CATALOG_CACHE_TIMEOUT, tags=[tag(product_id)],
+    )
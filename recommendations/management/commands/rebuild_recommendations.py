@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recommendations.index import CHUNK_SIZE, TOP_K, rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount the co-purchase matrix from every paid order and recompute each product's frequently bought "
+        "together list. Paid orders are added as they come in; run this periodically to drop orders cancelled "
+        "since, and on first deploy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Orders read per query.")
+        parser.add_argument('--top', type=int, default=TOP_K, help="Recommendations kept per product.")
+        parser.add_argument('--loop', action='store_true', help="Keep rebuilding instead of exiting.")
+        parser.add_argument('--interval', type=float, default=86400.0, help="Seconds between rebuilds (with --loop).")
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            counted = rebuild(chunk_size=options['chunk_size'], k=options['top'], stdout=self.stdout)
+            self.stdout.write(self.style.SUCCESS(
+                f"Counted {counted} paid orders in {time.perf_counter() - started:.1f}s"
+            ))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,48 @@
+from django.db import models
+from orders.models import Order
+from products.models import Product
+
+class CoPurchase(models.Model):
+    """How many paid orders contained both ``product`` and ``other``: one cell of the sparse co-purchase matrix.
+
+    Pairs are stored in both directions, so a product's row is one index range.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', db_index=False)
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', db_index=False)
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'other'], name='unique_co_purchase'),
+        ]
+        indexes = [
+            # A product's strongest pairs, read in order without a sort.
+            models.Index(fields=['product', '-orders'], name='co_purchase_top_idx'),
+            # Deleting a product removes the pairs naming it on the other side.
+            models.Index(fields=['other'], name='co_purchase_other_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} with {self.other_id} in {self.orders} order(s)"
+
+class Recommendation(models.Model):
+    """One of the top neighbours of ``product``, precomputed from ``CoPurchase`` for the product page."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', db_index=False)
+    rank = models.PositiveSmallIntegerField()
+    recommended = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommended_for')
+    orders = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='unique_recommendation_rank'),
+        ]
+
+    def __str__(self):
+        return f"{self.recommended_id} for {self.product_id} (#{self.rank})"
+
+class CountedOrder(models.Model):
+    """An order already added to ``CoPurchase``, so counting it again is a no-op."""
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, primary_key=True, related_name='+')
+
+    def __str__(self):
+        return f"Order {self.order_id} counted"
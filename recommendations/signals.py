@@ -0,0 +1,30 @@
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+from core.cache import invalidate_tags
+from products.bulk import products_changed
+from products.models import Product
+from .index import tag
+from .models import Recommendation
+
+# What the cards of recommended products show; inventory changes, say, leave them as they are.
+CARD_FIELDS = {'name', 'summary', 'price', 'image', 'image_digest'}
+
+def _invalidate_recommending(product_ids):
+    # Cached recommendations hold copies of the products they list.
+    recommending = Recommendation.objects.filter(recommended_id__in=product_ids).values_list('product_id', flat=True)
+    invalidate_tags(*map(tag, set(recommending)))
+
+@receiver(post_save, sender=Product)
+def invalidate_recommendations(sender, instance, created, **kwargs):
+    if not created:
+        _invalidate_recommending([instance.pk])
+
+@receiver(pre_delete, sender=Product)
+def invalidate_recommendations_of_deleted(sender, instance, **kwargs):
+    # Before the cascade removes the rows that say where it was recommended.
+    _invalidate_recommending([instance.pk])
+
+@receiver(products_changed)
+def invalidate_changed_recommendations(sender, product_ids, fields, **kwargs):
+    if CARD_FIELDS & set(fields):
+        _invalidate_recommending(product_ids)
@@ -0,0 +1,8 @@
+"""Keeping recommendations current as orders are paid, run by the ``run_tasks`` worker."""
+from core.tasks import task
+from .index import count_orders
+
+
+@task(priority=-10)
+def count_paid_orders(order_ids):
+    count_orders(order_ids)
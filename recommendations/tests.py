@@ -0,0 +1,85 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from core.testing import BudgetAssertionsMixin
+from orders.models import Order, OrderItem
+from products import bulk
+from products.models import Product
+from .index import count_orders, rebuild
+from .models import CoPurchase, CountedOrder, Recommendation
+
+
+class RecommendationTests(BudgetAssertionsMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='buyer', password='pw')
+        cls.camera, cls.lens, cls.bag, cls.tripod = (
+            Product.objects.create(name=name, description='', price=Decimal('10.00'))
+            for name in ('Camera', 'Lens', 'Bag', 'Tripod')
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def order(self, *products, status=Order.PROCESSING):
+        order = Order.objects.create(user=self.user, total_price=Decimal('10.00'), status=status)
+        OrderItem.objects.bulk_create(
+            [OrderItem(order=order, product=product, quantity=1, price=product.price) for product in products]
+        )
+        return order
+
+    def recommended(self, product):
+        return list(
+            Recommendation.objects.filter(product=product).order_by('rank').values_list('recommended__name', 'orders')
+        )
+
+    def test_counts_each_paid_order_once(self):
+        first = self.order(self.camera, self.lens, self.bag)
+        second = self.order(self.camera, self.lens)
+        pending = self.order(self.camera, self.tripod, status=Order.PENDING)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(count_orders([first.id, second.id, pending.id]), 2)
+        self.assertEqual(count_orders([first.id, second.id]), 0)
+
+        self.assertEqual(self.recommended(self.camera), [('Lens', 2), ('Bag', 1)])
+        self.assertEqual(self.recommended(self.bag), [('Camera', 1), ('Lens', 1)])
+        self.assertEqual(self.recommended(self.tripod), [])
+        self.assertEqual(CoPurchase.objects.count(), 6)
+
+    def test_rebuild_matches_incremental_counts_and_drops_cancelled_orders(self):
+        self.order(self.camera, self.lens)
+        cancelled = self.order(self.camera, self.bag)
+        count_orders(Order.objects.values_list('id', flat=True))
+        Order.objects.filter(id=cancelled.id).update(status=Order.CANCELLED)
+        self.order(self.camera, self.tripod)
+
+        self.assertEqual(rebuild(chunk_size=1), 2)
+        self.assertEqual(self.recommended(self.camera), [('Lens', 1), ('Tripod', 1)])
+        self.assertEqual(CountedOrder.objects.count(), 2)
+        self.assertFalse(CoPurchase.objects.filter(product=self.bag).exists())
+
+    def test_product_page_lists_recommendations_from_the_cache(self):
+        self.order(self.camera, self.lens)
+        count_orders(Order.objects.values_list('id', flat=True))
+        url = reverse('products:product_detail', args=[self.camera.id])
+        response = self.client.get(url)
+        self.assertContains(response, 'Frequently bought together')
+        self.assertContains(response, 'Lens')
+        self.assertWithinBudget(response)
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(url), 'Lens')
+
+    def test_recommended_product_changes_refresh_the_page(self):
+        self.order(self.camera, self.lens)
+        with self.captureOnCommitCallbacks(execute=True):
+            count_orders(Order.objects.values_list('id', flat=True))
+        url = reverse('products:product_detail', args=[self.camera.id])
+        response = self.client.get(url)
+        bulk.reprice(Product.objects.filter(id=self.lens.id), 50)
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertContains(changed, '₦15.00')
@@ -0,0 +1,145 @@
+"""Building and maintaining the product search index.
+
+Products are split into terms (lower-cased, accent-folded words). Each
+``Posting`` records how often a term occurs in a product, weighted by the
+field it came from, and ``Term.document_frequency`` counts the products a
+term occurs in. ``reindex_products`` keeps both current as products change;
+``rebuild`` re-indexes every product in chunks.
+"""
+import re
+import unicodedata
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from products.models import Product
+from .models import Document, Posting, Term
+
+FIELD_WEIGHTS = (('name', 3), ('category', 2), ('description', 1))
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 64
+STOP_WORDS = frozenset(
+    'a an and are as at be by for from has in is it its of on or that the this to was were will with'.split()
+)
+CHUNK_SIZE = 1000
+
+_word = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    """Split ``text`` into index terms."""
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode().lower()
+    return [
+        word for word in _word.findall(text)
+        if MIN_TERM_LENGTH <= len(word) <= MAX_TERM_LENGTH and word not in STOP_WORDS
+    ]
+
+
+def analyze(product):
+    """Return ``Counter({term: weighted frequency})`` for ``product``."""
+    fields = {
+        'name': product.name,
+        'category': product.category.name if product.category_id else '',
+        'description': product.description,
+    }
+    counts = Counter()
+    for field, weight in FIELD_WEIGHTS:
+        for term in tokenize(fields[field]):
+            counts[term] += weight
+    return counts
+
+
+def _term_ids(texts):
+    """Return ``{text: id}``, creating missing terms."""
+    texts = set(texts)
+    if not texts:
+        return {}
+    Term.objects.bulk_create([Term(text=text) for text in texts], ignore_conflicts=True)
+    return dict(Term.objects.filter(text__in=texts).values_list('text', 'id'))
+
+
+def _write(products):
+    """Insert documents and postings for ``products`` (which must have none). Returns the term ids used."""
+    analyzed = [(product, analyze(product)) for product in products]
+    ids = _term_ids(term for _, counts in analyzed for term in counts)
+    documents, postings = [], []
+    for product, counts in analyzed:
+        length = sum(counts.values())
+        documents.append(Document(product_id=product.pk, category_id=product.category_id, length=length))
+        postings.extend(
+            Posting(
+                term_id=ids[term], product_id=product.pk, category_id=product.category_id,
+                frequency=frequency, length=length,
+            )
+            for term, frequency in counts.items()
+        )
+    Document.objects.bulk_create(documents)
+    Posting.objects.bulk_create(postings, batch_size=CHUNK_SIZE)
+    return Counter(posting.term_id for posting in postings)
+
+
+def _adjust_frequencies(deltas):
+    by_delta = {}
+    for term_id, delta in deltas.items():
+        if delta:
+            by_delta.setdefault(delta, []).append(term_id)
+    for delta, term_ids in by_delta.items():
+        Term.objects.filter(id__in=term_ids).update(document_frequency=F('document_frequency') + delta)
+
+
+def _remove(product_ids):
+    deltas = Counter()
+    for term_id in Posting.objects.filter(product_id__in=product_ids).values_list('term_id', flat=True):
+        deltas[term_id] -= 1
+    Posting.objects.filter(product_id__in=product_ids).delete()
+    Document.objects.filter(product_id__in=product_ids).delete()
+    return deltas
+
+
+def remove_products(product_ids):
+    """Drop ``product_ids`` from the index."""
+    with transaction.atomic():
+        _adjust_frequencies(_remove(list(product_ids)))
+
+
+def reindex_products(product_ids):
+    """Bring the index up to date for ``product_ids``; ids that no longer exist are dropped."""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+    with transaction.atomic():
+        deltas = _remove(product_ids)
+        deltas.update(_write(Product.objects.filter(id__in=product_ids).select_related('category')))
+        _adjust_frequencies(deltas)
+
+
+def rebuild(chunk_size=CHUNK_SIZE, stdout=None):
+    """Re-index every product in place, walking them in primary key order.
+
+    Each chunk's entries are replaced in one transaction, so searches keep
+    finding (and ranking) every product while a rebuild runs. Document
+    frequencies are then recounted from the postings and unused terms
+    dropped, which also repairs any drift in the incremental counts.
+    """
+    last_id, indexed = 0, 0
+    while True:
+        chunk = list(
+            Product.objects.filter(id__gt=last_id).select_related('category').order_by('id')[:chunk_size]
+        )
+        if not chunk:
+            break
+        with transaction.atomic():
+            deltas = _remove([product.id for product in chunk])
+            deltas.update(_write(chunk))
+            _adjust_frequencies(deltas)
+        last_id = chunk[-1].id
+        indexed += len(chunk)
+        if stdout:
+            stdout.write(f"Indexed {indexed} products")
+    postings = Posting.objects.filter(term=OuterRef('pk')).values('term').annotate(n=Count('*')).values('n')
+    with transaction.atomic():
+        Term.objects.update(document_frequency=Coalesce(Subquery(postings), Value(0)))
+        Term.objects.filter(document_frequency=0).delete()
+    return indexed
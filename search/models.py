@@ -0,0 +1,39 @@
+from django.db import models
+from products.models import Product, ProductCategory
+
+class Term(models.Model):
+    """A word in the index. ``text`` is unique, so prefix lookups are index range scans."""
+    text = models.CharField(max_length=64, unique=True)
+    document_frequency = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return self.text
+
+class Document(models.Model):
+    """Per-product index metadata: its length in (weighted) terms and category, for ranking and facets."""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+    category = models.ForeignKey(ProductCategory, on_delete=models.SET_NULL, null=True, blank=True)
+    length = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f"Index entry for product {self.product_id}"
+
+class Posting(models.Model):
+    """One term occurring in one product. ``frequency`` is weighted by field (name counts more than description).
+
+    ``length`` and ``category`` are copied from the document so a query can
+    score and facet from the postings alone, without joining.
+    """
+    term = models.ForeignKey(Term, on_delete=models.CASCADE, related_name='postings')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    category = models.ForeignKey(ProductCategory, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', db_index=False)
+    frequency = models.PositiveIntegerField()
+    length = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'product'], name='unique_term_product'),
+        ]
+
+    def __str__(self):
+        return f"{self.term_id} in {self.product_id}"
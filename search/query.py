@@ -0,0 +1,178 @@
+"""Ranking queries against the search index.
+
+Each query word is expanded to the terms it may stand for: the word itself,
+terms it is a prefix of (for search-as-you-type) and terms within a small
+edit distance (typos). Matching postings are scored with BM25 inside the
+database, so only one page of product ids ever leaves it, and every query
+word must match (through one of its expansions) for a product to be returned.
+"""
+import math
+from dataclasses import dataclass, field
+
+from django.db.models import Avg, Case, Count, FloatField, IntegerField, Sum, Value, When
+from django.db.models.functions import Cast, Length
+
+from core.cache import get_or_compute
+from products.models import Product, ProductCategory
+from .index import tokenize
+from .models import Document, Posting, Term
+
+K1 = 1.2
+B = 0.75
+EXACT_WEIGHT = 1.0
+PREFIX_WEIGHT = 0.8
+FUZZY_WEIGHT = 0.6
+MAX_QUERY_TERMS = 8
+MAX_PREFIX_EXPANSIONS = 10
+MAX_FUZZY_EXPANSIONS = 5
+FUZZY_CANDIDATES = 500
+STATS_TIMEOUT = 300
+
+
+@dataclass
+class SearchResults:
+    query: str
+    products: list = field(default_factory=list)
+    total: int = 0
+    facets: list = field(default_factory=list)
+    page: int = 1
+    per_page: int = 20
+
+    @property
+    def has_previous(self):
+        return self.page > 1
+
+    @property
+    def has_next(self):
+        return self.page * self.per_page < self.total
+
+
+def edit_distance(a, b, limit):
+    """Edit distance between ``a`` and ``b`` counting an adjacent transposition as one edit.
+
+    Returns ``limit + 1`` as soon as the distance is known to exceed ``limit``.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                cost = min(cost, before[j - 2] + 1)
+            current.append(cost)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return previous[-1]
+
+
+def _fuzzy_limit(word):
+    if len(word) < 4:
+        return 0
+    return 1 if len(word) < 8 else 2
+
+
+def expand(word):
+    """Return ``{term_id: (weight, document_frequency)}`` for the index terms ``word`` may stand for."""
+    expansions = {}
+    exact = Term.objects.filter(text=word, document_frequency__gt=0).values_list('id', 'document_frequency').first()
+    if exact:
+        expansions[exact[0]] = (EXACT_WEIGHT, exact[1])
+    prefixed = (
+        Term.objects.filter(text__startswith=word, document_frequency__gt=0)
+        .exclude(text=word)
+        .order_by('-document_frequency')
+        .values_list('id', 'document_frequency')[:MAX_PREFIX_EXPANSIONS]
+    )
+    for term_id, df in prefixed:
+        expansions.setdefault(term_id, (PREFIX_WEIGHT, df))
+    limit = _fuzzy_limit(word)
+    if limit and not exact:
+        candidates = (
+            Term.objects.annotate(text_length=Length('text'))
+            .filter(
+                text__startswith=word[:2],
+                document_frequency__gt=0,
+                text_length__range=(len(word) - limit, len(word) + limit),
+            )
+            .order_by('-document_frequency')
+            .values_list('id', 'text', 'document_frequency')[:FUZZY_CANDIDATES]
+        )
+        close = [(term_id, df) for term_id, text, df in candidates if edit_distance(word, text, limit) <= limit]
+        for term_id, df in close[:MAX_FUZZY_EXPANSIONS]:
+            expansions.setdefault(term_id, (FUZZY_WEIGHT, df))
+    return expansions
+
+
+def corpus_stats():
+    """``(document count, average document length)``, cached briefly since both drift slowly."""
+    def compute():
+        stats = Document.objects.aggregate(n=Count('pk'), avgdl=Avg('length'))
+        return stats['n'], float(stats['avgdl'] or 1)
+    return get_or_compute('search:corpus_stats', compute, timeout=STATS_TIMEOUT, tags=['catalog'])
+
+
+def search(query, category_id=None, page=1, per_page=20):
+    words = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+    results = SearchResults(query=query, page=page, per_page=per_page)
+    if not words:
+        return results
+
+    n, avgdl = corpus_stats()
+    idf, group = {}, {}
+    for position, word in enumerate(words):
+        expansions = expand(word)
+        if not expansions:
+            # Every word must match, so one unknown word means no results.
+            return results
+        for term_id, (weight, df) in expansions.items():
+            if term_id in idf:
+                continue
+            idf[term_id] = weight * math.log(1 + (n - df + 0.5) / (df + 0.5))
+            group[term_id] = position
+
+    postings = Posting.objects.filter(term_id__in=idf)
+    score = Case(
+        *(When(term_id=term_id, then=Value(value)) for term_id, value in idf.items()),
+        output_field=FloatField(),
+    )
+    frequency = Cast('frequency', FloatField())
+    norm = Value(K1 * (1 - B)) + Value(K1 * B / avgdl) * Cast('length', FloatField())
+    matched = (
+        postings.values('product_id')
+        .annotate(
+            score=Sum(score * frequency * Value(K1 + 1) / (frequency + norm), output_field=FloatField()),
+            matched=Count(
+                Case(*(When(term_id=t, then=Value(g)) for t, g in group.items()), output_field=IntegerField()),
+                distinct=True,
+            ),
+        )
+        .filter(matched=len(words))
+    )
+
+    results.facets = _facets(matched)
+    if category_id is not None:
+        matched = matched.filter(category_id=category_id)
+    results.total = matched.count()
+    offset = (page - 1) * per_page
+    ranked = list(matched.order_by('-score', 'product_id').values_list('product_id', flat=True)[offset:offset + per_page])
+    products = Product.objects.select_related('category').in_bulk(ranked)
+    results.products = [products[pk] for pk in ranked if pk in products]
+    return results
+
+
+def _facets(matched):
+    """Category counts for the full (unfiltered) result set, largest first."""
+    counts = dict(
+        Document.objects.filter(product_id__in=matched.values('product_id'), category__isnull=False)
+        .values('category_id')
+        .annotate(count=Count('pk'))
+        .values_list('category_id', 'count')
+    )
+    categories = ProductCategory.objects.in_bulk(counts)
+    return sorted(
+        ((categories[pk], count) for pk, count in counts.items() if pk in categories),
+        key=lambda facet: (-facet[1], facet[0].name),
+    )
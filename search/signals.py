@@ -0,0 +1,22 @@
+from django.db import transaction
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+from products.models import Product, ProductCategory
+from .index import reindex_products, remove_products
+
+@receiver(post_save, sender=Product)
+def reindex_product(sender, instance, **kwargs):
+    product_id = instance.pk
+    transaction.on_commit(lambda: reindex_products([product_id]))
+
+@receiver(pre_delete, sender=Product)
+def remove_product(sender, instance, **kwargs):
+    # Before the cascade removes the postings, so document frequencies can be adjusted.
+    remove_products([instance.pk])
+
+@receiver(post_save, sender=ProductCategory)
+def reindex_category(sender, instance, created, **kwargs):
+    if created:
+        return
+    product_ids = list(Product.objects.filter(category=instance).values_list('id', flat=True))
+    transaction.on_commit(lambda: reindex_products(product_ids))
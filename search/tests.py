@@ -0,0 +1,88 @@
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from products.models import Product, ProductCategory
+from .index import rebuild, tokenize
+from .models import Posting, Term
+from .query import edit_distance, search
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.audio = ProductCategory.objects.create(name='Audio')
+        cls.office = ProductCategory.objects.create(name='Office')
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.headphones = self.product('Wireless Headphones', 'Over-ear, noise cancelling.', self.audio)
+            self.speaker = self.product('Bluetooth Speaker', 'Wireless speaker with deep bass.', self.audio)
+            self.chair = self.product('Office Chair', 'Ergonomic chair with headrest.', self.office)
+
+    def product(self, name, description, category):
+        return Product.objects.create(name=name, description=description, price=Decimal('10.00'), category=category)
+
+    def names(self, query, **kwargs):
+        return [p.name for p in search(query, **kwargs).products]
+
+    def test_tokenize_folds_case_accents_and_stop_words(self):
+        self.assertEqual(tokenize('The Café & a Crème-Brûlée'), ['cafe', 'creme', 'brulee'])
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual(self.names('wireless'), ['Wireless Headphones', 'Bluetooth Speaker'])
+
+    def test_all_words_must_match(self):
+        self.assertEqual(self.names('wireless bass'), ['Bluetooth Speaker'])
+        self.assertEqual(self.names('wireless unicorn'), [])
+
+    def test_prefix_and_typo_expansion(self):
+        self.assertEqual(self.names('headph'), ['Wireless Headphones'])
+        self.assertEqual(self.names('spaeker'), ['Bluetooth Speaker'])
+        self.assertEqual(edit_distance('speaker', 'spaeker', 2), 1)
+
+    def test_category_facets_and_filter(self):
+        results = search('chair headrest')
+        self.assertEqual([(c.name, n) for c, n in results.facets], [('Office', 1)])
+        results = search('wireless', category_id=self.office.id)
+        self.assertEqual(results.products, [])
+        self.assertEqual([(c.name, n) for c, n in results.facets], [('Audio', 2)])
+
+    def test_index_follows_product_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.chair.name = 'Standing Desk'
+            self.chair.save()
+        self.assertEqual(self.names('desk'), ['Standing Desk'])
+        self.assertEqual(Term.objects.get(text='chair').document_frequency, 1)
+
+        self.speaker.delete()
+        self.assertEqual(Term.objects.get(text='wireless').document_frequency, 1)
+        self.assertEqual(self.names('bass'), [])
+
+    def test_rebuild_matches_incremental_index(self):
+        before = set(Posting.objects.values_list('term__text', 'product_id', 'frequency'))
+        frequencies = dict(Term.objects.values_list('text', 'document_frequency'))
+        call_command('rebuild_search_index', chunk_size=2, stdout=open('/dev/null', 'w'))
+        self.assertEqual(set(Posting.objects.values_list('term__text', 'product_id', 'frequency')), before)
+        self.assertEqual(dict(Term.objects.values_list('text', 'document_frequency')), frequencies)
+
+    def test_rebuild_keeps_the_index_searchable(self):
+        test = self
+        seen = []
+
+        class Progress:
+            # Written after each chunk commits.
+            def write(self, message):
+                seen.append((test.names('chair'), Term.objects.get(text='wireless').document_frequency))
+
+        rebuild(chunk_size=1, stdout=Progress())
+        self.assertEqual(seen, [(['Office Chair'], 2)] * 3)
+
+    def test_search_view(self):
+        response = self.client.get(reverse('search:search'), {'q': 'wireless'})
+        self.assertContains(response, 'Bluetooth Speaker')
+        self.assertContains(response, 'Audio (2)')
@@ -0,0 +1,22 @@
+from django.shortcuts import render
+from products.cards import render_cards
+from .query import search
+
+RESULTS_PER_PAGE = 20
+
+
+def _int(value):
+    return int(value) if value and value.isdigit() else None
+
+
+def search_view(request):
+    query = request.GET.get('q', '').strip()
+    category_id = _int(request.GET.get('category'))
+    page = max(_int(request.GET.get('page')) or 1, 1)
+    results = search(query, category_id=category_id, page=page, per_page=RESULTS_PER_PAGE)
+    return render(request, 'search/results.html', {
+        'query': query,
+        'results': results,
+        'cards': render_cards(results.products),
+        'category_id': category_id,
+    })
@@ -0,0 +1,12 @@
+/** Tailwind keeps only the classes that appear in these files; build with `npm run build:css`. */
+module.exports = {
+  content: [
+    './templates/**/*.html',
+    './*/templates/**/*.html',
+    './*/templatetags/**/*.py',
+  ],
+  theme: {
+    extend: {},
+  },
+  plugins: [],
+};